@@ -1,5 +1,8 @@
+import click
+import functools
+import typing as t
+
 from http import HTTPStatus
-from types import MappingProxyType
 
 from werkzeug.exceptions import (
     HTTPException,
@@ -17,23 +20,62 @@ from flask import redirect, request, session, url_for
 from flask_babel import lazy_gettext as _
 
 
-def create_app(config_type):
+def create_app(config_type, defer_setup: t.Optional[bool] = None):
     """
     Create and configure the Flask application instance.
+
+    :param defer_setup: Defer the web setup (extensions, views, hooks) to
+        the commands that need it, see `config_deferred_setup`. Defaults to
+        deferring it when the `flask` CLI runs one of the `CORE_COMMANDS`
+        or an application command.
     """
     app = Flask(__name__)
 
     # application configuration.
     config_application(app, config_type)
 
+    # configure the database and migrations, used by every command.
+    config_core_extensions(app)
+
+    # configure command-line interface.
+    config_cli_command(app)
+
+    if defer_setup is None:
+        from .cli import CORE_COMMANDS
+
+        # The application commands are loaded with the app, before they run.
+        command = get_cli_command()
+        defer_setup = command == "" or command in CORE_COMMANDS
+
+    if defer_setup:
+        config_deferred_setup(app)
+    else:
+        setup_application(app)
+
+    return app
+
+
+def setup_application(app: Flask):
+    """
+    Configure the web side of the application: extensions, views and hooks.
+    """
     # configure application extension.
     config_extention(app)
 
+    # configure server-side sessions.
+    config_session(app)
+
+    # configure fingerprinted static assets.
+    config_assets(app)
+
+    # configure template cache and startup warmup.
+    config_warmup(app)
+
     # configure application blueprints.
     config_blueprint(app)
 
-    # configure command-line interface.
-    config_cli_command(app)
+    # configure the JSON API and its access tokens.
+    config_api(app)
 
     # configure google oauth.
     config_google_oauth(app)
@@ -41,11 +83,44 @@ def create_app(config_type):
     # configure error handlers.
     config_errorhandler(app)
 
+    # configure request instrumentation.
+    config_instrumentation(app)
+
+    # configure the slow-query log.
+    config_slow_query_log(app)
+
+    # configure prometheus metrics.
+    config_metrics(app)
+
+    # configure response compression.
+    config_compression(app)
+
+    # configure authentication audit log.
+    config_audit_log(app)
+
+    # configure last login/activity tracking.
+    config_activity_tracking(app)
+
+    # configure the pool of guest accounts.
+    config_guest_pool(app)
+
+    # configure the sampling profiler of the requests.
+    config_profiler(app)
+
+    # configure liveness/readiness probes (outermost, before every hook).
+    config_health_checks(app)
+
     @app.before_request
     def inject_theme():
         """
         Inject the user's theme preference into the application context.
         """
+        from .assets import ASSET_ENDPOINTS
+
+        # The (publicly cached) static files must not set the session cookie.
+        if request.endpoint in ASSET_ENDPOINTS:
+            return
+
         theme_default = app.config["BOOTSTRAP_DEFAULT_THEME"]
         theme = request.cookies.get("theme", theme_default)
 
@@ -93,8 +168,6 @@ def create_app(config_type):
 
         return response
 
-    return app
-
 
 def config_application(app: Flask, config_type):
     """
@@ -106,25 +179,57 @@ def config_application(app: Flask, config_type):
     if not config_type:
         raise RuntimeError("Configuration type must be provided.")
 
-    # Immutable mapping of configuration types to their corresponding config objects.
-    config_map = MappingProxyType(
-        {
-            "development": conf.development,
-            "production": conf.production,
-            "testing": conf.testing,
-        }
-    )
-
-    # Get the configuration object based on the provided `config_type`.
-    config = config_map.get(config_type)
-
-    if not config:
-        raise RuntimeError("Invalid configuration type: '%s'" % config_type)
+    # Only the configuration of `config_type` is evaluated.
+    try:
+        config = conf.get_config(config_type)
+    except ValueError as e:
+        raise RuntimeError(str(e))
 
     # Application configuration from object.
     app.config.from_object(config)
 
 
+def get_cli_command() -> t.Optional[str]:
+    """
+    Returns the name of the `flask` command being run (`db` for `flask db
+    upgrade`), an empty string while the CLI is still resolving the command,
+    or None outside the CLI.
+    """
+    ctx = click.get_current_context(silent=True)
+
+    if ctx is None:
+        return None
+
+    while ctx.parent is not None and ctx.parent.parent is not None:
+        ctx = ctx.parent
+
+    return ctx.info_name if ctx.parent is not None else ""
+
+
+def config_deferred_setup(app: Flask):
+    """
+    Run the web setup before the application commands that need it, the
+    `CORE_COMMANDS` skip OAuth, mail, the rate limiter, the views...
+    """
+    from .cli import CORE_COMMANDS
+
+    pending = [app]
+
+    def with_setup(callback):
+        @functools.wraps(callback)
+        def decorator(*args, **kwargs):
+            if pending:
+                setup_application(pending.pop())
+
+            return callback(*args, **kwargs)
+
+        return decorator
+
+    for name, command in app.cli.commands.items():
+        if name not in CORE_COMMANDS:
+            command.callback = with_setup(command.callback)
+
+
 def config_blueprint(app: Flask):
     """
     Configure/register blueprints for the application.
@@ -134,6 +239,34 @@ def config_blueprint(app: Flask):
     app.register_blueprint(accounts)
 
 
+def config_api(app: Flask):
+    """
+    Configure the JSON API blueprint and its access tokens.
+    """
+    from .api import api
+    from .extensions import csrf
+    from .tokens import init_access_tokens
+
+    init_access_tokens(app)
+
+    # Authenticated with bearer tokens, not with the session cookie.
+    csrf.exempt(api)
+    app.register_blueprint(api)
+
+
+def config_core_extensions(app: Flask):
+    """
+    Configure the database and migration extensions.
+    """
+    from .extensions import database
+    from .extensions import migrate
+
+    database.init_app(app)
+    migrate.init_app(app, db=database)
+
+    config_database(app, database)
+
+
 def config_extention(app: Flask):
     """
     Configure application extensions.
@@ -141,8 +274,6 @@ def config_extention(app: Flask):
     from .extensions import login_manager
     from .extensions import limiter
     from .extensions import bootstrap
-    from .extensions import database
-    from .extensions import migrate
     from .extensions import csrf
     from .extensions import mail
     from .extensions import oauth
@@ -163,8 +294,6 @@ def config_extention(app: Flask):
     login_manager.init_app(app)
     limiter.init_app(app)
     bootstrap.init_app(app)
-    database.init_app(app)
-    migrate.init_app(app, db=database)
     csrf.init_app(app)
     mail.init_app(app)
     oauth.init_app(app)
@@ -172,20 +301,110 @@ def config_extention(app: Flask):
 
     config_login_manager(login_manager)
 
+    config_login_backoff(app, limiter)
+
+    config_email_delivery(app, limiter)
+
+
+def config_session(app: Flask):
+    """
+    Configure the server-side session store, if enabled, and the session
+    epochs used to revoke sessions.
+    """
+    from .session_epochs import init_session_epochs
+    from .sessions import init_session_interface
+
+    init_session_interface(app)
+    init_session_epochs(app)
+
+
+def config_assets(app: Flask):
+    """
+    Configure serving of the built (fingerprinted) static assets.
+    """
+    from .assets import init_assets
+
+    init_assets(app)
+
+
+def config_warmup(app: Flask):
+    """
+    Configure the template bytecode cache and warm the application up.
+    """
+    from .extensions import database
+    from .warmup import config_bytecode_cache, record_first_request, warmup
+
+    config_bytecode_cache(app)
+    record_first_request(app)
+
+    if app.config.get("APP_WARMUP"):
+        warmup(app, database)
+
+
+def config_database(app: Flask, db):
+    """
+    Configure the database engines for the application.
+    """
+    from .db_utils import configure_sqlite_engine
+
+    if not app.config.get("SQLITE_HIGH_CONCURRENCY"):
+        return
+
+    with app.app_context():
+        for engine in db.engines.values():
+            configure_sqlite_engine(engine, app.config)
+
+
+def config_login_backoff(app: Flask, limiter):
+    """
+    Configure the per-account backoff of the failed logins.
+    """
+    from .backoff import init_login_backoff
+
+    init_login_backoff(app, limiter)
+
+
+def config_email_delivery(app: Flask, limiter):
+    """
+    Configure the background sending and the resend cooldown of the emails.
+    """
+    from .email_utils import init_email_delivery
+
+    init_email_delivery(app, limiter)
+
 
 def config_login_manager(manager):
     """
     Configure the Flask-Login for managing user's sessions.
     """
     from .models import User
+    from .session_epochs import session_epochs, split_session_token
 
     manager.login_message = _("You are not logged in to your account.")
     manager.login_message_category = "warning"
     manager.login_view = "accounts.login"
 
     @manager.user_loader
-    def user_loader(user_id):
-        return User.get_user_by_id(user_id)
+    def user_loader(session_token):
+        user_id, epoch = split_session_token(session_token)
+        current_epoch = session_epochs.get(user_id)
+
+        # Revoked sessions are rejected without reading the database.
+        if current_epoch is not None and current_epoch != epoch:
+            return None
+
+        user = User.get_user_by_id(user_id)
+
+        if user is None:
+            return None
+
+        if current_epoch is None:
+            session_epochs.set(user_id, user.session_epoch)
+
+        if user.session_epoch != epoch:
+            return None
+
+        return user
 
 
 def config_cli_command(app):
@@ -201,8 +420,12 @@ def config_cli_command(app):
 def config_google_oauth(app: Flask):
     from authlib.integrations.flask_client import OAuthError
 
+    from .async_utils import init_async_http
     from .extensions import oauth
 
+    # Shared HTTP client of the async OAuth views.
+    init_async_http(app)
+
     # OAuth configuration for Google
     _client_id = app.config.get("GOOGLE_CLIENT_ID")
     _client_secret = app.config.get("GOOGLE_CLIENT_SECRET")
@@ -224,6 +447,108 @@ def config_google_oauth(app: Flask):
         raise OAuthError(f"Failed to connect Google OAuth client: {err}")
 
 
+def config_instrumentation(app: Flask):
+    """
+    Configure the opt-in request instrumentation.
+    """
+    from .extensions import database
+
+    if app.config.get("SQL_INSTRUMENTATION"):
+        from .instrumentation import init_sql_instrumentation
+
+        init_sql_instrumentation(app, database)
+
+
+def config_slow_query_log(app: Flask):
+    """
+    Configure the log of the slow SQL statements and their plans.
+    """
+    from .extensions import database
+
+    if app.config.get("SLOW_QUERY_LOG"):
+        from .slow_queries import init_slow_query_log
+
+        init_slow_query_log(app, database)
+
+
+def config_metrics(app: Flask):
+    """
+    Configure the Prometheus `/metrics` endpoint and metric hooks.
+    """
+    from .extensions import database, limiter
+
+    if app.config.get("METRICS_ENABLED"):
+        from .metrics import init_metrics
+
+        init_metrics(app, database, limiter)
+
+
+def config_compression(app: Flask):
+    """
+    Configure gzip/brotli compression of the rendered responses.
+    """
+    if app.config.get("COMPRESS_ENABLED"):
+        from .compression import init_compression
+
+        init_compression(app)
+
+
+def config_audit_log(app: Flask):
+    """
+    Configure the buffered audit log of the authentication events.
+    """
+    from .extensions import database
+
+    if app.config.get("AUDIT_BACKEND"):
+        from .audit import init_audit_log
+
+        init_audit_log(app, database)
+
+
+def config_activity_tracking(app: Flask):
+    """
+    Configure the coalesced tracking of the users' last login and activity.
+    """
+    from .extensions import database
+
+    if app.config.get("ACTIVITY_TRACKING"):
+        from .activity import init_activity_tracking
+
+        init_activity_tracking(app, database)
+
+
+def config_guest_pool(app: Flask):
+    """
+    Configure the pool of per-visitor guest accounts.
+    """
+    from .extensions import database
+
+    if app.config.get("GUEST_POOL_SIZE"):
+        from .guests import init_guest_pool
+
+        init_guest_pool(app, database)
+
+
+def config_profiler(app: Flask):
+    """
+    Configure the opt-in sampling profiler of the requests.
+    """
+    if app.config.get("PROFILER_DIR"):
+        from .profiler import init_profiler
+
+        init_profiler(app)
+
+
+def config_health_checks(app: Flask):
+    """
+    Configure the `/healthz` and `/readyz` probes for load balancers.
+    """
+    from .extensions import database, limiter
+    from .health import init_health_checks
+
+    init_health_checks(app, database, limiter)
+
+
 def config_errorhandler(app: Flask):
     """
     Configure error handlers for application.
@@ -253,6 +578,9 @@ def config_errorhandler(app: Flask):
 
     @app.errorhandler(TooManyRequests)
     def too_many_request(e: HTTPException):
+        from .signals import rate_limit_exceeded
+
+        rate_limit_exceeded.send(app, endpoint=request.endpoint)
         return render_template("errors/429.html"), HTTPStatus.TOO_MANY_REQUESTS
 
     @app.errorhandler(InternalServerError)
@@ -0,0 +1,222 @@
+"""
+Coalesced tracking of the users' last login, last activity and address.
+
+Logins are written right away. The activity of the authenticated requests
+is kept in a per-worker buffer instead, and written by a background thread
+every `ACTIVITY_FLUSH_INTERVAL` seconds with one bulk `UPDATE`, at most
+once per user every `ACTIVITY_WRITE_INTERVAL` seconds per worker.
+"""
+
+import os
+import time
+import atexit
+import threading
+import typing as t
+
+from datetime import datetime
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.engine import Engine
+
+from flask import Flask, current_app, g, request
+
+
+class ActivityTracker:
+    """
+    Buffers the last activity of the users and writes it in bulk.
+
+    :param engine: The engine of the accounts database.
+    :param write_interval: Minimum seconds between two writes of a user.
+    :param flush_interval: Seconds between two flushes of the buffer.
+    :param logger: Logger receiving the write errors.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        write_interval: float = 300,
+        flush_interval: float = 10,
+        logger=None,
+    ):
+        from accounts.models import User
+
+        self.engine = engine
+        self.write_interval = write_interval
+        self.flush_interval = flush_interval
+        self.logger = logger
+
+        table = User.__table__
+
+        # `updated_at` is kept, the activity is not a change of the account.
+        self.statement = (
+            update(table)
+            .where(table.c.id == bindparam("user_id"))
+            .values(
+                last_seen_at=bindparam("seen_at"),
+                last_ip=bindparam("ip"),
+                updated_at=table.c.updated_at,
+            )
+        )
+        self.login_statement = self.statement.values(last_login_at=bindparam("seen_at"))
+
+        self._pending: t.Dict[str, t.Tuple[datetime, t.Optional[str]]] = {}
+        self._written: t.Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # A forked worker starts its own thread with an empty buffer.
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pending.clear()
+                self._written.clear()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name="activity-tracker", daemon=True
+                )
+                self._thread.start()
+
+    def touch(self, user_id, ip: t.Optional[str] = None):
+        """
+        Record an activity of the user, written with the next flush unless
+        the user was written less than `write_interval` seconds ago.
+        """
+        user_id = str(user_id)
+        written_at = self._written.get(user_id)
+
+        if (
+            written_at is not None
+            and time.monotonic() - written_at < self.write_interval
+        ):
+            return
+
+        self._ensure_started()
+
+        with self._lock:
+            self._pending[user_id] = (datetime.now(), ip)
+
+    def record_login(self, session, user_id, ip: t.Optional[str] = None):
+        """
+        Write the login time, activity and address of the user right away.
+
+        :param session: The request's database session, committed here
+            (a separate connection would wait for its SQLite write lock).
+        """
+        user_id = str(user_id)
+
+        session.execute(
+            self.login_statement,
+            {"user_id": user_id, "seen_at": datetime.now(), "ip": ip},
+        )
+        session.commit()
+
+        with self._lock:
+            self._pending.pop(user_id, None)
+            self._written[user_id] = time.monotonic()
+
+    def flush(self) -> int:
+        """
+        Write the buffered activity with one bulk `UPDATE`.
+
+        :return: The number of users written.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        if not pending:
+            return 0
+
+        rows = [
+            {"user_id": user_id, "seen_at": seen_at, "ip": ip}
+            for user_id, (seen_at, ip) in pending.items()
+        ]
+
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(self.statement, rows)
+        except Exception:
+            if self.logger:
+                self.logger.exception(
+                    "Failed to write the activity of %d user(s)", len(rows)
+                )
+
+            # Keep the activity for the next flush, unless newer.
+            with self._lock:
+                for user_id, value in pending.items():
+                    self._pending.setdefault(user_id, value)
+
+            return 0
+
+        now = time.monotonic()
+
+        with self._lock:
+            for user_id in pending:
+                self._written[user_id] = now
+
+            # Forget the users whose interval is over, bounding the memory.
+            self._written = {
+                user_id: written_at
+                for user_id, written_at in self._written.items()
+                if now - written_at < self.write_interval
+            }
+
+        return len(rows)
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """
+        Stop the background thread and write the buffered activity.
+        """
+        self._stopped.set()
+        self.flush()
+
+
+def record_login(user):
+    """
+    Record the login of `user` in the current request, if tracking is enabled.
+    """
+    from accounts.extensions import database as db
+
+    tracker = current_app.extensions.get("activity_tracker")
+
+    if tracker is not None:
+        tracker.record_login(db.session, user.id, request.remote_addr)
+
+
+def init_activity_tracking(app: Flask, db) -> ActivityTracker:
+    """
+    Track the activity of the authenticated requests of the application.
+    """
+    with app.app_context():
+        engine = db.engine
+
+    tracker = ActivityTracker(
+        engine,
+        write_interval=app.config["ACTIVITY_WRITE_INTERVAL"],
+        flush_interval=app.config["ACTIVITY_FLUSH_INTERVAL"],
+        logger=app.logger,
+    )
+    app.extensions["activity_tracker"] = tracker
+
+    # Write the buffered activity when the worker exits.
+    atexit.register(tracker.close)
+
+    @app.after_request
+    def track_activity(response):
+        # Only the requests that loaded the user, no extra `user_loader` call.
+        user = g.get("_login_user")
+
+        if user is not None and user.is_authenticated:
+            tracker.touch(user.id, request.remote_addr)
+
+        return response
+
+    return tracker
@@ -0,0 +1,583 @@
+"""
+The api blueprint is the JSON counterpart of the accounts views, for the
+mobile and single-page clients: no templates, CSRF tokens, redirects or
+session cookie.
+
+Requests are authenticated with a short-lived access token
+(`Authorization: Bearer <token>`) verified without a database query, and
+a new pair of tokens is obtained with the refresh token (see
+`accounts.tokens`). The payloads are validated by the forms of the HTML
+views, and the API has its own rate limits: `API_RATELIMIT_DEFAULT` per
+token subject (or client address), `API_RATELIMIT_AUTH` per client address
+on the endpoints taking credentials.
+"""
+
+import typing as t
+
+from functools import wraps
+from http import HTTPStatus
+
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException, InternalServerError
+
+from flask import Blueprint, Response
+from flask import current_app, g, jsonify, request, session
+from flask_babel import lazy_gettext as _
+from flask_limiter.util import get_remote_address
+from flask_wtf.form import FlaskForm
+
+from accounts.activity import record_login
+from accounts.backoff import authenticate
+from accounts.email_utils import send_reset_password
+from accounts.extensions import database as db, limiter
+from accounts.models import RefreshToken, User
+from accounts.session_epochs import session_epochs
+from accounts.signals import (
+    login_attempted,
+    password_changed,
+    rate_limit_exceeded,
+    token_redeemed,
+    user_registered,
+)
+from accounts.forms import (
+    RegisterForm,
+    LoginForm,
+    ForgotPasswordForm,
+    ResetPasswordForm,
+    EditUserProfileForm,
+)
+from accounts.tokens import issue_tokens
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+# Errors of the API views answered in JSON, the others are left to the
+# error handlers of the application.
+API_ERRORS = (400, 401, 403, 404, 405, 409, 413, 415, 422, 429, 500, 503)
+
+
+def get_access_claims() -> t.Optional[t.Dict[str, t.Any]]:
+    """
+    Returns the claims of the request's access token, None if it has no
+    valid token. Verified once per request.
+    """
+    if "api_claims" not in g:
+        header = request.headers.get("Authorization", "")
+        scheme, _separator, token = header.partition(" ")
+        access_tokens = current_app.extensions["api_access_tokens"]
+
+        g.api_claims = (
+            access_tokens.verify(token.strip()) if scheme.lower() == "bearer" else None
+        )
+
+    return g.api_claims
+
+
+def get_rate_limit_key() -> str:
+    """
+    Key function of the API rate limits: the token subject, or the client
+    address of the unauthenticated requests.
+    """
+    claims = get_access_claims()
+
+    if claims is not None:
+        return "api_user:%s" % claims["sub"]
+
+    return "ip:%s" % get_remote_address()
+
+
+# The API limits replace the default limits of the application.
+limiter.limit(
+    lambda: current_app.config["API_RATELIMIT_DEFAULT"], key_func=get_rate_limit_key
+)(api)
+
+
+def auth_limit(func):
+    """
+    Decorator adding the limit of the endpoints taking credentials, per
+    client address, to the API limits.
+    """
+    return limiter.limit(
+        lambda: current_app.config["API_RATELIMIT_AUTH"],
+        key_func=lambda: "ip:%s" % get_remote_address(),
+        override_defaults=False,
+    )(func)
+
+
+def error_response(
+    status: HTTPStatus, error: str, message: str, **extra
+) -> t.Tuple[Response, int]:
+    """
+    Returns a JSON error with a machine-readable `error` code.
+    """
+    return jsonify(error=error, message=str(message), **extra), status
+
+
+def abort_json(status: HTTPStatus, error: str, message: str, **extra):
+    """
+    Abort the request with a JSON error.
+    """
+    response, status = error_response(status, error, message, **extra)
+    response.status_code = status
+
+    raise HTTPException(response=response)
+
+
+def token_required(func):
+    """
+    Decorator to restrict a view to the requests with a valid access token.
+    """
+
+    @wraps(func)
+    def decorator(*args, **kwargs):
+        if get_access_claims() is None:
+            response, status = error_response(
+                HTTPStatus.UNAUTHORIZED,
+                "invalid_token",
+                _("The access token is missing, invalid or expired."),
+            )
+            response.headers["WWW-Authenticate"] = 'Bearer error="invalid_token"'
+            return response, status
+
+        return current_app.ensure_sync(func)(*args, **kwargs)
+
+    return decorator
+
+
+def get_current_user() -> User:
+    """
+    Retrieves the user of the request's access token.
+
+    :raises HTTPException: A `401` JSON error if the user was deleted or
+        its sessions revoked.
+    """
+    claims = get_access_claims()
+    user = User.get_user_by_id(claims["sub"])
+
+    if user is None or user.session_epoch != claims["epoch"]:
+        return abort_json(
+            HTTPStatus.UNAUTHORIZED,
+            "invalid_token",
+            _("The access token is missing, invalid or expired."),
+        )
+
+    if session_epochs.get(claims["sub"]) is None:
+        session_epochs.set(claims["sub"], user.session_epoch)
+
+    return user
+
+
+def get_payload() -> t.Dict[str, t.Any]:
+    """
+    Returns the JSON object of the request body.
+    """
+    payload = request.get_json(silent=True)
+
+    if not isinstance(payload, dict):
+        abort_json(
+            HTTPStatus.BAD_REQUEST,
+            "invalid_request",
+            _("The request body must be a JSON object."),
+        )
+
+    return payload
+
+
+def validate_payload(
+    form_class: t.Type[FlaskForm],
+    fields: t.Iterable[str],
+    payload: t.Dict[str, t.Any],
+) -> t.Dict[str, t.Any]:
+    """
+    Validate the fields of a payload with the form of the HTML view.
+
+    :param form_class: The form validating the fields.
+    :param fields: The fields of the form used by the API, the others
+        (reCAPTCHA, terms of service...) are removed.
+    :return: The validated data of the fields.
+    :raises HTTPException: A `422` JSON error with the errors of the fields.
+    """
+    fields = tuple(fields)
+    formdata = MultiDict(
+        (name, str(payload[name]))
+        for name in fields
+        if payload.get(name) is not None and not isinstance(payload[name], (dict, list))
+    )
+
+    form = form_class(formdata=formdata, meta={"csrf": False})
+
+    for name in list(form._fields):
+        if name not in fields:
+            del form[name]
+
+    if not form.validate():
+        abort_json(
+            HTTPStatus.UNPROCESSABLE_ENTITY,
+            "validation_failed",
+            _("Some fields are invalid."),
+            fields={
+                name: [str(error) for error in errors]
+                for name, errors in form.errors.items()
+            },
+        )
+
+    return {name: form[name].data for name in fields}
+
+
+def serialize_user(user: User) -> t.Dict[str, t.Any]:
+    """
+    Returns the public details and profile of a user.
+    """
+    profile = user.profile
+
+    return {
+        "id": str(user.id),
+        "username": user.username,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "email": user.email,
+        "active": user.active,
+        "is_guest": user.is_guest,
+        "about": profile.bio if profile else "",
+        "avatar": profile.get_avatar if profile else None,
+    }
+
+
+@api.after_request
+def discard_session(response: Response) -> Response:
+    """
+    The API is stateless: the session written by the hooks of the HTML
+    views (theme, language) is not saved nor sent as a cookie.
+    """
+    session.clear()
+    session.modified = False
+
+    response.headers.setdefault("Cache-Control", "no-store")
+    return response
+
+
+def handle_error(e: HTTPException):
+    """
+    Answer the errors of the API views in JSON.
+    """
+    if e.response is not None:
+        return e.response
+
+    if e.code == HTTPStatus.TOO_MANY_REQUESTS:
+        rate_limit_exceeded.send(
+            current_app._get_current_object(), endpoint=request.endpoint
+        )
+
+    return error_response(
+        e.code, HTTPStatus(e.code).phrase.lower().replace(" ", "_"), e.description
+    )
+
+
+for code in API_ERRORS:
+    api.register_error_handler(code, handle_error)
+
+
+@api.post("/auth/register")
+@auth_limit
+def register() -> Response:
+    """
+    Create a new account and send its confirmation email.
+
+    :return: The new user (`201`), its account must be confirmed before
+        logging in.
+    """
+    data = validate_payload(
+        RegisterForm,
+        ("username", "first_name", "last_name", "email", "password"),
+        get_payload(),
+    )
+
+    # Attempt to create a new user and save to the database.
+    user = User.create(**data)
+
+    user_registered.send(current_app._get_current_object(), user=user)
+
+    # Sends account confirmation mail to the user.
+    user.send_confirmation()
+
+    return jsonify(user=serialize_user(user)), HTTPStatus.CREATED
+
+
+@api.post("/auth/login")
+@auth_limit
+def login() -> Response:
+    """
+    Authenticate with a username (or email) and password.
+
+    :return: An access token and a refresh token.
+    """
+    data = validate_payload(LoginForm, ("username", "password"), get_payload())
+    username = data["username"]
+
+    # Attempt to authenticate the user, unless the account is locked out
+    # after repeated failures (checked before any password hashing).
+    user, retry_after = authenticate(username=username, password=data["password"])
+
+    if retry_after:
+        login_attempted.send(
+            current_app._get_current_object(),
+            result="locked",
+            username=username,
+            user=None,
+            provider="api",
+        )
+
+        response, status = error_response(
+            HTTPStatus.TOO_MANY_REQUESTS,
+            "account_locked",
+            _(
+                "Too many failed login attempts. Please try again in %(seconds)d seconds.",
+                seconds=retry_after,
+            ),
+            retry_after=retry_after,
+        )
+        response.headers["Retry-After"] = str(retry_after)
+        return response, status
+
+    if not user:
+        login_attempted.send(
+            current_app._get_current_object(),
+            result="failure",
+            username=username,
+            user=None,
+            provider="api",
+        )
+
+        return error_response(
+            HTTPStatus.UNAUTHORIZED,
+            "invalid_credentials",
+            _("Invalid username or password. Please try again."),
+        )
+
+    if not user.is_active:
+        login_attempted.send(
+            current_app._get_current_object(),
+            result="inactive",
+            username=username,
+            user=user,
+            provider="api",
+        )
+
+        # User account is not active, send confirmation email.
+        user.send_confirmation()
+
+        return error_response(
+            HTTPStatus.FORBIDDEN,
+            "account_inactive",
+            _(
+                "Your account is not activate. We sent a confirmation link to your email"
+            ),
+        )
+
+    record_login(user)
+
+    login_attempted.send(
+        current_app._get_current_object(),
+        result="success",
+        username=username,
+        user=user,
+        provider="api",
+    )
+
+    return jsonify(issue_tokens(user))
+
+
+@api.post("/auth/refresh")
+@auth_limit
+def refresh() -> Response:
+    """
+    Exchange a refresh token for a new pair of tokens, the refresh token
+    can't be used again.
+
+    :return: A new access token and refresh token.
+    """
+    instance = RefreshToken.get_by_token(get_payload().get("refresh_token"))
+    user = User.get_user_by_id(instance.user_id) if instance else None
+
+    if user is not None and instance.revoked:
+        # A used token is presented again, it may have been stolen: the
+        # tokens issued from it are revoked too.
+        RefreshToken.revoke_all(user.id)
+    elif user is not None and user.is_active and instance.is_valid(user):
+        if instance.redeem():
+            return jsonify(issue_tokens(user))
+
+    return error_response(
+        HTTPStatus.UNAUTHORIZED,
+        "invalid_grant",
+        _("The refresh token is invalid or expired."),
+    )
+
+
+@api.post("/auth/logout")
+def logout() -> Response:
+    """
+    Revoke a refresh token, its access tokens expire on their own.
+
+    :return: An empty `204` response.
+    """
+    instance = RefreshToken.get_by_token(get_payload().get("refresh_token"))
+
+    if instance is not None and not instance.revoked:
+        instance.revoked = True
+        db.session.commit()
+
+    return Response(status=HTTPStatus.NO_CONTENT)
+
+
+@api.post("/password/forgot")
+@auth_limit
+def forgot_password() -> Response:
+    """
+    Send a password reset link to the email address of an account.
+
+    :return: An accepted `202` response, whether the address is registered
+        or not.
+    """
+    data = validate_payload(ForgotPasswordForm, ("email",), get_payload())
+
+    # Attempt to find the user by email from the database.
+    user = User.get_user_by_email(email=data["email"])
+
+    if user and not user.is_guest:
+        # Send a reset password link to the user's email.
+        send_reset_password(user)
+
+    return (
+        jsonify(
+            message=str(_("A reset password link sent to your email. Please check."))
+        ),
+        HTTPStatus.ACCEPTED,
+    )
+
+
+@api.post("/password/reset")
+@auth_limit
+def reset_password() -> Response:
+    """
+    Set a new password with the token of a password reset link, every
+    session and token of the user is revoked.
+
+    :return: An empty `204` response.
+    """
+    payload = get_payload()
+    salt = current_app.config["SALT_RESET_PASSWORD"]
+
+    # Verify the provided token and return token instance.
+    auth_token = User.verify_token(
+        token=payload.get("token"), salt=salt, raise_exception=False
+    )
+
+    if not auth_token:
+        return error_response(
+            HTTPStatus.BAD_REQUEST,
+            "invalid_token",
+            _("The password reset link is invalid or expired."),
+        )
+
+    data = validate_payload(ResetPasswordForm, ("password",), payload)
+    user = User.get_user_by_id(auth_token.user_id, raise_exception=True)
+
+    if user.check_password(data["password"]):
+        return error_response(
+            HTTPStatus.UNPROCESSABLE_ENTITY,
+            "password_reused",
+            _("Your new password cannot be the same as the previous one."),
+        )
+
+    try:
+        user.set_password(data["password"])
+
+        # Mark the token as expired after the password is reset.
+        auth_token.expire = True
+
+        # Commit changes to the database.
+        db.session.commit()
+    except Exception:
+        # Handle database error by raising an internal server error.
+        db.session.rollback()
+        current_app.logger.exception("Failed to reset the password of %s", user.id)
+        raise InternalServerError
+
+    token_redeemed.send(current_app._get_current_object(), salt=salt)
+    password_changed.send(current_app._get_current_object(), user=user, reason="reset")
+
+    # Sign out every device and the refresh tokens using the previous password.
+    user.revoke_sessions()
+
+    return Response(status=HTTPStatus.NO_CONTENT)
+
+
+@api.get("/profile")
+@token_required
+def profile() -> Response:
+    """
+    Returns the details and profile of the authenticated user.
+    """
+    return jsonify(user=serialize_user(get_current_user()))
+
+
+@api.patch("/profile")
+@token_required
+def update_profile() -> Response:
+    """
+    Update the details and profile of the authenticated user, the fields
+    left out of the payload are unchanged.
+
+    :return: The updated user.
+    """
+    user = get_current_user()
+
+    # Like the profile page, editable by the guests but not the test user.
+    if user.is_test_user:
+        return error_response(
+            HTTPStatus.FORBIDDEN,
+            "read_only",
+            _("Guest user limited to read-only access."),
+        )
+
+    payload = get_payload()
+
+    data = validate_payload(
+        EditUserProfileForm,
+        ("username", "first_name", "last_name", "about"),
+        {
+            "username": payload.get("username", user.username),
+            "first_name": payload.get("first_name", user.first_name),
+            "last_name": payload.get("last_name", user.last_name),
+            "about": payload.get("about", user.profile.bio),
+        },
+    )
+
+    # Check if the new username already exists and belongs to a different user.
+    username_exist = User.query.filter(
+        User.username == data["username"], User.id != user.id
+    ).first()
+
+    if username_exist:
+        return error_response(
+            HTTPStatus.CONFLICT,
+            "username_taken",
+            _("Username already exists. Choose another."),
+        )
+
+    try:
+        # Update the user's profile details.
+        user.username = data["username"]
+        user.first_name = data["first_name"]
+        user.last_name = data["last_name"]
+        user.profile.bio = data["about"] or ""
+
+        # Commit changes to the database.
+        db.session.commit()
+    except Exception:
+        # Handle database error by raising an internal server error.
+        db.session.rollback()
+        current_app.logger.exception("Failed to update the profile of %s", user.id)
+        raise InternalServerError
+
+    return jsonify(user=serialize_user(user))
@@ -0,0 +1,339 @@
+"""
+Self-hosted, fingerprinted and precompressed static assets.
+
+`flask build-assets` copies the application static files, the Bootstrap and
+Bootswatch files served by Bootstrap-Flask (`bootstrap.static`) and the
+Bootstrap Icons font into `ASSETS_BUILD_DIR`, with a content hash in every
+file name and `.gz`/`.br` variants next to them. The `manifest.json` maps
+the original names to the fingerprinted ones, per endpoint:
+
+    {
+        "static": {"css/style.css": "css/style.3f2a1b9c04.css", ...},
+        "bootstrap.static": {"css/bootswatch/pulse/bootstrap.min.css": ...},
+        "encodings": {"static/css/style.3f2a1b9c04.css": ["br", "gzip"], ...}
+    }
+
+At runtime `url_for("static", ...)` resolves to the fingerprinted names,
+which are served with a year-long immutable `Cache-Control` and the best
+precompressed encoding accepted by the client.
+"""
+
+import os
+import re
+import gzip
+import json
+import hashlib
+import mimetypes
+import posixpath
+import typing as t
+
+from flask import Flask, request, send_from_directory
+
+MANIFEST_NAME = "manifest.json"
+
+# Endpoints whose files are fingerprinted.
+ASSET_ENDPOINTS = ("static", "bootstrap.static")
+
+# Static files never fingerprinted (user uploads keep their stored URLs).
+EXCLUDED_STATIC_DIRS = ("assets/uploads",)
+
+# Bootstrap-Flask files used by `load_css`, `load_js` and `render_icon`.
+BOOTSTRAP_FILES = (
+    "css/bootstrap.min.css",
+    "js/bootstrap.min.js",
+    "umd/popper.min.js",
+    "icons/bootstrap-icons.svg",
+)
+
+# Bootstrap Icons font, linked from `base.html`.
+BOOTSTRAP_ICONS_VERSION = "1.11.3"
+BOOTSTRAP_ICONS_URL = (
+    "https://cdn.jsdelivr.net/npm/bootstrap-icons@%s/font/" % BOOTSTRAP_ICONS_VERSION
+)
+BOOTSTRAP_ICONS_FILES = (
+    "bootstrap-icons.min.css",
+    "fonts/bootstrap-icons.woff2",
+    "fonts/bootstrap-icons.woff",
+)
+BOOTSTRAP_ICONS_DIR = "vendor/bootstrap-icons"
+
+# File suffix of each precompressed variant.
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+# Files worth precompressing.
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".ico", ".json", ".txt", ".html")
+
+# Year-long caching for fingerprinted files.
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+_SOURCE_MAP = re.compile(rb"\n?/[*/]# sourceMappingURL=[^\n]*")
+
+
+def get_fingerprinted_name(name: str, content: bytes, length: int = 10) -> str:
+    """
+    Returns `name` with a hash of `content` before the extension.
+    """
+    root, ext = posixpath.splitext(name)
+    digest = hashlib.sha256(content).hexdigest()[:length]
+    return "%s.%s%s" % (root, digest, ext)
+
+
+def get_encoded_variants(content: bytes) -> t.Dict[str, bytes]:
+    """
+    Returns the gzip (and brotli, if installed) variants smaller than `content`.
+    """
+    variants = {"gzip": gzip.compress(content, compresslevel=9, mtime=0)}
+
+    try:
+        import brotli
+
+        variants["br"] = brotli.compress(content, quality=11)
+    except ImportError:
+        pass
+
+    return {
+        encoding: data
+        for encoding, data in variants.items()
+        if len(data) < len(content)
+    }
+
+
+class AssetBuilder:
+    """
+    Collects, fingerprints and precompresses the assets into a build directory.
+
+    :param app: The application, for its static folder and configuration.
+    :param output_dir: Directory receiving the built files and the manifest.
+    :param echo: Optional callable receiving progress messages.
+    """
+
+    def __init__(
+        self,
+        app: Flask,
+        output_dir: str,
+        echo: t.Optional[t.Callable[[str], t.Any]] = None,
+    ):
+        self.app = app
+        self.output_dir = output_dir
+        self.echo = echo or (lambda message: None)
+        self.sources: t.Dict[str, t.Dict[str, bytes]] = {
+            endpoint: {} for endpoint in ASSET_ENDPOINTS
+        }
+
+    def collect_static(self):
+        static_folder = self.app.static_folder
+
+        for root, dirs, files in os.walk(static_folder):
+            relative_root = os.path.relpath(root, static_folder).replace(os.sep, "/")
+
+            dirs[:] = [
+                name
+                for name in dirs
+                if posixpath.normpath(posixpath.join(relative_root, name))
+                not in EXCLUDED_STATIC_DIRS
+            ]
+
+            for filename in files:
+                if filename.startswith("."):
+                    continue
+
+                name = posixpath.normpath(posixpath.join(relative_root, filename))
+
+                with open(os.path.join(root, filename), "rb") as file:
+                    self.sources["static"][name] = file.read()
+
+    def collect_bootstrap(self):
+        """
+        Vendor the Bootstrap files and the configured Bootswatch themes.
+        """
+        static_folder = self.app.blueprints["bootstrap"].static_folder
+        names = list(BOOTSTRAP_FILES)
+
+        for theme in self.app.config["BOOTSTRAP_BOOTSWATCH_THEMES"]:
+            names.append("css/bootswatch/%s/bootstrap.min.css" % theme.lower())
+
+        for name in names:
+            with open(os.path.join(static_folder, *name.split("/")), "rb") as file:
+                self.sources["bootstrap.static"][name] = _SOURCE_MAP.sub(
+                    b"", file.read()
+                )
+
+    def collect_icons(self, timeout: float = 30):
+        """
+        Download the Bootstrap Icons font from the CDN.
+
+        :raises requests.RequestException: If a file cannot be downloaded.
+        """
+        import requests
+
+        for name in BOOTSTRAP_ICONS_FILES:
+            response = requests.get(BOOTSTRAP_ICONS_URL + name, timeout=timeout)
+            response.raise_for_status()
+
+            self.sources["static"][
+                posixpath.join(BOOTSTRAP_ICONS_DIR, name)
+            ] = response.content
+
+    def build(self) -> dict:
+        """
+        Write the fingerprinted files, their encoded variants and the manifest.
+
+        :return: The manifest.
+        """
+        manifest = {endpoint: {} for endpoint in ASSET_ENDPOINTS}
+        manifest["encodings"] = {}
+
+        for endpoint, sources in self.sources.items():
+            # Stylesheets last, their `url()` references need the final names.
+            ordered = sorted(sources, key=lambda name: name.endswith(".css"))
+
+            for name in ordered:
+                content = sources[name]
+
+                if name.endswith(".css"):
+                    content = self.rewrite_css_urls(name, content, manifest[endpoint])
+
+                hashed = get_fingerprinted_name(name, content)
+                manifest[endpoint][name] = hashed
+
+                encodings = self.write(endpoint, hashed, content)
+
+                if encodings:
+                    manifest["encodings"]["%s/%s" % (endpoint, hashed)] = encodings
+
+                self.echo("%s: %s -> %s" % (endpoint, name, hashed))
+
+        with open(os.path.join(self.output_dir, MANIFEST_NAME), "w") as file:
+            json.dump(manifest, file, indent=2, sort_keys=True)
+
+        return manifest
+
+    def write(self, endpoint: str, name: str, content: bytes) -> t.List[str]:
+        """
+        Write a file with its encoded variants, returns the written encodings.
+        """
+        path = os.path.join(self.output_dir, endpoint, *name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, "wb") as file:
+            file.write(content)
+
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+            return []
+
+        variants = get_encoded_variants(content)
+
+        for encoding, data in variants.items():
+            with open(path + ENCODING_SUFFIXES[encoding], "wb") as file:
+                file.write(data)
+
+        return sorted(variants)
+
+    @staticmethod
+    def rewrite_css_urls(name: str, content: bytes, names: t.Dict[str, str]) -> bytes:
+        """
+        Point relative `url()` references of a stylesheet to the fingerprinted files.
+        """
+
+        def replace(match):
+            url = match.group(2)
+
+            if url.startswith(("data:", "http:", "https:", "//", "/", "#")):
+                return match.group(0)
+
+            path, _, suffix = url.partition("?")
+            path, _, fragment = path.partition("#")
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(name), path))
+
+            if target not in names:
+                return match.group(0)
+
+            hashed = posixpath.relpath(names[target], posixpath.dirname(name) or ".")
+            return 'url("%s%s")' % (hashed, "#" + fragment if fragment else "")
+
+        return _CSS_URL.sub(replace, content.decode("utf-8")).encode("utf-8")
+
+
+def load_manifest(build_dir: str) -> t.Optional[dict]:
+    """
+    Returns the manifest of a build directory, `None` if assets are not built.
+    """
+    try:
+        with open(os.path.join(build_dir, MANIFEST_NAME)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def make_asset_view(endpoint: str, view: t.Callable, build_dir: str, manifest: dict):
+    """
+    Wrap a static view to serve the fingerprinted files of `endpoint`.
+    """
+    hashed_names = set(manifest[endpoint].values())
+    directory = os.path.join(build_dir, endpoint)
+
+    def asset_view(filename: str):
+        if filename not in hashed_names:
+            return view(filename=filename)
+
+        encodings = manifest["encodings"].get("%s/%s" % (endpoint, filename), ())
+        path, encoding = filename, None
+
+        for candidate in ("br", "gzip"):
+            if candidate in encodings and request.accept_encodings[candidate]:
+                path, encoding = filename + ENCODING_SUFFIXES[candidate], candidate
+                break
+
+        response = send_from_directory(
+            directory,
+            path,
+            mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            max_age=IMMUTABLE_MAX_AGE,
+        )
+
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+
+        if encodings:
+            response.vary.add("Accept-Encoding")
+
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    return asset_view
+
+
+def init_assets(app: Flask):
+    """
+    Serve the built assets under their fingerprinted names, if built.
+    """
+    build_dir = app.config["ASSETS_BUILD_DIR"]
+    manifest = (
+        load_manifest(build_dir) if app.config.get("ASSETS_FINGERPRINT") else None
+    )
+
+    # Used by the templates to pick the vendored files over the CDN.
+    app.jinja_env.globals["has_asset"] = lambda filename: bool(
+        manifest and filename in manifest["static"]
+    )
+
+    if not manifest:
+        return
+
+    # Bootstrap-Flask links its local (vendored) files instead of the CDN.
+    app.config["BOOTSTRAP_SERVE_LOCAL"] = True
+
+    for endpoint in ASSET_ENDPOINTS:
+        if endpoint in app.view_functions:
+            app.view_functions[endpoint] = make_asset_view(
+                endpoint, app.view_functions[endpoint], build_dir, manifest
+            )
+
+    @app.url_defaults
+    def fingerprint_static_url(endpoint, values):
+        names = manifest.get(endpoint)
+
+        if names and values.get("filename") in names:
+            values["filename"] = names[values["filename"]]
@@ -0,0 +1,117 @@
+"""
+Shared asynchronous HTTP client for the outbound calls of the views.
+
+Flask runs every async view in its own short-lived event loop, which can't
+keep a connection pool between requests. The client therefore lives on one
+background event loop per process; views submit coroutines to it and await
+the result, so concurrent requests share the same keep-alive connections.
+"""
+
+import os
+import time
+import asyncio
+import threading
+import typing as t
+
+import httpx
+
+
+class BackgroundLoop:
+    """
+    A process-wide event loop thread owning a shared `httpx.AsyncClient`.
+
+    :param max_connections: Maximum connections of the shared pool.
+    :param timeout: Default timeout of every HTTP request, in seconds.
+    """
+
+    def __init__(self, max_connections: int = 20, timeout: float = 5.0):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._loop: t.Optional[asyncio.AbstractEventLoop] = None
+        self._client: t.Optional[httpx.AsyncClient] = None
+        self._pid = None
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections),
+                follow_redirects=True,
+            )
+            started.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, name="async-http", daemon=True).start()
+        started.wait()
+
+        self._loop = loop
+        self._pid = os.getpid()
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        # A forked worker doesn't inherit the loop thread, start a new one.
+        if self._loop is None or self._pid != os.getpid():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid():
+                    self._start()
+
+        return self._loop
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        The shared client, only usable from coroutines running on this loop.
+        """
+        self.get_loop()
+        return self._client
+
+    def submit(self, coroutine: t.Coroutine) -> asyncio.Future:
+        """
+        Schedule a coroutine on the background loop.
+
+        :return: A future awaitable from the caller's event loop.
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.get_loop())
+        return asyncio.wrap_future(future)
+
+
+# Background loop shared by the requests of this process.
+background = BackgroundLoop()
+
+
+class Deadline:
+    """
+    Tracks the time left of an overall deadline.
+    """
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+async def fetch_content(url: str) -> t.Optional[bytes]:
+    """
+    Download `url` with the shared client, returns `None` on failure.
+
+    Must run on the background loop, see `background.submit`.
+    """
+    try:
+        response = await background.client.get(url)
+        response.raise_for_status()
+        return response.content
+    except httpx.HTTPError:
+        return None
+
+
+def init_async_http(app):
+    """
+    Configure the shared client from the application configuration.
+    """
+    background.max_connections = app.config["ASYNC_HTTP_MAX_CONNECTIONS"]
+    background.timeout = app.config["ASYNC_HTTP_TIMEOUT"]
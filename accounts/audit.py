@@ -0,0 +1,481 @@
+"""
+Buffered, append-only audit log of the authentication events.
+
+The views never write the audit trail themselves: the signal receivers
+enqueue the events in memory and a background thread writes them in
+batches, when `AUDIT_BATCH_SIZE` events are pending or every
+`AUDIT_FLUSH_INTERVAL` seconds, to the `audit_event` table or to a
+rotating JSONL file. The queue holds at most `AUDIT_QUEUE_SIZE` events;
+when it is full the `AUDIT_OVERFLOW` policy applies:
+
+- `drop-oldest`: the oldest pending event is discarded.
+- `drop-new`: the new event is discarded.
+- `block`: the request waits up to `AUDIT_BLOCK_TIMEOUT` seconds for room,
+  then the new event is discarded.
+
+Pending events are written when the process exits.
+"""
+
+import os
+import io
+import json
+import time
+import atexit
+import threading
+import typing as t
+
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+
+from flask import Flask, has_request_context, request
+
+OVERFLOW_POLICIES = ("drop-oldest", "drop-new", "block")
+
+# Event names, by signal and result.
+LOGIN_EVENTS = {
+    "success": "login",
+    "failure": "login_failed",
+    "inactive": "login_inactive",
+}
+
+
+class DatabaseAuditSink:
+    """
+    Writes the events to the `audit_event` table.
+
+    :param engine: The engine of the accounts database.
+    """
+
+    def __init__(self, engine: Engine):
+        from accounts.models import AuditEvent
+
+        self.engine = engine
+        self.table = AuditEvent.__table__
+
+    def write(self, events: t.List[dict]):
+        rows = [dict(event, data=json.dumps(event["data"])) for event in events]
+
+        with self.engine.begin() as connection:
+            connection.execute(self.table.insert(), rows)
+
+    def query(
+        self,
+        since: datetime = None,
+        until: datetime = None,
+        event: str = None,
+        user: str = None,
+        limit: int = 100,
+    ) -> t.Iterator[dict]:
+        """
+        Yields the matching events, oldest first.
+        """
+        table = self.table
+        statement = select(table).order_by(table.c.created_at, table.c.id).limit(limit)
+
+        if since:
+            statement = statement.where(table.c.created_at >= since)
+        if until:
+            statement = statement.where(table.c.created_at < until)
+        if event:
+            statement = statement.where(table.c.event == event)
+        if user:
+            statement = statement.where(
+                (table.c.user_id == user) | (table.c.username == user)
+            )
+
+        with self.engine.connect() as connection:
+            for row in connection.execute(statement).mappings():
+                item = dict(row)
+                item["data"] = json.loads(item["data"] or "{}")
+                yield item
+
+
+class FileAuditSink:
+    """
+    Appends the events to a JSONL file, rotated past `max_bytes`.
+
+    The rotated files are named `<path>.1` (newest) to `<path>.<backups>`.
+
+    :param path: Path of the current file.
+    :param max_bytes: Size past which the file is rotated.
+    :param backups: Number of rotated files kept.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backups: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def rotate(self):
+        for index in range(self.backups - 1, 0, -1):
+            source = "%s.%d" % (self.path, index)
+
+            if os.path.exists(source):
+                os.replace(source, "%s.%d" % (self.path, index + 1))
+
+        if self.backups:
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+
+    def write(self, events: t.List[dict]):
+        lines = "".join(
+            json.dumps(dict(event, created_at=event["created_at"].isoformat())) + "\n"
+            for event in events
+        ).encode("utf-8")
+
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            size = 0
+
+        if size and size + len(lines) > self.max_bytes:
+            self.rotate()
+
+        # `O_APPEND` keeps the lines of concurrent workers whole.
+        descriptor = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o640)
+
+        try:
+            os.write(descriptor, lines)
+        finally:
+            os.close(descriptor)
+
+    @property
+    def files(self) -> t.List[str]:
+        """
+        The existing files, oldest first.
+        """
+        names = ["%s.%d" % (self.path, index) for index in range(self.backups, 0, -1)]
+        return [name for name in names + [self.path] if os.path.exists(name)]
+
+    @staticmethod
+    def _time_range(path: str) -> t.Tuple[datetime, datetime]:
+        """
+        Returns the time of the first and last events of a file.
+        """
+        with open(path, "rb") as file:
+            first = file.readline()
+            file.seek(0, io.SEEK_END)
+            file.seek(max(0, file.tell() - 4096))
+            last = file.read().splitlines()[-1]
+
+        return (
+            datetime.fromisoformat(json.loads(first)["created_at"]),
+            datetime.fromisoformat(json.loads(last)["created_at"]),
+        )
+
+    def query(
+        self,
+        since: datetime = None,
+        until: datetime = None,
+        event: str = None,
+        user: str = None,
+        limit: int = 100,
+    ) -> t.Iterator[dict]:
+        """
+        Yields the matching events, oldest first. The files outside of the
+        time range are skipped from their first and last lines.
+        """
+        count = 0
+
+        for path in self.files:
+            try:
+                first, last = self._time_range(path)
+            except (IndexError, ValueError, KeyError):
+                continue
+
+            if (since and last < since) or (until and first >= until):
+                continue
+
+            with open(path, encoding="utf-8") as file:
+                for line in file:
+                    item = json.loads(line)
+                    item["created_at"] = datetime.fromisoformat(item["created_at"])
+
+                    if since and item["created_at"] < since:
+                        continue
+                    if until and item["created_at"] >= until:
+                        break
+                    if event and item["event"] != event:
+                        continue
+                    if user and user not in (item["user_id"], item["username"]):
+                        continue
+
+                    yield item
+                    count += 1
+
+                    if count >= limit:
+                        return
+
+
+class AuditLog:
+    """
+    Bounded in-memory queue of events, written in batches by a background thread.
+
+    :param sink: The sink receiving the batches (`write(events)`).
+    :param queue_size: Maximum number of pending events.
+    :param batch_size: Pending events that trigger a write.
+    :param flush_interval: Maximum seconds an event stays pending.
+    :param overflow: Policy applied when the queue is full, see `OVERFLOW_POLICIES`.
+    :param block_timeout: Maximum wait for room with the `block` policy.
+    :param logger: Logger receiving the write errors.
+    """
+
+    def __init__(
+        self,
+        sink,
+        queue_size: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        overflow: str = "drop-oldest",
+        block_timeout: float = 0.1,
+        logger=None,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Invalid audit overflow policy: '%s'" % overflow)
+
+        self.sink = sink
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.logger = logger
+
+        self.dropped = 0
+        self._queue: t.Deque[dict] = deque()
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+
+    def _ensure_started(self):
+        # A forked worker starts its own thread and discards the parent's events.
+        if self._pid == os.getpid():
+            return
+
+        with self._condition:
+            if self._pid != os.getpid():
+                self._queue.clear()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name="audit-log", daemon=True
+                )
+                self._thread.start()
+
+    def record(self, event: str, **fields) -> bool:
+        """
+        Enqueue an event without waiting for it to be written.
+
+        :return: `False` if the event was dropped.
+        """
+        self._ensure_started()
+
+        item = {
+            "created_at": datetime.now(),
+            "event": event,
+            "user_id": fields.pop("user_id", None),
+            "username": fields.pop("username", None),
+            "ip_address": fields.pop("ip_address", None),
+            "user_agent": fields.pop("user_agent", None),
+            "data": fields,
+        }
+
+        with self._condition:
+            if len(self._queue) >= self.queue_size:
+                if self.overflow == "drop-oldest":
+                    self._queue.popleft()
+                    self.dropped += 1
+                elif self.overflow == "block":
+                    self._condition.notify_all()
+                    self._condition.wait_for(
+                        lambda: len(self._queue) < self.queue_size, self.block_timeout
+                    )
+
+                if len(self._queue) >= self.queue_size:
+                    self.dropped += 1
+                    return False
+
+            self._queue.append(item)
+
+            if len(self._queue) >= self.batch_size:
+                self._condition.notify_all()
+
+        return True
+
+    @property
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def _take(self) -> t.List[dict]:
+        with self._condition:
+            batch = [
+                self._queue.popleft()
+                for _ in range(min(self.batch_size, len(self._queue)))
+            ]
+            self._condition.notify_all()
+
+        return batch
+
+    def _write(self, batch: t.List[dict]) -> bool:
+        try:
+            self.sink.write(batch)
+            return True
+        except Exception:
+            if self.logger:
+                self.logger.exception("Failed to write %d audit event(s)", len(batch))
+
+            # Keep the batch for the next attempt, as far as the queue allows.
+            with self._condition:
+                room = max(0, self.queue_size - len(self._queue))
+                self._queue.extendleft(reversed(batch[:room]))
+                self.dropped += len(batch) - min(room, len(batch))
+
+            return False
+
+    def flush(self) -> int:
+        """
+        Write every pending event now.
+
+        :return: The number of events written.
+        """
+        written = 0
+
+        with self._write_lock:
+            while True:
+                batch = self._take()
+
+                if not batch or not self._write(batch):
+                    return written
+
+                written += len(batch)
+
+    def _run(self):
+        while not self._closed:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._closed or len(self._queue) >= self.batch_size,
+                    self.flush_interval,
+                )
+
+            if self.flush() == 0 and self._queue:
+                # The sink failed, back off before retrying.
+                time.sleep(self.flush_interval)
+
+    def close(self, timeout: float = 5.0):
+        """
+        Stop the background thread and write the pending events.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+
+        self.flush()
+
+
+def get_request_fields() -> dict:
+    """
+    Returns the client address and user agent of the current request, if any.
+    """
+    if not has_request_context():
+        return {}
+
+    return {
+        "ip_address": request.remote_addr,
+        "user_agent": (request.user_agent.string or "")[:250],
+    }
+
+
+def get_user_fields(user) -> dict:
+    if user is None:
+        return {}
+
+    return {"user_id": str(user.id), "username": user.username}
+
+
+def get_audit_sink(app: Flask, db):
+    backend = app.config["AUDIT_BACKEND"]
+
+    if backend == "database":
+        with app.app_context():
+            return DatabaseAuditSink(db.engine)
+
+    if backend == "file":
+        return FileAuditSink(
+            app.config["AUDIT_FILE_PATH"],
+            max_bytes=app.config["AUDIT_FILE_MAX_BYTES"],
+            backups=app.config["AUDIT_FILE_BACKUPS"],
+        )
+
+    raise RuntimeError("Invalid audit backend: '%s'" % backend)
+
+
+def init_audit_log(app: Flask, db) -> AuditLog:
+    """
+    Record the authentication events of the application in the audit log.
+    """
+    from . import signals
+
+    audit_log = AuditLog(
+        get_audit_sink(app, db),
+        queue_size=app.config["AUDIT_QUEUE_SIZE"],
+        batch_size=app.config["AUDIT_BATCH_SIZE"],
+        flush_interval=app.config["AUDIT_FLUSH_INTERVAL"],
+        overflow=app.config["AUDIT_OVERFLOW"],
+        block_timeout=app.config["AUDIT_BLOCK_TIMEOUT"],
+        logger=app.logger,
+    )
+    app.extensions["audit_log"] = audit_log
+
+    # Write the pending events when the worker exits.
+    atexit.register(audit_log.close)
+
+    def record(event: str, user=None, **fields):
+        fields.update(get_user_fields(user))
+        fields.update(get_request_fields())
+        audit_log.record(event, **fields)
+
+    @signals.login_attempted.connect_via(app, weak=False)
+    def on_login_attempted(sender, result, username=None, user=None, **extra):
+        fields = {"username": username}
+        fields.update(extra)
+        record(LOGIN_EVENTS.get(result, "login_" + result), user=user, **fields)
+
+    @signals.user_registered.connect_via(app, weak=False)
+    def on_user_registered(sender, user, **extra):
+        record("user_registered", user=user)
+
+    @signals.password_changed.connect_via(app, weak=False)
+    def on_password_changed(sender, user, reason, **extra):
+        record("password_" + ("reset" if reason == "reset" else "changed"), user=user)
+
+    @signals.email_changed.connect_via(app, weak=False)
+    def on_email_changed(sender, user, previous=None, **extra):
+        record("email_changed", user=user, previous=previous, email=user.email)
+
+    @signals.oauth_linked.connect_via(app, weak=False)
+    def on_oauth_linked(sender, user, provider, **extra):
+        record("oauth_linked", user=user, provider=provider)
+
+    @signals.oauth_unlinked.connect_via(app, weak=False)
+    def on_oauth_unlinked(sender, user, provider, **extra):
+        record("oauth_unlinked", user=user, provider=provider)
+
+    @signals.account_deleted.connect_via(app, weak=False)
+    def on_account_deleted(sender, user, **extra):
+        record("account_deleted", user=user)
+
+    @signals.sessions_revoked.connect_via(app, weak=False)
+    def on_sessions_revoked(sender, user_id, epoch, **extra):
+        record("sessions_revoked", user_id=str(user_id), epoch=epoch)
+
+    return audit_log
@@ -0,0 +1,183 @@
+"""
+Per-account exponential backoff of the failed logins.
+
+Failures are counted per login identifier (the username and email of the
+account, or the submitted identifier of an unknown account) in the storage
+backend of the rate limiter, so every worker sees the same counters with
+a shared (e.g. Redis) backend. From the `AUTH_BACKOFF_THRESHOLD`th failure,
+each failure locks the identifiers for `AUTH_BACKOFF_BASE * 2 ** n` seconds,
+up to `AUTH_BACKOFF_MAX`.
+
+A locked attempt is rejected before the user row is fetched, and through
+the other identifier of the account before the password is hashed; it is
+not counted. Keys hold a digest of the identifier and expire: a counter
+`AUTH_BACKOFF_RESET` seconds after the last failure, a lock at its end, so
+the memory held is bounded by the failure rate over these windows.
+"""
+
+import math
+import time
+import hashlib
+import typing as t
+
+from flask import Flask
+
+
+class LoginBackoff:
+    """
+    Failure counters and lockouts of the login identifiers.
+
+    :param threshold: Failures allowed before the first lockout.
+    :param base: Seconds of the first lockout, doubled by each failure.
+    :param maximum: Longest lockout, in seconds.
+    :param reset: Seconds after the last failure the counter is forgotten.
+    :param prefix: Prefix of the storage keys.
+    """
+
+    def __init__(
+        self,
+        threshold: int = 5,
+        base: float = 1,
+        maximum: float = 900,
+        reset: float = 3600,
+        prefix: str = "auth-backoff",
+    ):
+        self.threshold = threshold
+        self.base = base
+        self.maximum = maximum
+        self.reset_after = reset
+        self.prefix = prefix
+        self.storage = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.storage is not None
+
+    @staticmethod
+    def _normalize(identifiers: t.Iterable[str]) -> t.Set[str]:
+        return {identifier.strip().lower() for identifier in identifiers if identifier}
+
+    def _key(self, kind: str, identifier: str) -> str:
+        digest = hashlib.blake2b(identifier.encode("utf-8"), digest_size=16).hexdigest()
+        return "%s/%s/%s" % (self.prefix, kind, digest)
+
+    def get_delay(self, failures: int) -> int:
+        """
+        Returns the lockout seconds after `failures` consecutive failures.
+        """
+        if failures < self.threshold:
+            return 0
+
+        # The exponent is capped, the maximum is reached long before.
+        exponent = min(failures - self.threshold, 32)
+        return max(1, math.ceil(min(self.base * 2**exponent, self.maximum)))
+
+    def get_retry_after(self, *identifiers: str) -> int:
+        """
+        Returns the seconds left of the longest lockout of the identifiers,
+        `0` if none is locked.
+        """
+        if not self.enabled:
+            return 0
+
+        retry_after = 0
+
+        for identifier in self._normalize(identifiers):
+            key = self._key("lock", identifier)
+
+            if self.storage.get(key) > 0:
+                remaining = math.ceil(self.storage.get_expiry(key) - time.time())
+                retry_after = max(retry_after, remaining, 1)
+
+        return retry_after
+
+    def record_failure(self, *identifiers: str) -> int:
+        """
+        Count a failed login of the identifiers and lock them past the threshold.
+
+        :return: The lockout seconds now applied, `0` if none.
+        """
+        if not self.enabled:
+            return 0
+
+        delay = 0
+
+        for identifier in self._normalize(identifiers):
+            failures = self.storage.incr(
+                self._key("failures", identifier),
+                int(self.reset_after),
+                elastic_expiry=True,
+            )
+            identifier_delay = self.get_delay(failures)
+
+            if identifier_delay:
+                self.storage.incr(self._key("lock", identifier), identifier_delay)
+
+            delay = max(delay, identifier_delay)
+
+        return delay
+
+    def reset(self, *identifiers: str):
+        """
+        Forget the failures of the identifiers after a successful login.
+        """
+        if not self.enabled:
+            return
+
+        for identifier in self._normalize(identifiers):
+            self.storage.clear(self._key("failures", identifier))
+            self.storage.clear(self._key("lock", identifier))
+
+
+# Backoff shared by the login views of this process.
+login_backoff = LoginBackoff()
+
+
+def authenticate(username: str, password: str) -> t.Tuple[t.Any, int]:
+    """
+    Authenticate a user by username or email with the per-account backoff.
+
+    :return: The authenticated user (or `None`) and the seconds left of the
+        lockout (`0` if the attempt was not locked out).
+    """
+    from accounts.models import User
+
+    # Rejected without a database query.
+    retry_after = login_backoff.get_retry_after(username)
+
+    if retry_after:
+        return None, retry_after
+
+    user = User.get_user_by_login(username)
+    identifiers = (username, user.username, user.email) if user else (username,)
+
+    if user:
+        # The account may be locked through its other identifier.
+        retry_after = login_backoff.get_retry_after(user.username, user.email)
+
+        if retry_after:
+            return None, retry_after
+
+        if user.check_password(password):
+            login_backoff.reset(*identifiers)
+            return user, 0
+
+    login_backoff.record_failure(*identifiers)
+    return None, 0
+
+
+def init_login_backoff(app: Flask, limiter):
+    """
+    Configure the backoff and share the rate limiter's storage backend.
+    """
+    from accounts.utils import get_limiter_storage
+
+    login_backoff.threshold = app.config["AUTH_BACKOFF_THRESHOLD"]
+    login_backoff.base = app.config["AUTH_BACKOFF_BASE"]
+    login_backoff.maximum = app.config["AUTH_BACKOFF_MAX"]
+    login_backoff.reset_after = app.config["AUTH_BACKOFF_RESET"]
+
+    if app.config["AUTH_BACKOFF_ENABLED"]:
+        login_backoff.storage = get_limiter_storage(app, limiter)
+    else:
+        login_backoff.storage = None
@@ -0,0 +1,452 @@
+"""
+Bulk emails (account confirmation, password reset) to a cohort of accounts.
+
+The cohort is read with a server-side cursor, in primary key order. For
+each batch, the security tokens are issued with one bulk `INSERT`, and the
+messages are sent by a small pool of threads, each keeping its own SMTP
+connection open, under a global rate cap. The email body is rendered once
+per locale with placeholders, filled in for every recipient.
+
+A JSON checkpoint records the last account of every batch sent, a run
+interrupted is resumed from it. A batch interrupted half-way is sent again
+(with new tokens), the accounts of a batch being sent at least once.
+"""
+
+import os
+import json
+import queue
+import secrets
+import smtplib
+import threading
+import time
+import typing as t
+
+from datetime import datetime
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.engine import Engine
+
+from flask import Flask, render_template, url_for
+from flask_babel import force_locale
+from flask_mail import Message
+
+from accounts.extensions import mail
+from accounts.loadtest import Pacer
+from accounts.models import User, UserSecurityToken
+from accounts.signals import email_sent, token_issued
+from accounts.utils import get_full_url
+
+
+class CampaignKind(t.NamedTuple):
+    """
+    An email sent by a campaign, and the accounts it is sent to.
+    """
+
+    subject: str
+    template: str
+    endpoint: str
+    link_name: str
+    salt_config: str
+    active: bool
+
+
+# The campaigns of `flask mail-campaign`, by name.
+CAMPAIGNS = {
+    "confirm": CampaignKind(
+        subject="Verify Your Account",
+        template="emails/verify_account.txt",
+        endpoint="accounts.confirm_account",
+        link_name="verification_link",
+        salt_config="SALT_ACCOUNT_CONFIRM",
+        active=False,
+    ),
+    "reset-password": CampaignKind(
+        subject="Reset Your Password",
+        template="emails/reset_password.txt",
+        endpoint="accounts.reset_password",
+        link_name="reset_link",
+        salt_config="SALT_RESET_PASSWORD",
+        active=True,
+    ),
+}
+
+# Placeholders rendered in the email body, replaced for every recipient.
+_USERNAME_MARK = "campaign-username-placeholder"
+_TOKEN_MARK = "campaign-token-placeholder"
+
+
+class Checkpoint:
+    """
+    The progress of a campaign, saved to a JSON file after every batch.
+
+    :param path: The checkpoint file.
+    :param cohort: The campaign and cohort options, a checkpoint of other
+        options is not resumed.
+    """
+
+    def __init__(self, path: str, cohort: t.Dict[str, t.Any]):
+        self.path = path
+        self.cohort = cohort
+        self.last_id = None
+        self.sent = 0
+        self.failed = 0
+        self.done = False
+
+    def load(self) -> bool:
+        """
+        Load the saved progress, returns `False` if there is none.
+
+        :raises ValueError: If the checkpoint is of another campaign or cohort.
+        """
+        if not os.path.exists(self.path):
+            return False
+
+        with open(self.path, encoding="utf-8") as file:
+            state = json.load(file)
+
+        if state["cohort"] != self.cohort:
+            raise ValueError(
+                "Invalid checkpoint: '%s' is of another campaign or cohort" % self.path
+            )
+
+        self.last_id = state["last_id"]
+        self.sent = state["sent"]
+        self.failed = state["failed"]
+        self.done = state["done"]
+        return True
+
+    def save(self):
+        state = {
+            "cohort": self.cohort,
+            "last_id": self.last_id,
+            "sent": self.sent,
+            "failed": self.failed,
+            "done": self.done,
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+        }
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temporary = self.path + ".tmp"
+
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(state, file, indent=2)
+
+        # Replaced at once, an interrupted write leaves the previous state.
+        os.replace(temporary, self.path)
+
+
+class MailerPool:
+    """
+    Threads sending messages over persistent SMTP connections.
+
+    :param app: The application, providing the Flask-Mail configuration.
+    :param connections: Number of threads, each with its own connection.
+    :param rate: Maximum messages per second of all the threads.
+    :param echo: Callable receiving the delivery failures.
+    """
+
+    def __init__(
+        self,
+        app: Flask,
+        connections: int = 4,
+        rate: t.Optional[float] = None,
+        echo: t.Callable[[str], t.Any] = print,
+    ):
+        self.app = app
+        self.pacer = Pacer(rate)
+        self.echo = echo
+        self.sent = 0
+        self.failed = 0
+
+        self._queue = queue.Queue(maxsize=connections * 2)
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._run, name="mailer-%d" % index, daemon=True)
+            for index in range(connections)
+        ]
+
+        for thread in self._threads:
+            thread.start()
+
+    def _deliver(self, connection, message: Message):
+        try:
+            connection.send(message)
+        except smtplib.SMTPServerDisconnected:
+            # Closed by the server (idle or too many messages), reconnect once.
+            connection.host = connection.configure_host()
+            connection.send(message)
+
+    def _run(self):
+        with self.app.app_context():
+            connection = None
+
+            while True:
+                message = self._queue.get()
+
+                if message is None:
+                    self._queue.task_done()
+                    break
+
+                self.pacer.wait()
+
+                try:
+                    if connection is None:
+                        connection = mail.connect().__enter__()
+
+                    self._deliver(connection, message)
+                except (smtplib.SMTPException, OSError) as e:
+                    if not isinstance(e, smtplib.SMTPRecipientsRefused):
+                        # The connection may be unusable, open a new one.
+                        self._close(connection)
+                        connection = None
+
+                    with self._lock:
+                        self.failed += 1
+
+                    email_sent.send(self.app, result="failed")
+                    self.echo(
+                        "Failed to send to %s: %s" % (", ".join(message.recipients), e)
+                    )
+                else:
+                    with self._lock:
+                        self.sent += 1
+
+                    email_sent.send(self.app, result="sent")
+                finally:
+                    self._queue.task_done()
+
+            self._close(connection)
+
+    @staticmethod
+    def _close(connection):
+        if connection is None:
+            return
+
+        try:
+            connection.__exit__(None, None, None)
+        except (smtplib.SMTPException, OSError):
+            pass
+
+    def send(self, message: Message):
+        self._queue.put(message)
+
+    def join(self):
+        """
+        Wait until every queued message is sent (or failed).
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        Send the queued messages, then close the connections.
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+
+        for thread in self._threads:
+            thread.join()
+
+
+class MailCampaign:
+    """
+    Sends a campaign email to every account of a cohort, batch by batch.
+
+    :param app: The application.
+    :param engine: The engine of the accounts database.
+    :param kind: The campaign, a key of `CAMPAIGNS`.
+    :param checkpoint: The progress of the campaign, loaded or new.
+    :param created_after: Only the accounts created from this date.
+    :param created_before: Only the accounts created before this date.
+    :param locale: The language the emails are rendered in.
+    :param batch_size: Accounts read, and tokens issued, per batch.
+    :param connections: Number of SMTP connections.
+    :param rate: Maximum emails per second, `None` for no limit.
+    :param echo: Callable receiving progress messages.
+    """
+
+    def __init__(
+        self,
+        app: Flask,
+        engine: Engine,
+        kind: str,
+        checkpoint: Checkpoint,
+        created_after: t.Optional[datetime] = None,
+        created_before: t.Optional[datetime] = None,
+        locale: t.Optional[str] = None,
+        batch_size: int = 200,
+        connections: int = 4,
+        rate: t.Optional[float] = None,
+        echo: t.Callable[[str], t.Any] = print,
+    ):
+        self.app = app
+        self.engine = engine
+        self.kind = CAMPAIGNS[kind]
+        self.checkpoint = checkpoint
+        self.created_after = created_after
+        self.created_before = created_before
+        self.locale = locale or app.config["BABEL_DEFAULT_LOCALE"]
+        self.batch_size = batch_size
+        self.connections = connections
+        self.rate = rate
+        self.echo = echo
+
+        self.salt = app.config[self.kind.salt_config]
+        self.sender = app.config["MAIL_DEFAULT_SENDER"]
+        self.user = User.__table__
+        self.token = UserSecurityToken.__table__
+        self._bodies: t.Dict[str, str] = {}
+
+    @property
+    def criteria(self) -> list:
+        # The pooled guest accounts have no reachable address.
+        criteria = [
+            self.user.c.active.is_(self.kind.active),
+            self.user.c.is_guest.is_(False),
+        ]
+
+        if self.created_after:
+            criteria.append(self.user.c.created_at >= self.created_after)
+
+        if self.created_before:
+            criteria.append(self.user.c.created_at < self.created_before)
+
+        if self.checkpoint.last_id is not None:
+            criteria.append(self.user.c.id > self.checkpoint.last_id)
+
+        return criteria
+
+    def count(self) -> int:
+        """
+        Returns the number of accounts left to send to.
+        """
+        with self.engine.connect() as connection:
+            return connection.execute(
+                select(func.count()).select_from(self.user).where(*self.criteria)
+            ).scalar()
+
+    def get_body(self, locale: str) -> str:
+        """
+        Returns the email body of a locale, with `{username}` and `{token}`
+        fields, rendered on first use.
+        """
+        body = self._bodies.get(locale)
+
+        if body is None:
+            with self.app.test_request_context(), force_locale(locale):
+                link = get_full_url(url_for(self.kind.endpoint, token=_TOKEN_MARK))
+                rendered = render_template(
+                    self.kind.template,
+                    username=_USERNAME_MARK,
+                    **{self.kind.link_name: link},
+                )
+
+            body = (
+                rendered.replace("{", "{{")
+                .replace("}", "}}")
+                .replace(_USERNAME_MARK, "{username}")
+                .replace(_TOKEN_MARK, "{token}")
+            )
+            self._bodies[locale] = body
+
+        return body
+
+    def issue_tokens(self, user_ids: t.List[str]) -> t.List[str]:
+        """
+        Issue a security token to every user with one bulk `INSERT`.
+        """
+        tokens = [secrets.token_hex() for _ in user_ids]
+
+        with self.engine.begin() as connection:
+            connection.execute(
+                insert(self.token),
+                [
+                    {"token": token, "salt": self.salt, "user_id": user_id}
+                    for token, user_id in zip(tokens, user_ids)
+                ],
+            )
+
+        for _ in tokens:
+            token_issued.send(self.app, salt=self.salt)
+
+        return tokens
+
+    def send_batch(self, pool: MailerPool, rows) -> int:
+        """
+        Issue the tokens of a batch of accounts and send their emails.
+        """
+        tokens = self.issue_tokens([row.id for row in rows])
+        body = self.get_body(self.locale)
+
+        for row, token in zip(rows, tokens):
+            message = Message(
+                subject=self.kind.subject, sender=self.sender, recipients=[row.email]
+            )
+            message.body = body.format(username=row.username, token=token)
+            pool.send(message)
+
+        pool.join()
+        return len(rows)
+
+    def run(self, limit: t.Optional[int] = None) -> t.Dict[str, float]:
+        """
+        Send the campaign from the checkpoint, until the cohort (or `limit`
+        emails) is done.
+
+        :return: The totals of the run.
+        """
+        statement = (
+            select(self.user.c.id, self.user.c.username, self.user.c.email)
+            .where(*self.criteria)
+            .order_by(self.user.c.id)
+        )
+
+        if limit:
+            statement = statement.limit(limit)
+
+        pool = MailerPool(
+            self.app, connections=self.connections, rate=self.rate, echo=self.echo
+        )
+        started = time.perf_counter()
+        accounts = batches = 0
+
+        try:
+            with self.engine.connect() as connection:
+                result = connection.execution_options(
+                    stream_results=True, yield_per=self.batch_size
+                ).execute(statement)
+
+                for rows in result.partitions():
+                    sent, failed = pool.sent, pool.failed
+                    accounts += self.send_batch(pool, rows)
+                    batches += 1
+
+                    self.checkpoint.last_id = rows[-1].id
+                    self.checkpoint.sent += pool.sent - sent
+                    self.checkpoint.failed += pool.failed - failed
+                    self.checkpoint.save()
+
+                    elapsed = time.perf_counter() - started
+                    self.echo(
+                        "Batch %d: %d email(s), %d sent, %d failed in total (%.1f emails/s)."
+                        % (
+                            batches,
+                            len(rows),
+                            pool.sent,
+                            pool.failed,
+                            accounts / elapsed,
+                        )
+                    )
+        finally:
+            pool.close()
+
+        if not limit or accounts < limit:
+            self.checkpoint.done = True
+            self.checkpoint.save()
+
+        return {
+            "accounts": accounts,
+            "sent": pool.sent,
+            "failed": pool.failed,
+            "batches": batches,
+            "elapsed": time.perf_counter() - started,
+        }
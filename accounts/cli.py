@@ -3,8 +3,22 @@ import click
 
 from flask import Flask
 
+from accounts.extensions import database as db
 from accounts.models import User
 
+# Commands run without the web setup of the application (OAuth, mail, rate
+# limiter, views...), see `accounts.config_deferred_setup`.
+CORE_COMMANDS = frozenset(
+    {
+        "createtestuser",
+        "clear-migrations",
+        "convert-primary-keys",
+        "db",
+        "profile-startup",
+        "profiler",
+    }
+)
+
 
 def register_cli_command(app: Flask):
     """
@@ -66,3 +80,493 @@ def register_cli_command(app: Flask):
             click.secho(f"\n✔ Cleared {removed_files} migration file(s).", fg="green")
         else:
             click.secho("No migration files to delete.", fg="green")
+
+    @app.cli.command("convert-primary-keys")
+    @click.option(
+        "--phase",
+        type=click.Choice(["prepare", "backfill", "finalize"]),
+        required=True,
+        help="Conversion phase to run, in order: prepare, backfill, finalize.",
+    )
+    @click.option("--batch-size", default=5000, help="Rows updated per transaction.")
+    @click.option("--lock-timeout", default="5s", help="Maximum wait for table locks.")
+    def convert_primary_keys(phase, batch_size, lock_timeout):
+        """
+        Convert `String(36)` primary and foreign keys to native `uuid` columns.
+        """
+        from accounts.db_utils import PrimaryKeyConverter
+
+        try:
+            converter = PrimaryKeyConverter(
+                db.engine,
+                db.metadata,
+                batch_size=batch_size,
+                lock_timeout=lock_timeout,
+                echo=lambda message: click.secho(message, fg="cyan"),
+            )
+        except ValueError as e:
+            raise click.ClickException(
+                f"{e} Recreate the local SQLite database instead."
+            )
+
+        getattr(converter, phase)()
+
+        click.secho(f"✔ Phase '{phase}' completed.", fg="green")
+
+    @app.cli.command("purge-sessions")
+    @click.option("--all", "everything", is_flag=True, help="Remove every session.")
+    def purge_sessions(everything):
+        """
+        Remove expired sessions from the server-side session store.
+        """
+        from accounts.sessions import ServerSideSessionInterface
+
+        interface = app.session_interface
+
+        if not isinstance(interface, ServerSideSessionInterface):
+            raise click.ClickException(
+                "Sessions are stored in cookies, set SESSION_BACKEND to "
+                "'filesystem' or 'redis'."
+            )
+
+        removed = interface.backend.purge(
+            interface.get_lifetime(app), everything=everything
+        )
+
+        click.secho(f"✔ Removed {removed} session(s).", fg="green")
+
+    @app.cli.command("reap-accounts")
+    @click.option(
+        "--older-than",
+        type=int,
+        default=None,
+        help="Age in days of the unconfirmed accounts to delete.",
+    )
+    @click.option(
+        "--batch-size", default=None, type=int, help="Accounts per transaction."
+    )
+    @click.option("--workers", default=8, help="Threads removing the avatar files.")
+    @click.option("--pause", default=0.0, help="Seconds to sleep between batches.")
+    @click.option("--lock-timeout", default="5s", help="Maximum wait for row locks.")
+    @click.option("--orphans", is_flag=True, help="Also remove orphaned avatar files.")
+    @click.option("--dry-run", is_flag=True, help="Only count the accounts to delete.")
+    def reap_accounts(
+        older_than, batch_size, workers, pause, lock_timeout, orphans, dry_run
+    ):
+        """
+        Delete the unconfirmed accounts with their tokens, profiles and avatars.
+        """
+        from datetime import timedelta
+
+        from config import UPLOAD_FOLDER
+
+        from accounts.reaper import AccountReaper
+
+        reaper = AccountReaper(
+            db.engine,
+            app.root_path,
+            max_age=timedelta(days=older_than or app.config["REAP_UNCONFIRMED_DAYS"]),
+            batch_size=batch_size or app.config["REAP_BATCH_SIZE"],
+            workers=workers,
+            pause=pause,
+            lock_timeout=lock_timeout,
+            echo=lambda message: click.secho(message, fg="cyan"),
+        )
+
+        if dry_run:
+            click.secho(f"{reaper.count()} account(s) to delete.", fg="green")
+            return
+
+        result = reaper.run()
+
+        if orphans:
+            reaper.sweep_orphans(os.path.join(UPLOAD_FOLDER, "profile"))
+
+        click.secho(
+            f"✔ Deleted {result['accounts']} account(s) and {result['files']} "
+            f"avatar file(s) in {result['elapsed']:.1f}s.",
+            fg="green",
+        )
+
+    @app.cli.command("guest-pool")
+    @click.option("--size", default=None, type=int, help="Free guests to keep.")
+    def guest_pool(size):
+        """
+        Recycle the expired guest accounts and top the guest pool up.
+        """
+        pool = app.extensions.get("guest_pool")
+
+        if pool is None:
+            raise click.ClickException(
+                "The guest pool is disabled, set GUEST_POOL_SIZE."
+            )
+
+        if size is not None:
+            # Fill the pool up to `size`, even above the minimum.
+            pool.size = pool.minimum = size
+
+        recycled, created = pool.maintain()
+
+        click.secho(
+            f"✔ Recycled {recycled} and created {created} guest(s), "
+            f"{pool.count()} free.",
+            fg="green",
+        )
+
+    @app.cli.command("mail-campaign")
+    @click.argument("kind", type=click.Choice(["confirm", "reset-password"]))
+    @click.option("--created-after", type=click.DateTime(), help="Oldest account.")
+    @click.option("--created-before", type=click.DateTime(), help="Newest account.")
+    @click.option("--locale", default=None, help="Language of the emails.")
+    @click.option(
+        "--batch-size", default=None, type=int, help="Tokens issued per batch."
+    )
+    @click.option("--connections", default=None, type=int, help="SMTP connections.")
+    @click.option("--rate", default=None, type=float, help="Maximum emails per second.")
+    @click.option("--limit", default=None, type=int, help="Maximum emails this run.")
+    @click.option(
+        "--checkpoint", "checkpoint_path", default=None, help="Progress file."
+    )
+    @click.option("--restart", is_flag=True, help="Ignore the saved progress.")
+    @click.option("--dry-run", is_flag=True, help="Only count the accounts left.")
+    def mail_campaign(
+        kind,
+        created_after,
+        created_before,
+        locale,
+        batch_size,
+        connections,
+        rate,
+        limit,
+        checkpoint_path,
+        restart,
+        dry_run,
+    ):
+        """
+        Send the confirmation or password reset email to a cohort of accounts.
+        """
+        from accounts.campaign import Checkpoint, MailCampaign
+
+        for name in ("MAIL_DEFAULT_SENDER", "SITE_URL"):
+            if not app.config[name]:
+                raise click.ClickException(f"`{name}` is not set.")
+
+        checkpoint = Checkpoint(
+            checkpoint_path
+            or os.path.join(app.instance_path, f"mail-campaign-{kind}.json"),
+            cohort={
+                "kind": kind,
+                "created_after": created_after and created_after.isoformat(),
+                "created_before": created_before and created_before.isoformat(),
+            },
+        )
+
+        if not restart:
+            try:
+                if checkpoint.load():
+                    click.secho(
+                        f"Resuming from {checkpoint.path}: {checkpoint.sent} sent, "
+                        f"{checkpoint.failed} failed.",
+                        fg="cyan",
+                    )
+            except ValueError as e:
+                raise click.ClickException(f"{e}, use --restart.")
+
+        if checkpoint.done:
+            click.secho("The campaign is complete, use --restart.", fg="green")
+            return
+
+        campaign = MailCampaign(
+            app,
+            db.engine,
+            kind,
+            checkpoint,
+            created_after=created_after,
+            created_before=created_before,
+            locale=locale,
+            batch_size=batch_size or app.config["MAIL_CAMPAIGN_BATCH_SIZE"],
+            connections=connections or app.config["MAIL_CAMPAIGN_CONNECTIONS"],
+            rate=rate if rate is not None else app.config["MAIL_CAMPAIGN_RATE"],
+            echo=lambda message: click.secho(message, fg="cyan"),
+        )
+
+        if dry_run:
+            click.secho(f"{campaign.count()} account(s) left.", fg="green")
+            return
+
+        result = campaign.run(limit=limit)
+
+        click.secho(
+            f"✔ Sent {result['sent']} email(s), {result['failed']} failed, "
+            f"in {result['elapsed']:.1f}s.",
+            fg="green",
+        )
+
+    @app.cli.command("audit-log")
+    @click.option("--since", type=click.DateTime(), help="Oldest event time.")
+    @click.option(
+        "--until", type=click.DateTime(), help="Time before the newest event."
+    )
+    @click.option("--event", default=None, help="Event name, e.g. login_failed.")
+    @click.option("--user", default=None, help="User id or username.")
+    @click.option("--limit", default=100, help="Maximum number of events.")
+    @click.option("--json", "as_json", is_flag=True, help="Print the events as JSONL.")
+    def audit_log(since, until, event, user, limit, as_json):
+        """
+        Show the audit log events, oldest first.
+        """
+        import json
+
+        audit = app.extensions.get("audit_log")
+
+        if audit is None:
+            raise click.ClickException("The audit log is disabled, set AUDIT_BACKEND.")
+
+        # Include the events still buffered by this process.
+        audit.flush()
+
+        events = audit.sink.query(
+            since=since, until=until, event=event, user=user, limit=limit
+        )
+
+        for item in events:
+            if as_json:
+                click.echo(json.dumps(item, default=str))
+                continue
+
+            click.echo(
+                f"{item['created_at']:%Y-%m-%d %H:%M:%S}  {item['event']:<18}"
+                f"{item['username'] or item['user_id'] or '-':<38}"
+                f"{item['ip_address'] or '-':<16}"
+                + " ".join(f"{key}={value}" for key, value in item["data"].items())
+            )
+
+    @app.cli.command("build-assets")
+    @click.option("--skip-icons", is_flag=True, help="Don't download Bootstrap Icons.")
+    @click.option("--clean", is_flag=True, help="Remove the previous build first.")
+    def build_assets(skip_icons, clean):
+        """
+        Vendor, fingerprint and precompress the static assets.
+        """
+        import shutil
+
+        from requests import RequestException
+
+        from accounts.assets import AssetBuilder
+
+        output_dir = app.config["ASSETS_BUILD_DIR"]
+
+        if clean:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+        os.makedirs(output_dir, exist_ok=True)
+
+        builder = AssetBuilder(
+            app, output_dir, echo=lambda message: click.secho(message, fg="cyan")
+        )
+        builder.collect_static()
+        builder.collect_bootstrap()
+
+        if not skip_icons:
+            try:
+                builder.collect_icons()
+            except RequestException as e:
+                click.secho(
+                    f"Bootstrap Icons not vendored, keeping the CDN link: {e}",
+                    fg="yellow",
+                )
+
+        manifest = builder.build()
+        total = sum(
+            len(manifest[endpoint]) for endpoint in ("static", "bootstrap.static")
+        )
+
+        click.secho(f"✔ Built {total} asset(s) into {output_dir}.", fg="green")
+
+    @app.cli.command("loadtest")
+    @click.option("--url", default=None, help="Base URL of a running server.")
+    @click.option("-c", "--concurrency", default=10, help="Concurrent virtual users.")
+    @click.option("-r", "--rate", type=float, default=None, help="Target requests/s.")
+    @click.option("-d", "--duration", default=30.0, help="Duration in seconds.")
+    @click.option(
+        "--mix", default=None, help="Scenario weights, e.g. login=20,browse=80."
+    )
+    @click.option(
+        "--username", default=None, help="Login username (default: test user)."
+    )
+    @click.option("--password", default=None, help="Login password.")
+    @click.option(
+        "--no-ratelimit", is_flag=True, help="Disable the limiter in-process."
+    )
+    @click.option("--json", "as_json", is_flag=True, help="Print the report as JSON.")
+    def loadtest(
+        url, concurrency, rate, duration, mix, username, password, no_ratelimit, as_json
+    ):
+        """
+        Drive mixed traffic against the application and report latencies.
+        """
+        import json
+
+        from accounts.extensions import limiter
+        from accounts.loadtest import DEFAULT_MIX, run_load_test
+
+        credentials = {}
+
+        if username:
+            credentials.update(username=username, password=password or "")
+
+        if no_ratelimit and not url:
+            limiter.enabled = False
+
+        try:
+            report, elapsed = run_load_test(
+                app,
+                url=url,
+                concurrency=concurrency,
+                rate=rate,
+                duration=duration,
+                mix=mix or DEFAULT_MIX,
+                credentials=credentials,
+            )
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--mix")
+
+        if as_json:
+            click.echo(json.dumps({"elapsed": elapsed, "endpoints": report}, indent=2))
+            return
+
+        total = sum(item["requests"] for item in report.values())
+
+        click.secho(
+            f"{'Endpoint':<30}{'Requests':>10}{'Req/s':>9}{'p50 ms':>10}"
+            f"{'p95 ms':>10}{'p99 ms':>10}{'Errors':>8}{'429':>6}",
+            bold=True,
+        )
+
+        for endpoint, item in report.items():
+            click.echo(
+                f"{endpoint:<30}{item['requests']:>10}{item['throughput']:>9.1f}"
+                f"{item['p50_ms']:>10.1f}{item['p95_ms']:>10.1f}{item['p99_ms']:>10.1f}"
+                f"{item['errors']:>8}{item['rate_limited']:>6}"
+            )
+
+        click.secho(
+            f"\n✔ {total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s).",
+            fg="green",
+        )
+
+    @app.cli.command("profile-startup")
+    @click.option(
+        "--config",
+        "config_type",
+        default=lambda: os.getenv("FLASK_ENV") or "development",
+        help="Configuration to create the application with (default: FLASK_ENV).",
+    )
+    @click.option("--top", default=20, help="Number of slowest imports shown.")
+    @click.option(
+        "--sort",
+        type=click.Choice(["cumulative", "self"]),
+        default="cumulative",
+        help="Import time the modules are sorted by.",
+    )
+    @click.option("--json", "as_json", is_flag=True, help="Print the profile as JSON.")
+    def profile_startup(config_type, top, sort, as_json):
+        """
+        Profile the imports and the `create_app` steps of a new worker.
+        """
+        import json
+
+        from accounts.startup import profile_startup
+
+        try:
+            profile = profile_startup(config_type, cwd=os.path.dirname(app.root_path))
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+
+        if as_json:
+            click.echo(json.dumps(profile, indent=2))
+            return
+
+        imports = sorted(
+            profile["imports"], key=lambda item: item[sort + "_ms"], reverse=True
+        )
+
+        click.secho(f"{'Module':<48}{'Self ms':>10}{'Cumul. ms':>11}", bold=True)
+
+        for item in imports[:top]:
+            click.echo(
+                f"{item['module'].strip():<48}{item['self_ms']:>10.1f}"
+                f"{item['cumulative_ms']:>11.1f}"
+            )
+
+        click.secho(f"\n{'create_app step':<48}{'ms':>10}{'RSS MiB':>11}", bold=True)
+
+        for step in sorted(profile["steps"], key=lambda item: item["ms"], reverse=True):
+            click.echo(f"{step['step']:<48}{step['ms']:>10.1f}{step['rss_mb']:>11.1f}")
+
+        click.secho(
+            f"\n✔ Imports {profile['import_ms']:.0f} ms, create_app "
+            f"{profile['create_app_ms']:.0f} ms, boot {profile['boot_ms']:.0f} ms, "
+            f"RSS {profile['rss_before_mb']:.1f} -> {profile['rss_mb']:.1f} MiB.",
+            fg="green",
+        )
+
+    @app.cli.command("profiler")
+    @click.option("--enable/--disable", default=None, help="Profile the requests.")
+    @click.option("--rate", type=float, default=None, help="Fraction profiled.")
+    @click.option("--threshold", type=float, default=None, help="Minimum ms kept.")
+    @click.option("--reset", is_flag=True, help="Back to the configuration.")
+    def profiler(enable, rate, threshold, reset):
+        """
+        Show or change the settings of the request profiler at runtime.
+        """
+        from accounts.profiler import (
+            CONTROL_FILE,
+            ProfilerControl,
+            ProfilerSettings,
+            get_rate,
+        )
+
+        directory = app.config.get("PROFILER_DIR")
+
+        if not directory:
+            raise click.ClickException(
+                "The profiler is not installed, set PROFILER_DIR."
+            )
+
+        if rate is not None and not 0 <= rate <= 1:
+            raise click.BadParameter("Must be between 0 and 1.", param_hint="--rate")
+
+        control = ProfilerControl(
+            os.path.join(directory, CONTROL_FILE),
+            ProfilerSettings(
+                enabled=app.config["PROFILER_ENABLED"],
+                sample_rate=get_rate(app.config["PROFILER_SAMPLE_RATE"]),
+                threshold_ms=app.config["PROFILER_THRESHOLD_MS"],
+            ),
+        )
+
+        if reset and os.path.exists(control.path):
+            os.remove(control.path)
+
+        settings = control.load()
+        changes = {
+            name: value
+            for name, value in (
+                ("enabled", enable),
+                ("sample_rate", rate),
+                ("threshold_ms", threshold),
+            )
+            if value is not None
+        }
+
+        if changes:
+            settings = settings._replace(**changes)
+            control.save(settings)
+
+        click.secho(
+            f"Profiler {'enabled' if settings.enabled else 'disabled'}: "
+            f"{settings.rate:.1%} of the requests, kept over "
+            f"{settings.threshold_ms:g} ms, in {directory}.",
+            fg="green" if settings.enabled else "cyan",
+        )
@@ -0,0 +1,208 @@
+"""
+Response compression for the rendered pages.
+
+Responses with an allowed content type and a body of at least
+`COMPRESS_MIN_SIZE` bytes are compressed with the best encoding the client
+accepts (brotli when installed, then gzip). Streamed responses are compressed
+chunk by chunk and flushed after every chunk, so streaming still reaches
+the client incrementally.
+
+Compressing a secret next to attacker-controlled input in the same body
+leaks the secret through the compressed size (BREACH). The responses that
+carry a CSRF token or set cookies are therefore sent uncompressed unless
+`COMPRESS_SECRET_RESPONSES` is set, at the cost of the compression of
+most pages with a form.
+"""
+
+import zlib
+import typing as t
+
+from flask import Flask, Response, current_app, g, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class GzipCompressor:
+    """
+    Incremental gzip compressor.
+    """
+
+    def __init__(self, level: int):
+        # `16 + MAX_WBITS` writes the gzip header and trailer.
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+    """
+    Incremental brotli compressor.
+    """
+
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+COMPRESSORS = {"br": BrotliCompressor, "gzip": GzipCompressor}
+
+
+def get_supported_encodings(config) -> t.List[str]:
+    """
+    Returns the configured encodings available in this environment, by preference.
+    """
+    return [
+        encoding
+        for encoding in config["COMPRESS_ALGORITHMS"]
+        if encoding in COMPRESSORS and (encoding != "br" or brotli is not None)
+    ]
+
+
+def get_compression_level(config, encoding: str) -> int:
+    return config["COMPRESS_BR_LEVEL" if encoding == "br" else "COMPRESS_GZIP_LEVEL"]
+
+
+def select_encoding(accept_encodings, encodings: t.List[str]) -> t.Optional[str]:
+    """
+    Returns the encoding with the highest client quality, ties broken by our
+    preference order, or `None` if the client accepts none of them.
+    """
+    best, best_quality = None, 0
+
+    for encoding in encodings:
+        quality = accept_encodings[encoding]
+
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+
+    return best
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    """
+    Compress a complete body.
+    """
+    compressor = COMPRESSORS[encoding](level)
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_stream(
+    chunks: t.Iterable[bytes], encoding: str, level: int
+) -> t.Iterator[bytes]:
+    """
+    Compress a streamed body, flushing the compressor after every chunk.
+    """
+    compressor = COMPRESSORS[encoding](level)
+
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush()
+
+        if data:
+            yield data
+
+    yield compressor.finish()
+
+
+def is_compressible(response: Response, config) -> bool:
+    """
+    Checks whether the response may be compressed, whatever the client accepts.
+    """
+    return not (
+        response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in config["COMPRESS_MIMETYPES"]
+        or response.cache_control.no_transform
+    )
+
+
+def carries_secrets(response: Response) -> bool:
+    """
+    Checks whether the response sets cookies or rendered a CSRF token.
+    """
+    if "Set-Cookie" in response.headers:
+        return True
+
+    # Flask-WTF keeps the token generated for the request in `g`.
+    return current_app.config.get("WTF_CSRF_FIELD_NAME", "csrf_token") in g
+
+
+def compress_response(response: Response, config) -> Response:
+    """
+    Compress the response body in place for the current request, if eligible.
+    """
+    if not is_compressible(response, config):
+        return response
+
+    if not config["COMPRESS_SECRET_RESPONSES"] and carries_secrets(response):
+        return response
+
+    # The body depends on `Accept-Encoding` even when sent uncompressed.
+    response.vary.add("Accept-Encoding")
+
+    if request.method == "HEAD":
+        return response
+
+    if not response.is_streamed and response.content_length is not None:
+        if response.content_length < config["COMPRESS_MIN_SIZE"]:
+            return response
+
+    encoding = select_encoding(
+        request.accept_encodings, get_supported_encodings(config)
+    )
+
+    if encoding is None:
+        return response
+
+    level = get_compression_level(config, encoding)
+
+    if response.is_streamed:
+        chunks = response.iter_encoded()
+        original = response.response
+
+        response.response = compress_stream(chunks, encoding, level)
+
+        if hasattr(original, "close"):
+            response.call_on_close(original.close)
+
+        response.headers.pop("Content-Length", None)
+    else:
+        response.set_data(compress(response.get_data(), encoding, level))
+
+    response.headers["Content-Encoding"] = encoding
+
+    etag, weak = response.get_etag()
+
+    if etag:
+        response.set_etag("%s-%s" % (etag, encoding), weak=weak)
+
+    return response
+
+
+def init_compression(app: Flask):
+    """
+    Compress the eligible responses of the application.
+    """
+
+    @app.after_request
+    def compress_after_request(response: Response) -> Response:
+        return compress_response(response, app.config)
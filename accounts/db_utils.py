@@ -0,0 +1,426 @@
+import uuid
+import typing as t
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy import BINARY, Integer, LargeBinary, MetaData, String
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.types import TypeDecorator, TypeEngine
+
+# Allowed values for the `SQLite` pragmas set from the configuration.
+SQLITE_JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+SQLITE_SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+SQLITE_TRANSACTION_MODES = ("DEFERRED", "IMMEDIATE", "EXCLUSIVE")
+
+
+def get_sqlite_pragmas(config: t.Mapping[str, t.Any]) -> t.List[t.Tuple[str, t.Any]]:
+    """
+    Build the list of `PRAGMA` statements for the high-concurrency SQLite profile.
+
+    :param config: The application configuration mapping.
+
+    :return: A list of `(pragma, value)` pairs in the order they are applied.
+
+    :raises ValueError: If a configured value is not supported by SQLite.
+    """
+    journal_mode = str(config["SQLITE_JOURNAL_MODE"]).upper()
+    synchronous = str(config["SQLITE_SYNCHRONOUS"]).upper()
+
+    if journal_mode not in SQLITE_JOURNAL_MODES:
+        raise ValueError("Invalid SQLite journal mode: '%s'" % journal_mode)
+
+    if synchronous not in SQLITE_SYNCHRONOUS_MODES:
+        raise ValueError("Invalid SQLite synchronous mode: '%s'" % synchronous)
+
+    return [
+        ("journal_mode", journal_mode),
+        ("synchronous", synchronous),
+        ("busy_timeout", int(config["SQLITE_BUSY_TIMEOUT"])),
+        ("mmap_size", int(config["SQLITE_MMAP_SIZE"])),
+        ("cache_size", int(config["SQLITE_CACHE_SIZE"])),
+    ]
+
+
+def configure_sqlite_engine(engine: Engine, config: t.Mapping[str, t.Any]) -> None:
+    """
+    Apply the high-concurrency profile to a `SQLite` engine.
+
+    The pragmas are set on every new DBAPI connection through the engine
+    `connect` event. Reads keep running outside of an explicit transaction,
+    while the transaction that the driver opens before a write uses the
+    configured mode (`BEGIN IMMEDIATE` by default), so a writer waits for
+    the busy timeout instead of failing with "database is locked" when it
+    has to upgrade a read lock.
+
+    :param engine: The SQLAlchemy engine to configure.
+    :param config: The application configuration mapping.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    pragmas = get_sqlite_pragmas(config)
+    transaction_mode = str(config["SQLITE_TRANSACTION_MODE"]).upper()
+
+    if transaction_mode not in SQLITE_TRANSACTION_MODES:
+        raise ValueError("Invalid SQLite transaction mode: '%s'" % transaction_mode)
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+
+        try:
+            for pragma, value in pragmas:
+                cursor.execute("PRAGMA %s=%s" % (pragma, value))
+        finally:
+            cursor.close()
+
+        # The implicit `BEGIN` issued by the driver before DML statements.
+        dbapi_connection.isolation_level = transaction_mode
+
+
+class UUIDType(TypeDecorator):
+    """
+    A compact `UUID` column type.
+
+    Stored as the native `uuid` type on PostgreSQL and as a 16-byte binary
+    value on other databases (a `BLOB` on SQLite). Values are exchanged
+    with the application as canonical strings, so code that treats ids as
+    strings (sessions, url parameters, comparisons) keeps working.
+    """
+
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=False))
+
+        if dialect.name == "sqlite":
+            return dialect.type_descriptor(LargeBinary(16))
+
+        return dialect.type_descriptor(BINARY(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+
+        if not isinstance(value, uuid.UUID):
+            try:
+                value = uuid.UUID(str(value))
+            except ValueError:
+                # A malformed id (e.g. an old integer session id) matches
+                # no row instead of failing the request.
+                return None
+
+        if dialect.name == "postgresql":
+            return str(value)
+
+        return value.bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return str(uuid.UUID(bytes=bytes(value)))
+
+        return str(value)
+
+
+def get_id_type(key_type: str = "string") -> TypeEngine:
+    """
+    Returns the column type used for primary and foreign keys.
+
+    :param key_type: Either `string` (36 char `uuid4` text) or `uuid7` (compact UUID).
+
+    :raises ValueError: If the key type is not supported.
+    """
+    if key_type == "uuid7":
+        return UUIDType()
+
+    if key_type == "string":
+        return String(36)
+
+    raise ValueError("Invalid primary key type: '%s'" % key_type)
+
+
+class PrimaryKeyConverter:
+    """
+    Converts the `String(36)` primary and foreign keys to native `uuid`
+    columns on PostgreSQL without long table locks.
+
+    The conversion runs in three phases, each one resumable:
+
+    - `prepare`: adds a nullable shadow `uuid` column next to each key column
+      and a trigger that keeps it in sync for rows written by the running app.
+    - `backfill`: fills the shadow columns in small committed batches, then
+      builds the unique index and the not-null checks concurrently.
+    - `finalize`: swaps the columns in one short transaction and re-adds the
+      foreign keys as `NOT VALID`, validating them afterwards without
+      blocking writes.
+
+    Existing `uuid4` values are kept as they are; only new rows get
+    time-ordered ids once `PRIMARY_KEY_TYPE=uuid7` is deployed.
+    """
+
+    suffix = "__uuid"
+
+    def __init__(
+        self,
+        engine: Engine,
+        metadata: MetaData,
+        batch_size: int = 5000,
+        lock_timeout: str = "5s",
+        echo: t.Callable[[str], t.Any] = print,
+    ):
+        if engine.dialect.name != "postgresql":
+            raise ValueError(
+                "Online primary key conversion is only supported on PostgreSQL."
+            )
+
+        self.engine = engine
+        self.metadata = metadata
+        self.batch_size = batch_size
+        self.lock_timeout = lock_timeout
+        self.echo = echo
+        self.quote = engine.dialect.identifier_preparer.quote
+
+    @property
+    def key_columns(self) -> t.Dict[str, t.List[str]]:
+        """
+        Mapping of table names to their primary and foreign key column names.
+        Integer keys (e.g. the audit log's) are left as they are.
+        """
+        columns = {}
+
+        for table in self.metadata.sorted_tables:
+            names = [
+                c.name
+                for c in table.columns
+                if (c.primary_key or c.foreign_keys) and not isinstance(c.type, Integer)
+            ]
+
+            if names:
+                columns[table.name] = names
+
+        return columns
+
+    def _shadow(self, column: str) -> str:
+        return self.quote(column + self.suffix)
+
+    def _trigger_name(self, table: str) -> str:
+        return self.quote("%s_sync%s" % (table, self.suffix))
+
+    def _set_lock_timeout(self, connection: Connection):
+        connection.execute(text("SET LOCAL lock_timeout = '%s'" % self.lock_timeout))
+
+    def prepare(self):
+        for table, columns in self.key_columns.items():
+            name = self.quote(table)
+            assignments = " ".join(
+                "NEW.%s := NEW.%s::uuid;" % (self._shadow(c), self.quote(c))
+                for c in columns
+            )
+
+            with self.engine.begin() as connection:
+                self._set_lock_timeout(connection)
+
+                for column in columns:
+                    connection.execute(
+                        text(
+                            "ALTER TABLE %s ADD COLUMN IF NOT EXISTS %s uuid"
+                            % (name, self._shadow(column))
+                        )
+                    )
+
+                connection.execute(
+                    text(
+                        "CREATE OR REPLACE FUNCTION %s() RETURNS trigger AS $$ "
+                        "BEGIN %s RETURN NEW; END; $$ LANGUAGE plpgsql"
+                        % (self._trigger_name(table), assignments)
+                    )
+                )
+                connection.execute(
+                    text(
+                        "DROP TRIGGER IF EXISTS %s ON %s"
+                        % (self._trigger_name(table), name)
+                    )
+                )
+                connection.execute(
+                    text(
+                        "CREATE TRIGGER %s BEFORE INSERT OR UPDATE ON %s "
+                        "FOR EACH ROW EXECUTE FUNCTION %s()"
+                        % (self._trigger_name(table), name, self._trigger_name(table))
+                    )
+                )
+
+            self.echo("Prepared table '%s'." % table)
+
+    def backfill(self):
+        for table, columns in self.key_columns.items():
+            name = self.quote(table)
+            assignments = ", ".join(
+                "%s = %s::uuid" % (self._shadow(c), self.quote(c)) for c in columns
+            )
+            statement = text(
+                "UPDATE %s SET %s WHERE ctid IN "
+                "(SELECT ctid FROM %s WHERE %s IS NULL LIMIT :limit)"
+                % (name, assignments, name, self._shadow("id"))
+            )
+
+            total = 0
+
+            while True:
+                with self.engine.begin() as connection:
+                    updated = connection.execute(
+                        statement, {"limit": self.batch_size}
+                    ).rowcount
+
+                total += updated
+
+                if updated < self.batch_size:
+                    break
+
+                self.echo("Backfilled %d rows of table '%s'." % (total, table))
+
+            self.echo("Backfilled table '%s' (%d rows)." % (table, total))
+
+            # `CONCURRENTLY` can't run inside a transaction block.
+            with self.engine.connect().execution_options(
+                isolation_level="AUTOCOMMIT"
+            ) as connection:
+                connection.execute(
+                    text(
+                        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS %s ON %s (%s)"
+                        % (
+                            self.quote("%s_id%s_key" % (table, self.suffix)),
+                            name,
+                            self._shadow("id"),
+                        )
+                    )
+                )
+
+                for column in columns:
+                    check = self.quote(
+                        "%s_%s%s_not_null" % (table, column, self.suffix)
+                    )
+                    exists = connection.execute(
+                        text("SELECT 1 FROM pg_constraint WHERE conname = :name"),
+                        {"name": check.strip('"')},
+                    ).scalar()
+
+                    if not exists:
+                        connection.execute(
+                            text(
+                                "ALTER TABLE %s ADD CONSTRAINT %s "
+                                "CHECK (%s IS NOT NULL) NOT VALID"
+                                % (name, check, self._shadow(column))
+                            )
+                        )
+
+                    connection.execute(
+                        text("ALTER TABLE %s VALIDATE CONSTRAINT %s" % (name, check))
+                    )
+
+    def finalize(self):
+        inspector = inspect(self.engine)
+        key_columns = self.key_columns
+
+        foreign_keys = [
+            (table, fk)
+            for table in key_columns
+            for fk in inspector.get_foreign_keys(table)
+        ]
+
+        with self.engine.begin() as connection:
+            self._set_lock_timeout(connection)
+
+            for table, fk in foreign_keys:
+                connection.execute(
+                    text(
+                        "ALTER TABLE %s DROP CONSTRAINT %s"
+                        % (self.quote(table), self.quote(fk["name"]))
+                    )
+                )
+
+            for table, columns in key_columns.items():
+                name = self.quote(table)
+
+                connection.execute(
+                    text(
+                        "DROP TRIGGER IF EXISTS %s ON %s"
+                        % (self._trigger_name(table), name)
+                    )
+                )
+                connection.execute(
+                    text("DROP FUNCTION IF EXISTS %s()" % self._trigger_name(table))
+                )
+
+                for column in columns:
+                    check = self.quote(
+                        "%s_%s%s_not_null" % (table, column, self.suffix)
+                    )
+
+                    connection.execute(
+                        text(
+                            "ALTER TABLE %s DROP COLUMN %s" % (name, self.quote(column))
+                        )
+                    )
+                    connection.execute(
+                        text(
+                            "ALTER TABLE %s RENAME COLUMN %s TO %s"
+                            % (name, self._shadow(column), self.quote(column))
+                        )
+                    )
+                    # Uses the validated check constraint, so no table scan.
+                    connection.execute(
+                        text(
+                            "ALTER TABLE %s ALTER COLUMN %s SET NOT NULL"
+                            % (name, self.quote(column))
+                        )
+                    )
+                    connection.execute(
+                        text("ALTER TABLE %s DROP CONSTRAINT %s" % (name, check))
+                    )
+
+                connection.execute(
+                    text(
+                        "ALTER TABLE %s ADD CONSTRAINT %s PRIMARY KEY USING INDEX %s"
+                        % (
+                            name,
+                            self.quote("%s_pkey" % table),
+                            self.quote("%s_id%s_key" % (table, self.suffix)),
+                        )
+                    )
+                )
+
+            for table, fk in foreign_keys:
+                ondelete = (fk.get("options") or {}).get("ondelete")
+
+                connection.execute(
+                    text(
+                        "ALTER TABLE %s ADD CONSTRAINT %s FOREIGN KEY (%s) "
+                        "REFERENCES %s (%s)%s NOT VALID"
+                        % (
+                            self.quote(table),
+                            self.quote(fk["name"]),
+                            ", ".join(self.quote(c) for c in fk["constrained_columns"]),
+                            self.quote(fk["referred_table"]),
+                            ", ".join(self.quote(c) for c in fk["referred_columns"]),
+                            " ON DELETE %s" % ondelete if ondelete else "",
+                        )
+                    )
+                )
+
+        self.echo("Swapped key columns to `uuid`.")
+
+        for table, fk in foreign_keys:
+            with self.engine.begin() as connection:
+                connection.execute(
+                    text(
+                        "ALTER TABLE %s VALIDATE CONSTRAINT %s"
+                        % (self.quote(table), self.quote(fk["name"]))
+                    )
+                )
+
+        self.echo("Validated %d foreign key(s)." % len(foreign_keys))
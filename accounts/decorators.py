@@ -8,7 +8,7 @@ from flask_babel import lazy_gettext as _
 def guest_user_exempt(func):
     """
     Decorator to restrict access for authenticated users
-    who are `Test User` to read-only access.
+    who are guests or the `Test User` to read-only access.
     """
 
     @wraps(func)
@@ -16,11 +16,31 @@ def guest_user_exempt(func):
         if (
             current_user.is_authenticated
             and not request.method == "GET"
-            and current_user.username == current_app.config["TEST_USER_USERNAME"]
+            and (current_user.is_guest or current_user.is_test_user)
         ):
             flash(_("Guest user limited to read-only access."), "error")
             return redirect(url_for("accounts.index"))
-        return func(*args, **kwargs)
+        return current_app.ensure_sync(func)(*args, **kwargs)
+
+    return decorator
+
+
+def test_user_exempt(func):
+    """
+    Decorator to restrict access for authenticated users
+    who are the `Test User` to read-only access.
+    """
+
+    @wraps(func)
+    def decorator(*args, **kwargs):
+        if (
+            current_user.is_authenticated
+            and not request.method == "GET"
+            and current_user.is_test_user
+        ):
+            flash(_("Guest user limited to read-only access."), "error")
+            return redirect(url_for("accounts.index"))
+        return current_app.ensure_sync(func)(*args, **kwargs)
 
     return decorator
 
@@ -34,6 +54,6 @@ def authentication_redirect(func):
     def decorator_func(*args, **kwargs):
         if current_user.is_authenticated:
             return redirect(url_for("accounts.index"))
-        return func(*args, **kwargs)
+        return current_app.ensure_sync(func)(*args, **kwargs)
 
     return decorator_func
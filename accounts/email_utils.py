@@ -1,25 +1,172 @@
 import os
 import click
+import threading
 import typing as t
 
+from concurrent.futures import Future, ThreadPoolExecutor
 from smtplib import SMTPException
 from werkzeug.exceptions import ServiceUnavailable
 
-from flask import current_app, render_template, url_for
+from flask import Flask, current_app, render_template, url_for
 from flask_mail import Message
 
 from accounts.extensions import mail
 from accounts.models import User
-from accounts.utils import get_full_url
+from accounts.signals import email_sent
+from accounts.utils import get_full_url, get_limiter_storage
 
 
-def send_mail(subject: t.AnyStr, recipients: t.List[str], body: t.Text):
+class MailDispatcher:
+    """
+    Sends emails from a small per-process thread pool, so the request
+    doesn't wait for the SMTP round trip.
+
+    :param workers: Number of threads sending emails.
+    """
+
+    def __init__(self, workers: int = 2):
+        self.workers = workers
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._executor: t.Optional[ThreadPoolExecutor] = None
+        self._pid = None
+
+    def get_executor(self) -> ThreadPoolExecutor:
+        # A forked worker doesn't inherit the threads, start a new pool.
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix="mail"
+                    )
+                    self._pid = os.getpid()
+
+        return self._executor
+
+    def submit(self, app: Flask, message: Message) -> Future:
+        """
+        Send a message in the background, the failures are logged.
+
+        :return: A future of whether the message was sent.
+        """
+
+        def deliver() -> bool:
+            with app.app_context():
+                try:
+                    deliver_message(message)
+                except Exception:
+                    app.logger.exception(
+                        "Failed to send '%s' to %s", message.subject, message.recipients
+                    )
+                    return False
+
+            return True
+
+        return self.get_executor().submit(deliver)
+
+    def close(self):
+        """
+        Wait for the queued emails, and stop the threads.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+# Email threads of this process, the queued emails are sent before it exits.
+mail_dispatcher = MailDispatcher()
+
+
+class EmailCooldown:
+    """
+    Minimum delay between two emails of a kind to the same user, tracked
+    in the storage backend of the rate limiter.
+
+    :param seconds: The cooldown, in seconds.
+    :param prefix: Prefix of the storage keys.
+    """
+
+    def __init__(self, seconds: float = 60, prefix: str = "email-cooldown"):
+        self.seconds = seconds
+        self.prefix = prefix
+        self.storage = None
+
+    def acquire(self, kind: str, user_id) -> bool:
+        """
+        Start the cooldown of an email to the user.
+
+        :return: `False` if the cooldown of a previous email is running.
+        """
+        if self.storage is None or not self.seconds:
+            return True
+
+        key = "%s/%s/%s" % (self.prefix, kind, user_id)
+
+        # The first increment of the window creates the key, atomically.
+        return self.storage.incr(key, max(1, int(self.seconds))) == 1
+
+    def release(self, kind: str, user_id):
+        """
+        End the cooldown of an email to the user, e.g. when it was not sent.
+        """
+        if self.storage is None:
+            return
+
+        self.storage.clear("%s/%s/%s" % (self.prefix, kind, user_id))
+
+
+# Resend cooldown of the confirmation emails.
+email_cooldown = EmailCooldown()
+
+
+def init_email_delivery(app: Flask, limiter):
+    """
+    Configure the background sending and the resend cooldown of the emails.
+    """
+    mail_dispatcher.enabled = app.config["MAIL_SEND_ASYNC"]
+    mail_dispatcher.workers = app.config["MAIL_SEND_WORKERS"]
+
+    email_cooldown.seconds = app.config["CONFIRMATION_RESEND_COOLDOWN"]
+    email_cooldown.storage = get_limiter_storage(app, limiter)
+
+
+def deliver_message(message: Message):
+    """
+    Sends a message using the Flask-Mail extension.
+
+    :raises ServiceUnavailable: If the SMTP service is unavailable.
+    """
+    try:
+        mail.connect()
+        mail.send(message)
+    except SMTPException:
+        email_sent.send(current_app._get_current_object(), result="failed")
+
+        raise ServiceUnavailable(
+            description=(
+                "The SMTP mail service is currently not available. "
+                "Please try later or contact the developers team."
+            )
+        )
+
+    email_sent.send(current_app._get_current_object(), result="sent")
+
+
+def send_mail(
+    subject: t.AnyStr,
+    recipients: t.List[str],
+    body: t.Text,
+    background: bool = False,
+) -> t.Optional[Future]:
     """
     Sends an email using the Flask-Mail extension.
 
     :param subject: The subject of the email.
     :param recipients: A list of recipient email addresses.
     :param body: The body content of the email.
+    :param background: Send it from the mail threads, without waiting.
 
     :raises ServiceUnavailable: If the SMTP service is unavailable.
     """
@@ -33,27 +180,29 @@ def send_mail(subject: t.AnyStr, recipients: t.List[str], body: t.Text):
 
     click.echo(message.body)
 
-    try:
-        mail.connect()
-        mail.send(message)
-    except SMTPException as e:
-        raise ServiceUnavailable(
-            description=(
-                "The SMTP mail service is currently not available. "
-                "Please try later or contact the developers team."
-            )
-        )
+    if background and mail_dispatcher.enabled:
+        return mail_dispatcher.submit(current_app._get_current_object(), message)
+
+    deliver_message(message)
 
 
-def send_confirmation_mail(user: User = None):
+def send_confirmation_mail(
+    user: User = None, background: bool = False
+) -> t.Optional[Future]:
     """
-    Sends an account verification email to the specified user.
+    Sends an account verification email to the specified user, with its
+    outstanding token if it is still valid for a while.
 
     :param user: The specified user for sending email.
+    :param background: Send it from the mail threads, without waiting.
+
+    :return: A future of whether it was sent, when sent in the background.
     """
     subject: str = "Verify Your Account"
 
-    token: str = user.generate_token(salt=current_app.config["SALT_ACCOUNT_CONFIRM"])
+    token: str = user.generate_token(
+        salt=current_app.config["SALT_ACCOUNT_CONFIRM"], reuse=True
+    )
 
     verification_link: str = get_full_url(
         url_for("accounts.confirm_account", token=token)
@@ -65,7 +214,9 @@ def send_confirmation_mail(user: User = None):
         verification_link=verification_link,
     )
 
-    send_mail(subject=subject, recipients=[user.email], body=context)
+    return send_mail(
+        subject=subject, recipients=[user.email], body=context, background=background
+    )
 
 
 def send_reset_password(user: User = None):
@@ -1,4 +1,3 @@
-from authlib.integrations.flask_client import OAuth
 from flask_bootstrap import Bootstrap5
 from flask_login import current_user, LoginManager
 from flask_limiter import Limiter
@@ -27,9 +26,6 @@ mail = Mail()
 # flask_migrate - Migration for database
 migrate = Migrate()
 
-# Oauth Client for Social Open Authenrication.
-oauth = OAuth()
-
 # Multi language support using Flask-Babel
 babel = Babel()
 
@@ -42,7 +38,7 @@ def __key_func() -> str:
         str: A unique key for the user or IP address.
     """
     if current_user.is_authenticated:
-        return f"user_id:{current_user.get_id()}"
+        return f"user_id:{current_user.id}"
     else:
         ip_address = get_remote_address()
         return f"ip:{ip_address}"
@@ -53,3 +49,15 @@ limiter = Limiter(
     key_func=__key_func,
     default_limits=["200 per day", "85 per hour", "20 per minute"],
 )
+
+
+def __getattr__(name: str):
+    # Oauth Client for Social Open Authenrication, created on first import:
+    # authlib (and requests) are only loaded by the web setup.
+    if name != "oauth":
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+    from authlib.integrations.flask_client import OAuth
+
+    oauth = globals()["oauth"] = OAuth()
+    return oauth
@@ -0,0 +1,331 @@
+"""
+A pool of pre-created guest accounts, one per visitor.
+
+"Login as Guest" claims a free guest account with a single conditional
+`UPDATE`, so every visitor gets an account of their own to edit. The pool
+is topped up in bulk by a background thread when it runs low, and the
+guests claimed more than `GUEST_LIFETIME` ago are wiped in place (names,
+profile, avatar, tokens) and returned to the pool, their sessions revoked.
+"""
+
+import secrets
+import threading
+import time
+import typing as t
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.engine import Engine
+
+from werkzeug.security import generate_password_hash
+
+from flask import Flask
+
+from accounts.models import ID_DEFAULT, OAuthProvider, Profile, User, UserSecurityToken
+from accounts.reaper import remove_files
+from accounts.signals import sessions_revoked
+from accounts.utils import get_upload_path
+
+# Rows of a guest removed when it is recycled.
+GUEST_RELATED_TABLES = (UserSecurityToken.__table__, OAuthProvider.__table__)
+
+
+class GuestPool:
+    """
+    Hands out, tops up and recycles the guest accounts.
+
+    :param app: The application, sender of the session revocations.
+    :param engine: The engine of the accounts database.
+    :param size: Free guests kept in the pool after a top-up.
+    :param minimum: Free guests under which the pool is topped up.
+    :param lifetime: Time a guest keeps its account before it's recycled.
+    :param interval: Minimum seconds between two maintenances, when the
+        pool is not running low.
+    :param batch_size: Guests created or recycled per transaction.
+    """
+
+    def __init__(
+        self,
+        app: Flask,
+        engine: Engine,
+        size: int = 50,
+        minimum: int = 10,
+        lifetime: timedelta = timedelta(days=1),
+        interval: float = 300,
+        batch_size: int = 500,
+    ):
+        self.app = app
+        self.engine = engine
+        self.size = size
+        self.minimum = minimum
+        self.lifetime = lifetime
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self.user = User.__table__
+        self.profile = Profile.__table__
+
+        self._password_hash = None
+        self._maintaining = threading.Lock()
+        self._maintained_at = None
+        # Free guests as of the last top-up, less this process' claims. The
+        # other workers claim too, `interval` bounds how stale it gets.
+        self._free = None
+
+    @property
+    def free(self) -> tuple:
+        return (self.user.c.is_guest.is_(True), self.user.c.guest_claimed_at.is_(None))
+
+    def _get_password_hash(self) -> str:
+        # Guests never log in with a password, they share one nobody knows.
+        if self._password_hash is None:
+            self._password_hash = generate_password_hash(secrets.token_urlsafe(32))
+
+        return self._password_hash
+
+    @staticmethod
+    def _get_identity() -> t.Dict[str, str]:
+        suffix = secrets.token_hex(6)
+
+        return {
+            "username": "guest-%s" % suffix,
+            "email": "guest-%s@guest.invalid" % suffix,
+        }
+
+    def count(self, limit: t.Optional[int] = None) -> int:
+        """
+        Returns the number of free guests, counting at most `limit`.
+        """
+        statement = select(self.user.c.id).where(*self.free)
+
+        if limit is not None:
+            statement = statement.limit(limit)
+
+        with self.engine.connect() as connection:
+            return connection.execute(
+                select(func.count()).select_from(statement.subquery())
+            ).scalar()
+
+    def create(self, count: int, claimed: bool = False) -> t.List[str]:
+        """
+        Create guest accounts (and their profiles) in bulk.
+
+        :param claimed: Create them already handed out.
+        :return: The IDs of the new guests.
+        """
+        claimed_at = datetime.now() if claimed else None
+        rows = [
+            dict(
+                self._get_identity(),
+                id=ID_DEFAULT(),
+                first_name="Guest",
+                last_name="User",
+                password=self._get_password_hash(),
+                active=True,
+                is_guest=True,
+                guest_claimed_at=claimed_at,
+            )
+            for _ in range(count)
+        ]
+
+        if not rows:
+            return []
+
+        with self.engine.begin() as connection:
+            connection.execute(insert(self.user), rows)
+            connection.execute(
+                insert(self.profile), [{"user_id": row["id"]} for row in rows]
+            )
+
+        return [row["id"] for row in rows]
+
+    def claim(self) -> t.Optional[str]:
+        """
+        Hand out a free guest, created on the spot if the pool is empty.
+
+        :return: The ID of the guest.
+        """
+        for _ in range(3):
+            with self.engine.begin() as connection:
+                guest_id = connection.execute(
+                    select(self.user.c.id)
+                    .where(*self.free)
+                    .limit(1)
+                    .with_for_update(skip_locked=True)
+                ).scalar()
+
+                if guest_id is None:
+                    break
+
+                # Conditional, a guest claimed concurrently is not handed out twice.
+                claimed = connection.execute(
+                    update(self.user)
+                    .where(self.user.c.id == guest_id, *self.free)
+                    .values(guest_claimed_at=datetime.now())
+                ).rowcount
+
+            if claimed:
+                if self._free is not None:
+                    self._free -= 1
+
+                self.schedule_maintenance()
+                return guest_id
+
+        self.schedule_maintenance(force=True)
+        return self.create(1, claimed=True)[0]
+
+    def recycle(self) -> int:
+        """
+        Wipe one batch of the guests claimed more than `lifetime` ago and
+        return them to the pool.
+
+        :return: The number of recycled guests.
+        """
+        cutoff = datetime.now() - self.lifetime
+
+        statement = (
+            select(self.user.c.id, self.user.c.session_epoch, self.profile.c.avatar)
+            .select_from(
+                self.user.outerjoin(
+                    self.profile, self.profile.c.user_id == self.user.c.id
+                )
+            )
+            .where(
+                self.user.c.is_guest.is_(True),
+                self.user.c.guest_claimed_at < cutoff,
+            )
+            .limit(self.batch_size)
+            .with_for_update(of=self.user, skip_locked=True)
+        )
+
+        with self.engine.begin() as connection:
+            rows = connection.execute(statement).all()
+            guest_ids = [row.id for row in rows]
+
+            if not guest_ids:
+                return 0
+
+            for table in GUEST_RELATED_TABLES:
+                connection.execute(delete(table).where(table.c.user_id.in_(guest_ids)))
+
+            connection.execute(
+                update(self.profile)
+                .where(self.profile.c.user_id.in_(guest_ids))
+                .values(bio="", avatar="")
+            )
+
+            # A new identity and session epoch, the previous visitor is logged out.
+            connection.execute(
+                update(self.user)
+                .where(self.user.c.id == bindparam("guest_id"))
+                .values(
+                    username=bindparam("username"),
+                    email=bindparam("email"),
+                    first_name="Guest",
+                    last_name="User",
+                    change_email="",
+                    session_epoch=self.user.c.session_epoch + 1,
+                    guest_claimed_at=None,
+                    last_login_at=None,
+                    last_seen_at=None,
+                    last_ip=None,
+                ),
+                [
+                    dict(self._get_identity(), guest_id=guest_id)
+                    for guest_id in guest_ids
+                ],
+            )
+
+        for row in rows:
+            sessions_revoked.send(self.app, user_id=row.id, epoch=row.session_epoch + 1)
+
+        paths = [get_upload_path(row.avatar, self.app.root_path) for row in rows]
+        remove_files([path for path in paths if path])
+
+        return len(guest_ids)
+
+    def refill(self) -> int:
+        """
+        Top the pool up to `size` free guests if it's under `minimum`.
+
+        :return: The number of created guests.
+        """
+        free = self.count(limit=self.size)
+
+        if free >= self.minimum:
+            self._free = free
+            return 0
+
+        created = 0
+
+        while created < self.size - free:
+            count = min(self.batch_size, self.size - free - created)
+            created += len(self.create(count))
+
+        self._free = free + created
+        return created
+
+    def maintain(self) -> t.Tuple[int, int]:
+        """
+        Recycle the expired guests, then top the pool up.
+
+        :return: The numbers of recycled and created guests.
+        """
+        recycled = 0
+
+        while True:
+            count = self.recycle()
+            recycled += count
+
+            if count < self.batch_size:
+                break
+
+        self._maintained_at = time.monotonic()
+        return recycled, self.refill()
+
+    def schedule_maintenance(self, force: bool = False):
+        """
+        Run the maintenance in a background thread, if it's due (or
+        `force`d) and not already running in this process. Doesn't query
+        the database, the pool running low is told by the cached count.
+        """
+        due = (
+            force
+            or self._maintained_at is None
+            or time.monotonic() - self._maintained_at >= self.interval
+            or self._free is None
+            or self._free < self.minimum
+        )
+
+        if not due or not self._maintaining.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.maintain()
+            except Exception:
+                self.app.logger.exception("Failed to maintain the guest pool")
+            finally:
+                self._maintaining.release()
+
+        threading.Thread(target=run, name="guest-pool", daemon=True).start()
+
+
+def init_guest_pool(app: Flask, db) -> GuestPool:
+    """
+    Create the guest pool of the application.
+    """
+    with app.app_context():
+        engine = db.engine
+
+    pool = GuestPool(
+        app,
+        engine,
+        size=app.config["GUEST_POOL_SIZE"],
+        minimum=app.config["GUEST_POOL_MIN"],
+        lifetime=timedelta(hours=app.config["GUEST_LIFETIME_HOURS"]),
+    )
+    app.extensions["guest_pool"] = pool
+
+    return pool
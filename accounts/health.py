@@ -0,0 +1,229 @@
+"""
+Liveness and readiness probes answered in front of the application.
+
+The probes are served by a WSGI middleware before Flask dispatches the
+request, so they skip the rate limiter, the session, the locale and theme
+hooks and the request metrics. `/healthz` only tells that the process
+answers; `/readyz` runs the configured checks (database, migrations, SMTP,
+rate limiter storage) and caches their result for `READYZ_CACHE_TTL`
+seconds, so a load balancer probing every worker doesn't load the database.
+"""
+
+import os
+import json
+import time
+import socket
+import threading
+import typing as t
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from flask import Flask
+
+# Readiness checks that can be enabled with `READYZ_CHECKS`.
+READINESS_CHECKS = ("database", "migrations", "smtp", "redis")
+
+_PLAIN_HEADERS = [("Content-Type", "text/plain"), ("Cache-Control", "no-store")]
+_JSON_HEADERS = [("Content-Type", "application/json"), ("Cache-Control", "no-store")]
+
+
+def get_readiness_checks(value: str) -> t.List[str]:
+    """
+    Parse the comma separated `READYZ_CHECKS` setting.
+
+    :raises ValueError: If a check is not supported.
+    """
+    checks = [name.strip().lower() for name in value.split(",") if name.strip()]
+
+    for name in checks:
+        if name not in READINESS_CHECKS:
+            raise ValueError("Invalid readiness check: '%s'" % name)
+
+    return checks
+
+
+class ReadinessProbe:
+    """
+    Runs the readiness checks and caches the result.
+
+    :param engine: The engine of the accounts database.
+    :param checks: The names of the checks to run, see `READINESS_CHECKS`.
+    :param ttl: Seconds the result of the checks is reused.
+    :param timeout: Timeout of the network checks, in seconds.
+    :param migrations_dir: The Alembic migrations directory, if any.
+    :param smtp_address: The `(host, port)` of the mail server.
+    :param storage: The rate limiter storage backend.
+    :param logger: Logger receiving the reasons of the failed checks.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        checks: t.Sequence[str] = ("database",),
+        ttl: float = 5,
+        timeout: float = 2,
+        migrations_dir: t.Optional[str] = None,
+        smtp_address: t.Optional[t.Tuple[str, int]] = None,
+        storage=None,
+        logger=None,
+    ):
+        self.engine = engine
+        self.checks = list(checks)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.smtp_address = smtp_address
+        self.storage = storage
+        self.logger = logger
+        self.heads = self._get_migration_heads(migrations_dir)
+
+        self._lock = threading.Lock()
+        self._result: t.Optional[t.Tuple[bool, bytes]] = None
+        self._expires_at = 0.0
+
+    @staticmethod
+    def _get_migration_heads(directory: t.Optional[str]) -> t.Optional[t.Set[str]]:
+        # Read once, the migration scripts don't change in a running process.
+        if not directory or not os.path.isdir(os.path.join(directory, "versions")):
+            return None
+
+        from alembic.script import ScriptDirectory
+
+        return set(ScriptDirectory(directory).get_heads())
+
+    def check_database(self):
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    def check_migrations(self):
+        if self.heads is None:
+            return "skipped"
+
+        with self.engine.connect() as connection:
+            current = set(
+                connection.execute(text("SELECT version_num FROM alembic_version"))
+                .scalars()
+                .all()
+            )
+
+        if current != self.heads:
+            raise RuntimeError(
+                "Database at %s, migrations at %s"
+                % (", ".join(sorted(current)) or "none", ", ".join(sorted(self.heads)))
+            )
+
+    def check_smtp(self):
+        if not self.smtp_address or not self.smtp_address[0]:
+            return "skipped"
+
+        # Reachability only, without a (slow) SMTP session.
+        socket.create_connection(self.smtp_address, timeout=self.timeout).close()
+
+    def check_redis(self):
+        if self.storage is None:
+            return "skipped"
+
+        if not self.storage.check():
+            raise RuntimeError("Storage check failed")
+
+    def run(self) -> t.Tuple[bool, t.Dict[str, str]]:
+        """
+        Run every check.
+
+        :return: Whether all checks passed and the result of each check
+            (the reasons of the failures are only logged).
+        """
+        results = {}
+
+        for name in self.checks:
+            try:
+                results[name] = getattr(self, "check_" + name)() or "ok"
+            except Exception as e:
+                results[name] = "fail"
+
+                if self.logger:
+                    self.logger.warning("Readiness check '%s' failed: %s", name, e)
+
+        ready = "fail" not in results.values()
+        return ready, results
+
+    def get_result(self) -> t.Tuple[bool, bytes]:
+        """
+        Returns the cached readiness and JSON body, checking again when stale.
+        """
+        if time.monotonic() < self._expires_at:
+            return self._result
+
+        with self._lock:
+            # Checked by a concurrent probe while this one waited.
+            if time.monotonic() < self._expires_at:
+                return self._result
+
+            ready, results = self.run()
+            body = json.dumps(
+                {"status": "ok" if ready else "fail", "checks": results}
+            ).encode("utf-8")
+
+            self._result = (ready, body)
+            self._expires_at = time.monotonic() + self.ttl
+
+        return self._result
+
+
+class HealthCheckMiddleware:
+    """
+    Answers `/healthz` and `/readyz` before the application.
+
+    :param wsgi_app: The wrapped WSGI application.
+    :param probe: The readiness probe.
+    """
+
+    def __init__(self, wsgi_app, probe: ReadinessProbe):
+        self.wsgi_app = wsgi_app
+        self.probe = probe
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO")
+
+        if path not in ("/healthz", "/readyz"):
+            return self.wsgi_app(environ, start_response)
+
+        if environ.get("REQUEST_METHOD") not in ("GET", "HEAD"):
+            status, body = "405 Method Not Allowed", b""
+            headers = _PLAIN_HEADERS + [("Allow", "GET, HEAD")]
+        elif path == "/healthz":
+            status, headers, body = "200 OK", _PLAIN_HEADERS, b"ok"
+        else:
+            ready, body = self.probe.get_result()
+            status = "200 OK" if ready else "503 Service Unavailable"
+            headers = _JSON_HEADERS
+
+        start_response(status, headers + [("Content-Length", str(len(body)))])
+        return [b""] if environ["REQUEST_METHOD"] == "HEAD" else [body]
+
+
+def init_health_checks(app: Flask, db, limiter) -> ReadinessProbe:
+    """
+    Serve the liveness and readiness probes of the application.
+    """
+    from accounts.utils import get_limiter_storage
+
+    checks = get_readiness_checks(app.config["READYZ_CHECKS"])
+    migrate = app.extensions.get("migrate")
+
+    with app.app_context():
+        engine = db.engine
+
+    probe = ReadinessProbe(
+        engine,
+        checks=checks,
+        ttl=app.config["READYZ_CACHE_TTL"],
+        timeout=app.config["READYZ_TIMEOUT"],
+        migrations_dir=migrate.directory if migrate else None,
+        smtp_address=(app.config["MAIL_SERVER"], app.config["MAIL_PORT"]),
+        storage=get_limiter_storage(app, limiter) if "redis" in checks else None,
+        logger=app.logger,
+    )
+
+    app.wsgi_app = HealthCheckMiddleware(app.wsgi_app, probe)
+    return probe
@@ -0,0 +1,199 @@
+import re
+import json
+import time
+import weakref
+import typing as t
+
+from collections import Counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from flask import Flask, Response, g, has_request_context, request
+
+# Patterns used to reduce a SQL statement to its "shape".
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAMETER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+# Callbacks of the statement timing hook of each engine.
+_timed_statement_callbacks: "weakref.WeakKeyDictionary[Engine, t.List[t.Callable]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_statement_shape(statement: str) -> str:
+    """
+    Normalize a SQL statement so that executions differing only by
+    literal values or `IN` list length share the same shape.
+
+    :param statement: The SQL statement sent to the database.
+
+    :return: The normalized statement.
+    """
+    shape = _STRING_LITERAL.sub("?", statement)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = re.sub(r"%\(\w+\)s|%s|:\w+", "?", shape)
+    shape = _PARAMETER_LIST.sub("(?)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+class RequestQueryStats:
+    """
+    Collects the SQL statements executed while handling a single request.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement = None
+        self.shapes = Counter()
+
+    def record(self, statement: str, duration: float):
+        """
+        Record an executed statement and its duration in seconds.
+        """
+        self.count += 1
+        self.total_time += duration
+        self.shapes[get_statement_shape(statement)] += 1
+
+        if duration >= self.slowest_time:
+            self.slowest_time = duration
+            self.slowest_statement = statement
+
+    def repeated_shapes(self, threshold: int) -> t.List[t.Tuple[str, int]]:
+        """
+        Returns the statement shapes executed more than `threshold` times.
+        """
+        return [(shape, n) for shape, n in self.shapes.items() if n > threshold]
+
+    def server_timing(self) -> str:
+        """
+        Returns the value of the `Server-Timing` header for these stats.
+        """
+        return 'db;dur=%.2f;desc="%d queries", db-slowest;dur=%.2f' % (
+            self.total_time * 1000,
+            self.count,
+            self.slowest_time * 1000,
+        )
+
+
+def get_request_stats(create: bool = False) -> t.Optional[RequestQueryStats]:
+    """
+    Returns the query stats of the current request, if any.
+
+    :param create: Create the stats object if it doesn't exist yet.
+    """
+    if not has_request_context():
+        return None
+
+    stats = g.get("_sql_stats")
+
+    if stats is None and create:
+        stats = g._sql_stats = RequestQueryStats()
+
+    return stats
+
+
+def on_statement_timed(engine: Engine, callback: t.Callable):
+    """
+    Call `callback(conn, statement, params, executemany, duration)` after
+    every statement of an engine, with its duration in seconds.
+
+    The engine gets a single pair of timing hooks shared by the callbacks.
+    The start time is kept on the execution context of the statement, so a
+    statement that fails (without `after_cursor_execute`) leaves nothing
+    behind on the pooled connection. The statements run without a context
+    (e.g. sequences pre-executed on PostgreSQL) are not timed.
+    """
+    callbacks = _timed_statement_callbacks.get(engine)
+
+    if callbacks is not None:
+        callbacks.append(callback)
+        return
+
+    callbacks = _timed_statement_callbacks[engine] = [callback]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, params, context, executemany):
+        if context is not None:
+            context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, params, context, executemany):
+        started = getattr(context, "_query_start", None)
+
+        if started is None:
+            return
+
+        duration = time.perf_counter() - started
+
+        for callback in callbacks:
+            callback(conn, statement, params, executemany, duration)
+
+
+def record_request_statement(conn, statement, params, executemany, duration):
+    stats = get_request_stats(create=True)
+
+    if stats is not None:
+        stats.record(statement, duration)
+
+
+def instrument_engine(engine: Engine):
+    """
+    Record the statements of an engine in the query stats of the requests.
+    """
+    on_statement_timed(engine, record_request_statement)
+
+
+def init_sql_instrumentation(app: Flask, db):
+    """
+    Enable per-request SQL instrumentation for the application.
+
+    Each response gets a `Server-Timing` header with the query count, total
+    database time and slowest statement time, and a structured log line.
+    A warning is logged when the same statement shape runs more than
+    `SQL_N_PLUS_ONE_THRESHOLD` times within one request.
+    """
+    threshold = app.config["SQL_N_PLUS_ONE_THRESHOLD"]
+
+    with app.app_context():
+        for engine in db.engines.values():
+            instrument_engine(engine)
+
+    @app.after_request
+    def report_sql_stats(response: Response) -> Response:
+        stats = get_request_stats()
+
+        if stats is None:
+            return response
+
+        response.headers.add("Server-Timing", stats.server_timing())
+
+        app.logger.info(
+            json.dumps(
+                {
+                    "event": "sql_stats",
+                    "method": request.method,
+                    "path": request.path,
+                    "endpoint": request.endpoint,
+                    "status": response.status_code,
+                    "queries": stats.count,
+                    "db_ms": round(stats.total_time * 1000, 3),
+                    "slowest_ms": round(stats.slowest_time * 1000, 3),
+                    "slowest_statement": stats.slowest_statement,
+                }
+            )
+        )
+
+        for shape, count in stats.repeated_shapes(threshold):
+            app.logger.warning(
+                "Possible N+1 query on '%s': %d executions of %r",
+                request.endpoint,
+                count,
+                shape,
+            )
+
+        return response
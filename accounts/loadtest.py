@@ -0,0 +1,338 @@
+"""
+A small concurrent load generator for reproducing mixed production traffic.
+
+Virtual users run weighted scenarios (login, browse, profile edits, forgot
+password, theme and language switches) either against the WSGI app in the
+same process or against a running server URL. Each virtual user keeps its
+own cookies and submits the CSRF token scraped from the rendered forms.
+"""
+
+import re
+import time
+import random
+import threading
+import typing as t
+
+from collections import defaultdict
+
+from flask import Flask
+
+# Default weight of each scenario in the traffic mix.
+DEFAULT_MIX = "login=15,browse=40,profile=10,forgot=5,theme=15,lang=15"
+
+_CSRF_TOKEN = re.compile(r'name="csrf_token"[^>]*?value="([^"]*)"')
+
+
+def parse_mix(mix: str) -> t.Dict[str, float]:
+    """
+    Parse a traffic mix string like `login=20,browse=80` into weights.
+
+    :raises ValueError: If a scenario is unknown or a weight is invalid.
+    """
+    weights = {}
+
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+
+        if name not in SCENARIOS:
+            raise ValueError("Unknown scenario: '%s'" % name)
+
+        weights[name] = float(weight or 1)
+
+    if not any(weights.values()):
+        raise ValueError("The traffic mix needs at least one positive weight.")
+
+    return weights
+
+
+def get_form_value(html: str, name: str) -> t.Optional[str]:
+    """
+    Returns the `value` attribute of the named input in a rendered page.
+    """
+    if name == "csrf_token":
+        match = _CSRF_TOKEN.search(html)
+    else:
+        match = re.search(r'name="%s"[^>]*?value="([^"]*)"' % re.escape(name), html)
+
+    return match.group(1) if match else None
+
+
+class LoadStats:
+    """
+    Thread-safe latency and status collector, grouped by endpoint.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint: str, status: t.Union[int, str], duration: float):
+        with self._lock:
+            self.latencies[endpoint].append(duration)
+            self.statuses[endpoint][status] += 1
+
+    def report(self, elapsed: float) -> t.Dict[str, dict]:
+        """
+        Summarize the collected requests per endpoint.
+        """
+
+        def percentile(values, p):
+            return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+        report = {}
+
+        with self._lock:
+            for endpoint, values in sorted(self.latencies.items()):
+                values = sorted(values)
+                statuses = dict(self.statuses[endpoint])
+
+                report[endpoint] = {
+                    "requests": len(values),
+                    "throughput": len(values) / elapsed,
+                    "p50_ms": percentile(values, 0.50) * 1000,
+                    "p95_ms": percentile(values, 0.95) * 1000,
+                    "p99_ms": percentile(values, 0.99) * 1000,
+                    "errors": sum(
+                        count
+                        for status, count in statuses.items()
+                        if not isinstance(status, int) or status >= 500
+                    ),
+                    "rate_limited": statuses.get(429, 0),
+                }
+
+        return report
+
+
+class Pacer:
+    """
+    Spreads requests from all virtual users evenly to hit a target rate.
+    """
+
+    def __init__(self, rate: t.Optional[float] = None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+
+        with self._lock:
+            slot = max(self._next, time.perf_counter())
+            self._next = slot + self.interval
+
+        delay = slot - time.perf_counter()
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+class WSGITransport:
+    """
+    Sends requests to the Flask application in the same process.
+    """
+
+    def __init__(self, app: Flask):
+        self.client = app.test_client()
+
+    def request(self, method: str, path: str, data: dict = None):
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.get_data(as_text=True), response.location
+
+
+class HTTPTransport:
+    """
+    Sends requests to a running server over HTTP.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 30):
+        import requests
+
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        self.timeout = timeout
+
+    def request(self, method: str, path: str, data: dict = None):
+        response = self.session.request(
+            method,
+            self.base_url + path,
+            data=data,
+            allow_redirects=False,
+            timeout=self.timeout,
+        )
+        return response.status_code, response.text, response.headers.get("Location")
+
+
+class VirtualUser:
+    """
+    A simulated visitor with its own cookies, running the scenarios.
+    """
+
+    def __init__(self, transport, stats: LoadStats, pacer: Pacer, credentials: dict):
+        self.transport = transport
+        self.stats = stats
+        self.pacer = pacer
+        self.credentials = credentials
+        self.logged_in = False
+
+    def request(self, method: str, path: str, data: dict = None):
+        self.pacer.wait()
+
+        endpoint = "%s %s" % (method, path.split("?")[0])
+        started = time.perf_counter()
+
+        try:
+            status, body, location = self.transport.request(method, path, data)
+        except Exception as e:
+            self.stats.record(endpoint, type(e).__name__, time.perf_counter() - started)
+            return None, "", None
+
+        self.stats.record(endpoint, status, time.perf_counter() - started)
+        return status, body, location
+
+    def get(self, path: str):
+        return self.request("GET", path)
+
+    def post_form(self, path: str, data: dict, html: str = None):
+        """
+        Submit a form, reusing the CSRF token of the page it was rendered on.
+        """
+        if html is None:
+            _, html, _ = self.get(path)
+
+        data = dict(data, csrf_token=get_form_value(html, "csrf_token") or "")
+        return self.request("POST", path, data)
+
+    def login(self):
+        if self.logged_in:
+            self.get("/logout")
+            self.logged_in = False
+
+        status, _, location = self.post_form(
+            "/login",
+            {
+                "username": self.credentials["username"],
+                "password": self.credentials["password"],
+                "remember": "y",
+                # Accepted as-is by the reCAPTCHA test keys.
+                "g-recaptcha-response": "loadtest",
+            },
+        )
+        self.logged_in = status == 302 and "/login" not in (location or "")
+
+    def ensure_login(self):
+        if not self.logged_in:
+            self.login()
+
+
+def scenario_login(user: VirtualUser):
+    user.login()
+
+
+def scenario_browse(user: VirtualUser):
+    user.ensure_login()
+    user.get("/home")
+
+
+def scenario_profile(user: VirtualUser):
+    user.ensure_login()
+    _, html, _ = user.get("/profile")
+
+    user.post_form(
+        "/profile",
+        {
+            "username": get_form_value(html, "username") or "",
+            "first_name": get_form_value(html, "first_name") or "",
+            "last_name": get_form_value(html, "last_name") or "",
+            "about": "Load test %d" % random.randint(0, 1_000_000),
+        },
+        html=html,
+    )
+
+
+def scenario_forgot(user: VirtualUser):
+    user.post_form(
+        "/forgot/password",
+        {"email": user.credentials["forgot_email"], "remember": "y"},
+    )
+
+
+def scenario_theme(user: VirtualUser):
+    user.get("/change-theme?theme=%s" % random.choice(user.credentials["themes"]))
+
+
+def scenario_lang(user: VirtualUser):
+    user.get("/change-lang?lang=%s" % random.choice(user.credentials["languages"]))
+
+
+SCENARIOS = {
+    "login": scenario_login,
+    "browse": scenario_browse,
+    "profile": scenario_profile,
+    "forgot": scenario_forgot,
+    "theme": scenario_theme,
+    "lang": scenario_lang,
+}
+
+
+def run_load_test(
+    app: Flask,
+    url: t.Optional[str] = None,
+    concurrency: int = 10,
+    rate: t.Optional[float] = None,
+    duration: float = 30.0,
+    mix: str = DEFAULT_MIX,
+    credentials: t.Optional[dict] = None,
+) -> t.Tuple[t.Dict[str, dict], float]:
+    """
+    Run the load test and return the per-endpoint report and elapsed time.
+
+    :param app: The application, driven in-process when `url` is not given.
+    :param url: Base URL of a running server to load instead.
+    :param concurrency: Number of concurrent virtual users.
+    :param rate: Optional target requests per second across all users.
+    :param duration: Test duration in seconds.
+    :param mix: Weighted scenario mix, see `DEFAULT_MIX`.
+    :param credentials: The `username`/`password` used by the virtual users.
+    """
+    weights = parse_mix(mix)
+    names, values = list(weights), list(weights.values())
+
+    credentials = dict(
+        {
+            "username": app.config["TEST_USER_USERNAME"],
+            "password": app.config["TEST_USER_PASSWORD"],
+            "forgot_email": "loadtest@example.com",
+            "themes": app.config["BOOTSTRAP_BOOTSWATCH_THEMES"],
+            "languages": app.config["LANGUAGES"],
+        },
+        **(credentials or {}),
+    )
+
+    stats = LoadStats()
+    pacer = Pacer(rate)
+    stop = threading.Event()
+
+    def worker():
+        transport = HTTPTransport(url) if url else WSGITransport(app)
+        user = VirtualUser(transport, stats, pacer, credentials)
+
+        while not stop.is_set():
+            SCENARIOS[random.choices(names, values)[0]](user)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    started = time.perf_counter()
+
+    for thread in threads:
+        thread.start()
+
+    time.sleep(duration)
+    stop.set()
+
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.perf_counter() - started
+    return stats.report(elapsed), elapsed
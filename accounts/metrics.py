@@ -0,0 +1,246 @@
+"""
+Prometheus metrics for the authentication flows.
+
+When the `PROMETHEUS_MULTIPROC_DIR` environment variable is set (it must be
+set before the workers start), every worker process writes its samples to
+shared files in that directory and the `/metrics` endpoint aggregates them,
+so the numbers are correct with multi-process servers. Call
+`mark_process_dead(pid)` from the server's worker exit hook to clean up.
+"""
+
+import os
+import hmac
+import time
+import typing as t
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.exceptions import NotFound
+
+from flask import Flask, Response, g, request
+
+from accounts import signals
+
+# Headers added by reverse proxies, the address allow list is not trusted
+# for the requests carrying them.
+PROXY_HEADERS = ("Forwarded", "X-Forwarded-For", "X-Real-IP")
+
+REQUEST_LATENCY = Histogram(
+    "flaskauth_http_request_duration_seconds",
+    "Request latency by endpoint.",
+    ["endpoint", "method", "status"],
+)
+
+LOGIN_ATTEMPTS = Counter(
+    "flaskauth_login_attempts_total",
+    "Login attempts by result (success, failure, inactive).",
+    ["result"],
+)
+
+REGISTRATIONS = Counter(
+    "flaskauth_registrations_total",
+    "User accounts registered.",
+)
+
+TOKENS_ISSUED = Counter(
+    "flaskauth_tokens_issued_total",
+    "Security tokens issued by purpose.",
+    ["purpose"],
+)
+
+TOKENS_REDEEMED = Counter(
+    "flaskauth_tokens_redeemed_total",
+    "Security tokens redeemed by purpose.",
+    ["purpose"],
+)
+
+EMAILS = Counter(
+    "flaskauth_emails_total",
+    "Emails handed to the mail server by result (sent, failed).",
+    ["result"],
+)
+
+RATE_LIMITED = Counter(
+    "flaskauth_rate_limited_total",
+    "Requests rejected by the rate limiter.",
+    ["endpoint"],
+)
+
+PASSWORD_HASH_DURATION = Histogram(
+    "flaskauth_password_hash_duration_seconds",
+    "Time spent hashing or checking passwords.",
+    ["operation"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+DB_POOL_SIZE = Gauge(
+    "flaskauth_db_pool_size",
+    "Configured size of the database connection pool.",
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "flaskauth_db_pool_checked_out",
+    "Database connections currently in use.",
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_OVERFLOW = Gauge(
+    "flaskauth_db_pool_overflow",
+    "Database connections opened above the pool size.",
+    multiprocess_mode="livesum",
+)
+
+
+def get_registry() -> CollectorRegistry:
+    """
+    Returns the registry to expose, aggregating all worker processes
+    when running in multi-process mode.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def mark_process_dead(pid: int):
+    """
+    Remove the live gauges of a dead worker process from the shared files.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+def is_proxied_request() -> bool:
+    """
+    Checks if the current request came through a reverse proxy, whose own
+    address is then the client address of every request.
+    """
+    if "werkzeug.proxy_fix.orig" in request.environ:
+        return True
+
+    return any(header in request.headers for header in PROXY_HEADERS)
+
+
+def is_metrics_request_allowed(app: Flask) -> bool:
+    """
+    Checks if the current request may read the metrics, either by sending
+    the bearer token or by coming straight (not through a proxy) from an
+    allowed address.
+    """
+    token = app.config.get("METRICS_TOKEN")
+    authorization = request.headers.get("Authorization", "")
+
+    if token and authorization.startswith("Bearer "):
+        return hmac.compare_digest(authorization[len("Bearer ") :], token)
+
+    if is_proxied_request():
+        return False
+
+    return request.remote_addr in app.config["METRICS_ALLOWED_IPS"]
+
+
+def _get_token_purposes(app: Flask) -> t.Dict[str, str]:
+    # Never expose the configured salts themselves as label values.
+    return {
+        app.config["SALT_ACCOUNT_CONFIRM"]: "account_confirm",
+        app.config["SALT_RESET_PASSWORD"]: "reset_password",
+        app.config["SALT_CHANGE_EMAIL"]: "change_email",
+    }
+
+
+def _on_login_attempted(app, result: str, **kwargs):
+    LOGIN_ATTEMPTS.labels(result=result).inc()
+
+
+def _on_user_registered(app, **kwargs):
+    REGISTRATIONS.inc()
+
+
+def _on_token_issued(app, salt: str, **kwargs):
+    TOKENS_ISSUED.labels(purpose=_get_token_purposes(app).get(salt, "other")).inc()
+
+
+def _on_token_redeemed(app, salt: str, **kwargs):
+    TOKENS_REDEEMED.labels(purpose=_get_token_purposes(app).get(salt, "other")).inc()
+
+
+def _on_email_sent(app, result: str, **kwargs):
+    EMAILS.labels(result=result).inc()
+
+
+def _on_rate_limit_exceeded(app, endpoint: str = None, **kwargs):
+    RATE_LIMITED.labels(endpoint=endpoint or "unknown").inc()
+
+
+def _on_password_hashed(app, operation: str, duration: float, **kwargs):
+    PASSWORD_HASH_DURATION.labels(operation=operation).observe(duration)
+
+
+def instrument_pool(engine: Engine):
+    """
+    Keep the connection pool gauges up to date on checkout and checkin.
+    """
+    pool = engine.pool
+
+    def update_pool_gauges(*args):
+        # Only queue pools report their size and overflow.
+        if hasattr(pool, "checkedout"):
+            DB_POOL_SIZE.set(pool.size())
+            DB_POOL_CHECKED_OUT.set(pool.checkedout())
+            DB_POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+    event.listen(engine, "checkout", update_pool_gauges)
+    event.listen(engine, "checkin", update_pool_gauges)
+
+
+def init_metrics(app: Flask, db, limiter):
+    """
+    Register the metrics hooks and the `/metrics` endpoint for the application.
+    """
+    signals.login_attempted.connect(_on_login_attempted)
+    signals.user_registered.connect(_on_user_registered)
+    signals.token_issued.connect(_on_token_issued)
+    signals.token_redeemed.connect(_on_token_redeemed)
+    signals.email_sent.connect(_on_email_sent)
+    signals.rate_limit_exceeded.connect(_on_rate_limit_exceeded)
+    signals.password_hashed.connect(_on_password_hashed)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            instrument_pool(engine)
+
+    @app.before_request
+    def start_request_timer():
+        g._metrics_request_start = time.perf_counter()
+
+    @app.after_request
+    def observe_request_latency(response: Response) -> Response:
+        started = g.pop("_metrics_request_start", None)
+
+        if started is not None:
+            REQUEST_LATENCY.labels(
+                endpoint=request.endpoint or "unmatched",
+                method=request.method,
+                status=response.status_code,
+            ).observe(time.perf_counter() - started)
+
+        return response
+
+    @app.get("/metrics")
+    @limiter.exempt
+    def metrics() -> Response:
+        """
+        Expose the application metrics in the Prometheus text format.
+        """
+        if not is_metrics_request_allowed(app):
+            # Don't reveal the endpoint to unauthorized clients.
+            raise NotFound
+
+        return Response(generate_latest(get_registry()), mimetype=CONTENT_TYPE_LATEST)
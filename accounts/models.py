@@ -1,6 +1,8 @@
 import os
+import time
+import hashlib
+import secrets
 import typing as t
-import requests
 
 from datetime import datetime, timedelta
 
@@ -20,15 +22,29 @@ from flask import current_app, url_for
 
 from flask_login.mixins import UserMixin
 
+from config import PRIMARY_KEY_TYPE
+
+from accounts.db_utils import get_id_type
 from accounts.extensions import database as db
+from accounts.session_epochs import get_session_token
+from accounts.signals import password_hashed, sessions_revoked, token_issued
 from accounts.utils import (
     get_unique_id,
+    get_time_ordered_id,
     get_unique_filename,
+    get_upload_path,
     remove_existing_file,
     unique_security_token,
     generate_unique_username,
 )
 
+# Validity of the url security tokens.
+SECURITY_TOKEN_LIFETIME = timedelta(minutes=15)
+
+# Column type and default value shared by the primary and foreign keys.
+ID_TYPE = get_id_type(PRIMARY_KEY_TYPE)
+ID_DEFAULT = get_time_ordered_id if PRIMARY_KEY_TYPE == "uuid7" else get_unique_id
+
 
 class BaseModel(db.Model):
     """
@@ -38,11 +54,12 @@ class BaseModel(db.Model):
     __abstract__ = True
 
     id = db.Column(
-        db.String(36),
-        default=get_unique_id,
+        ID_TYPE,
+        default=ID_DEFAULT,
         primary_key=True,
         nullable=False,
-        unique=True,
+        # The compact key relies on the primary key index alone.
+        unique=PRIMARY_KEY_TYPE == "string",
     )
 
     created_at = db.Column(db.DateTime, default=datetime.now)
@@ -63,6 +80,12 @@ class User(BaseModel, UserMixin):
     """
 
     __tablename__ = "user"
+    __table_args__ = (
+        # Used by `flask reap-accounts` to find the old unconfirmed accounts.
+        Index("ix_user_active_created_at", "active", "created_at"),
+        # Used to claim the free guests and find the ones to recycle.
+        Index("ix_user_guest_claimed_at", "is_guest", "guest_claimed_at"),
+    )
 
     username = db.Column(db.String(30), unique=True, nullable=False)
     first_name = db.Column(db.String(25), nullable=False)
@@ -74,6 +97,18 @@ class User(BaseModel, UserMixin):
     active = db.Column(db.Boolean, default=False, nullable=False, server_default="0")
     change_email = db.Column(db.String(120), default="")
 
+    # Bumped to revoke every session and remember cookie of the user.
+    session_epoch = db.Column(db.Integer, default=0, nullable=False, server_default="0")
+
+    # Activity, written by `accounts.activity` (coalesced for `last_seen_at`).
+    last_login_at = db.Column(db.DateTime, nullable=True)
+    last_seen_at = db.Column(db.DateTime, nullable=True)
+    last_ip = db.Column(db.String(45), nullable=True)
+
+    # Guest accounts of `accounts.guests`, free in the pool while unclaimed.
+    is_guest = db.Column(db.Boolean, default=False, nullable=False, server_default="0")
+    guest_claimed_at = db.Column(db.DateTime, nullable=True)
+
     @classmethod
     def authenticate(
         cls, username: t.AnyStr = None, password: t.AnyStr = None
@@ -86,18 +121,25 @@ class User(BaseModel, UserMixin):
 
         :return: The authenticated user object if credentials are correct, otherwise None.
         """
-        user = cls.query.filter(
-            or_(
-                cls.username == username,
-                cls.email == username,
-            )
-        ).first()
+        user = cls.get_user_by_login(username)
 
         if user and user.check_password(password):
             return user
 
         return None
 
+    @classmethod
+    def get_user_by_login(cls, username: t.AnyStr) -> t.Optional["User"]:
+        """
+        Retrieves a user by the identifier used to log in (username or email).
+        """
+        return cls.query.filter(
+            or_(
+                cls.username == username,
+                cls.email == username,
+            )
+        ).first()
+
     @classmethod
     def create(cls, **kwargs):
         """
@@ -183,23 +225,85 @@ class User(BaseModel, UserMixin):
 
         :param password: The plain-text password to hash and set.
         """
+        started = time.perf_counter()
         self.password = generate_password_hash(password)
 
+        password_hashed.send(
+            current_app._get_current_object(),
+            operation="hash",
+            duration=time.perf_counter() - started,
+        )
+
     def check_password(self, password: t.AnyStr) -> bool:
         """
         Checks if the provided password matches the hashed password.
 
         :param password: The plain-text password to check.
         """
-        return check_password_hash(self.password, password)
+        started = time.perf_counter()
+        matched = check_password_hash(self.password, password)
+
+        password_hashed.send(
+            current_app._get_current_object(),
+            operation="check",
+            duration=time.perf_counter() - started,
+        )
+        return matched
+
+    def delete(self):
+        """
+        Deletes the user with their related rows and their avatar file.
+        """
+        profile = self.profile
+        avatar_path = profile.avatar_path if profile else None
+
+        # The cascades are not enforced by every database (e.g. SQLite).
+        for model in (UserSecurityToken, RefreshToken, OAuthProvider, Profile):
+            model.query.filter_by(user_id=self.id).delete()
+
+        super().delete()
+
+        if avatar_path:
+            remove_existing_file(avatar_path)
+
+    def get_id(self) -> str:
+        """
+        Returns the Flask-Login id, the user ID with the current session epoch.
+        """
+        return get_session_token(self.id, self.session_epoch)
 
-    def generate_token(self, salt: str) -> t.AnyStr:
+    def revoke_sessions(self):
+        """
+        Invalidates every session and remember cookie of the user,
+        on all devices, by bumping the session epoch.
+        """
+        self.session_epoch = User.session_epoch + 1
+        db.session.commit()
+
+        sessions_revoked.send(
+            current_app._get_current_object(),
+            user_id=self.id,
+            epoch=self.session_epoch,
+        )
+
+    def generate_token(self, salt: str, reuse: bool = False) -> t.AnyStr:
         """
         Generates a new security token for the user.
 
-        :return: The newly created security token.
+        :param reuse: Return the outstanding token of the same salt instead,
+            if it is still valid for a while.
+
+        :return: The newly created (or reused) security token.
         """
+        if reuse:
+            instance = UserSecurityToken.get_outstanding(salt=salt, user_id=self.id)
+
+            if instance:
+                return instance.token
+
         instance = UserSecurityToken.create_new(salt=salt, user_id=self.id)
+
+        token_issued.send(current_app._get_current_object(), salt=salt)
         return instance.token
 
     @staticmethod
@@ -226,13 +330,35 @@ class User(BaseModel, UserMixin):
 
         return None
 
-    def send_confirmation(self):
+    def send_confirmation(self) -> bool:
         """
-        Sends a confirmation email to the user for account activation.
+        Sends a confirmation email to the user for account activation,
+        unless one was sent during the resend cooldown.
+
+        :return: `True` if an email was queued.
         """
-        from accounts.email_utils import send_confirmation_mail
+        from accounts.email_utils import email_cooldown, send_confirmation_mail
+
+        if not email_cooldown.acquire("confirm", self.id):
+            return False
+
+        # The cooldown only follows the emails actually sent.
+        try:
+            future = send_confirmation_mail(self, background=True)
+        except Exception:
+            email_cooldown.release("confirm", self.id)
+            raise
+
+        if future is not None:
+            user_id = self.id
+
+            def release_unsent(future):
+                if not future.result():
+                    email_cooldown.release("confirm", user_id)
 
-        send_confirmation_mail(self)
+            future.add_done_callback(release_unsent)
+
+        return True
 
     def create_oauth_provider(
         self, provider: str = "google", provider_id: str = None
@@ -288,6 +414,14 @@ class User(BaseModel, UserMixin):
         """
         return self.active
 
+    @property
+    def is_test_user(self) -> bool:
+        """
+        Checks if the user is the shared test user of `flask createtestuser`,
+        whose published credentials limit it to read-only access.
+        """
+        return self.username == current_app.config["TEST_USER_USERNAME"]
+
     def is_social_user(self, provider: str = "google") -> bool:
         """
         Checks if a user account is connected to any oauth provider.
@@ -315,7 +449,7 @@ class Profile(BaseModel):
     avatar = db.Column(db.String(250), default="")
 
     user_id = db.Column(
-        db.String(36), db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False
+        ID_TYPE, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False
     )
 
     user = db.Relationship("User", foreign_keys=[user_id])
@@ -334,6 +468,13 @@ class Profile(BaseModel):
 
         return self.avatar
 
+    @property
+    def avatar_path(self) -> t.Optional[t.Text]:
+        """
+        Returns the local file path of the uploaded avatar, if any.
+        """
+        return get_upload_path(self.avatar)
+
     def set_avatar(self, profile_image, file_path: t.Optional[t.Text] = "profile"):
         """
         Set a new avatar for the user by removing the existing avatar (if any), saving the new one,
@@ -391,6 +532,8 @@ class UserSecurityToken(BaseModel):
     __table_args__ = (
         Index("ix_user_token_token", "token"),
         Index("ix_user_token_expire", "expire"),
+        # Used to find the outstanding token of a user to reuse it.
+        Index("ix_user_token_user_salt", "user_id", "salt", "created_at"),
         UniqueConstraint("token", "salt", name="uq_token_salt"),
     )
 
@@ -403,7 +546,7 @@ class UserSecurityToken(BaseModel):
     expire = db.Column(db.Boolean, default=False, nullable=False, server_default="0")
 
     user_id = db.Column(
-        db.String(36), db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False
+        ID_TYPE, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False
     )
 
     user = db.Relationship("User", foreign_keys=[user_id])
@@ -429,6 +572,30 @@ class UserSecurityToken(BaseModel):
 
         return instance
 
+    @classmethod
+    def get_outstanding(
+        cls,
+        salt: str,
+        user_id: str,
+        min_remaining: timedelta = timedelta(minutes=5),
+    ) -> t.Optional["UserSecurityToken"]:
+        """
+        Returns the newest unused token of a user and salt, if it remains
+        valid for at least `min_remaining`.
+        """
+        created_after = datetime.now() - SECURITY_TOKEN_LIFETIME + min_remaining
+
+        return (
+            cls.query.filter(
+                cls.user_id == user_id,
+                cls.salt == salt,
+                cls.expire.is_(False),
+                cls.created_at > created_after,
+            )
+            .order_by(cls.created_at.desc())
+            .first()
+        )
+
     @property
     def is_expired(self) -> bool:
         """
@@ -436,7 +603,7 @@ class UserSecurityToken(BaseModel):
         on its creation time and expiration period.
         """
         if not self.expire:
-            expiry_time = self.created_at + timedelta(minutes=15)
+            expiry_time = self.created_at + SECURITY_TOKEN_LIFETIME
             current_time = datetime.now()
 
             if not expiry_time <= current_time:
@@ -461,6 +628,114 @@ class UserSecurityToken(BaseModel):
         return "<Token '{}' by {}>".format(self.token, self.user)
 
 
+class RefreshToken(BaseModel):
+    """
+    A long-lived refresh token of the JSON API, stored hashed.
+
+    A token is valid until it expires, is used (it is rotated on every
+    refresh) or the sessions of the user are revoked (session epoch bump).
+    """
+
+    __tablename__ = "user_refresh_token"
+    __table_args__ = (Index("ix_user_refresh_token_user_id", "user_id"),)
+
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    session_epoch = db.Column(db.Integer, default=0, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked = db.Column(db.Boolean, default=False, nullable=False, server_default="0")
+
+    user_id = db.Column(
+        ID_TYPE, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False
+    )
+
+    user = db.Relationship("User", foreign_keys=[user_id])
+
+    @staticmethod
+    def hash_token(token: str) -> str:
+        # The tokens are random, a plain digest is enough to store them.
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def issue(cls, user: User, lifetime: timedelta) -> str:
+        """
+        Creates a new refresh token for the user.
+
+        :return: The refresh token, only its hash is saved.
+
+        :raises InternalServerError: If there is an error saving the token to the database.
+        """
+        token = secrets.token_urlsafe(32)
+        now = datetime.now()
+
+        try:
+            # The expired tokens of the user are dropped on the way.
+            cls.query.filter(cls.user_id == user.id, cls.expires_at <= now).delete(
+                synchronize_session=False
+            )
+
+            instance = cls(
+                token_hash=cls.hash_token(token),
+                session_epoch=user.session_epoch,
+                expires_at=now + lifetime,
+                user_id=user.id,
+            )
+            instance.save()
+        except Exception as e:
+            # Handle database error by raising an internal server error.
+            print("Error creating refresh token: %s" % e)
+            raise InternalServerError
+
+        return token
+
+    @classmethod
+    def get_by_token(cls, token: t.AnyStr) -> t.Optional["RefreshToken"]:
+        """
+        Retrieves a refresh token instance by the token itself.
+        """
+        if not token:
+            return None
+
+        return cls.query.filter_by(token_hash=cls.hash_token(token)).first()
+
+    @classmethod
+    def revoke_all(cls, user_id: t.AnyStr):
+        """
+        Revokes every refresh token of a user.
+        """
+        cls.query.filter_by(user_id=user_id, revoked=False).update(
+            {"revoked": True}, synchronize_session=False
+        )
+        db.session.commit()
+
+    def redeem(self) -> bool:
+        """
+        Marks the token used, once: concurrent refreshes with the same
+        token are redeemed by one of them only.
+
+        :return: `True` if this call redeemed the token.
+        """
+        redeemed = self.query.filter_by(id=self.id, revoked=False).update(
+            {"revoked": True}, synchronize_session=False
+        )
+        db.session.commit()
+
+        return bool(redeemed)
+
+    def is_valid(self, user: User) -> bool:
+        """
+        Checks if the token is unused, not expired and issued in the
+        current session epoch of its user.
+        """
+        return (
+            not self.revoked
+            and self.expires_at > datetime.now()
+            and self.session_epoch == user.session_epoch
+        )
+
+    def __repr__(self):
+        return "<RefreshToken of User {}>".format(self.user_id)
+
+
 class OAuthProvider(BaseModel):
     """
     A Class represents a user's OAuth login provider
@@ -479,13 +754,52 @@ class OAuthProvider(BaseModel):
     provider_id = db.Column(db.String(200), unique=True, nullable=False, index=True)
 
     user_id = db.Column(
-        db.String(36), db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False
+        ID_TYPE, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False
     )
 
     def __repr__(self):
         return f"OAuthProvider {self.provider} for User {self.user_id}"
 
 
+class AuditEvent(db.Model):
+    """
+    An append-only record of an authentication event, see `accounts.audit`.
+
+    Rows keep the user id and username of deleted accounts, so the user id
+    is not a foreign key.
+    """
+
+    __tablename__ = "audit_event"
+    __table_args__ = (
+        Index("ix_audit_event_created_at", "created_at"),
+        Index("ix_audit_event_user_id_created_at", "user_id", "created_at"),
+    )
+
+    id = db.Column(
+        db.BigInteger().with_variant(db.Integer, "sqlite"),
+        primary_key=True,
+        autoincrement=True,
+    )
+    created_at = db.Column(db.DateTime, nullable=False)
+    event = db.Column(db.String(40), nullable=False)
+    user_id = db.Column(db.String(36), nullable=True)
+    username = db.Column(db.String(30), nullable=True)
+    ip_address = db.Column(db.String(45), nullable=True)
+    user_agent = db.Column(db.String(250), nullable=True)
+    data = db.Column(db.Text, nullable=True)
+
+    def __repr__(self):
+        return "<AuditEvent '{}' at {}>".format(self.event, self.created_at)
+
+
+@event.listens_for(AuditEvent, "before_update")
+@event.listens_for(AuditEvent, "before_delete")
+def prevent_audit_event_changes(
+    mapper: Mapper, connection: Connection, target: DeclarativeMeta
+):
+    raise RuntimeError("Audit events are append-only.")
+
+
 @event.listens_for(User, "after_insert")
 def create_profile_for_user(
     mapper: Mapper, connection: Connection, target: DeclarativeMeta
@@ -0,0 +1,540 @@
+"""
+Opt-in statistical profiling of the requests.
+
+A single background thread samples, every `PROFILER_INTERVAL_MS`, the stacks
+of the threads handling the profiled requests, and of the event loops
+running their async views (`sys._current_frames()`, nothing is traced). A
+fraction `PROFILER_SAMPLE_RATE` of the requests is profiled, and the
+profiles of those over `PROFILER_THRESHOLD_MS` are written by the sampling
+thread as collapsed stacks (flamegraph.pl, speedscope) or pstats files,
+named after the time, endpoint, request id and duration of the request. The
+directory keeps the newest `PROFILER_MAX_FILES` profiles.
+
+The threshold only filters the sampled requests, a slow request which isn't
+sampled is never profiled. Without `PROFILER_SAMPLE_RATE`, every request is
+profiled when a threshold is set (1% otherwise).
+
+The settings are changed at runtime, without a restart, by `flask profiler`
+which writes the control file of the directory, read again by every worker.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import marshal
+import functools
+import threading
+import contextvars
+import typing as t
+
+from collections import Counter, deque
+from datetime import datetime
+from types import CodeType
+
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+
+from flask import Flask
+
+# Output formats of the profiles and their file extensions.
+PROFILE_FORMATS = {"collapsed": ".collapsed", "pstats": ".pstats"}
+
+# File of the directory holding the runtime settings.
+CONTROL_FILE = "control.json"
+
+_UNSAFE_CHARACTERS = re.compile(r"[^\w.-]+")
+
+# Profile of the request being handled, seen by the async views.
+_current_profile: contextvars.ContextVar = contextvars.ContextVar(
+    "current_profile", default=None
+)
+
+
+class ProfilerSettings(t.NamedTuple):
+    enabled: bool = False
+    sample_rate: t.Optional[float] = None
+    threshold_ms: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        """
+        The fraction of the requests profiled, all of them by default when
+        only the slow ones are kept.
+        """
+        if self.sample_rate is not None:
+            return self.sample_rate
+
+        return 1.0 if self.threshold_ms > 0 else 0.01
+
+
+def get_rate(value) -> t.Optional[float]:
+    # Unset, the rate depends on the threshold.
+    return None if value in (None, "") else float(value)
+
+
+class ProfilerControl:
+    """
+    Runtime settings of the profiler, read from the control file.
+
+    :param path: The control file, the defaults apply while it's missing.
+    :param defaults: The settings of the configuration.
+    :param reload_interval: Seconds between two checks of the file.
+    """
+
+    def __init__(
+        self, path: str, defaults: ProfilerSettings, reload_interval: float = 2.0
+    ):
+        self.path = path
+        self.defaults = defaults
+        self.reload_interval = reload_interval
+
+        self._settings = defaults
+        self._mtime = None
+        self._checked_at = 0.0
+
+    def get(self) -> ProfilerSettings:
+        """
+        Returns the current settings, the file is checked once per interval.
+        """
+        now = time.monotonic()
+
+        if now - self._checked_at < self.reload_interval:
+            return self._settings
+
+        self._checked_at = now
+
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+
+        if mtime != self._mtime:
+            self._mtime = mtime
+            self._settings = self.load()
+
+        return self._settings
+
+    def load(self) -> ProfilerSettings:
+        """
+        Read the settings of the control file over the defaults.
+        """
+        try:
+            with open(self.path) as file:
+                values = json.load(file)
+
+            return self.defaults._replace(
+                enabled=bool(values.get("enabled", self.defaults.enabled)),
+                sample_rate=get_rate(
+                    values.get("sample_rate", self.defaults.sample_rate)
+                ),
+                threshold_ms=float(
+                    values.get("threshold_ms", self.defaults.threshold_ms)
+                ),
+            )
+        except (OSError, ValueError, TypeError, AttributeError):
+            return self.defaults
+
+    def save(self, settings: ProfilerSettings):
+        """
+        Write the settings for every worker (atomically).
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary = "%s.%d.tmp" % (self.path, os.getpid())
+
+        with open(temporary, "w") as file:
+            json.dump(settings._asdict(), file)
+
+        os.replace(temporary, self.path)
+        self._checked_at = 0.0
+
+
+class RequestProfile:
+    """
+    The stacks sampled while handling a request.
+
+    :param request_id: The id of the request, in the name of the profile.
+    """
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.threads = {threading.get_ident()}
+        self.samples: t.Counter[t.Tuple[CodeType, ...]] = Counter()
+        self.ticks = 0
+        self.started = time.perf_counter()
+        self.created_at = datetime.now()
+        self.duration_ms = 0.0
+        self.endpoint = None
+
+
+def get_stack(frame) -> t.Tuple[CodeType, ...]:
+    """
+    Returns the code objects of a stack, outermost first.
+    """
+    stack = []
+
+    while frame is not None:
+        stack.append(frame.f_code)
+        frame = frame.f_back
+
+    stack.reverse()
+    return tuple(stack)
+
+
+def get_frame_label(code: CodeType) -> str:
+    # Collapsed stacks are separated by `;` and end with ` <count>`.
+    filename = os.path.basename(code.co_filename)
+    return "%s (%s:%d)" % (code.co_name, filename, code.co_firstlineno)
+
+
+def get_function_key(code: CodeType) -> t.Tuple[str, int, str]:
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def format_collapsed(samples: t.Mapping[t.Tuple[CodeType, ...], int]) -> str:
+    """
+    Format the samples as collapsed stacks, one `frame;frame count` per line.
+    """
+    lines = []
+
+    for stack, count in samples.items():
+        labels = ";".join(get_frame_label(code).replace(";", ":") for code in stack)
+        lines.append("%s %d" % (labels, count))
+
+    return "\n".join(sorted(lines)) + "\n"
+
+
+def build_pstats(
+    samples: t.Mapping[t.Tuple[CodeType, ...], int], interval: float
+) -> dict:
+    """
+    Build the `pstats` statistics of the samples, each sample counting for
+    `interval` seconds (the call counts are sample counts).
+    """
+    stats = {}
+
+    for stack, count in samples.items():
+        duration = count * interval
+        seen = set()
+
+        for index, code in enumerate(stack):
+            key = get_function_key(code)
+            leaf = index == len(stack) - 1
+            cc, nc, tt, ct, callers = stats.get(key, (0, 0, 0.0, 0.0, {}))
+
+            if key not in seen:
+                # Recursive calls are counted once per sample.
+                seen.add(key)
+                cc, nc, ct = cc + count, nc + count, ct + duration
+
+            if leaf:
+                tt += duration
+
+            if index:
+                caller = get_function_key(stack[index - 1])
+                c_cc, c_nc, c_tt, c_ct = callers.get(caller, (0, 0, 0.0, 0.0))
+                callers[caller] = (
+                    c_cc + count,
+                    c_nc + count,
+                    c_tt + (duration if leaf else 0.0),
+                    c_ct + duration,
+                )
+
+            stats[key] = (cc, nc, tt, ct, callers)
+
+    return stats
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of the profiled requests and writes their profiles.
+
+    :param directory: The directory of the profiles.
+    :param interval: Seconds between two samples.
+    :param output_format: The format of the profiles, see `PROFILE_FORMATS`.
+    :param max_files: The number of profiles kept in the directory.
+    :param logger: Logger receiving the write errors.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        interval: float = 0.005,
+        output_format: str = "collapsed",
+        max_files: int = 200,
+        logger=None,
+    ):
+        if output_format not in PROFILE_FORMATS:
+            raise ValueError("Invalid profile format: '%s'" % output_format)
+
+        self.directory = directory
+        self.interval = interval
+        self.output_format = output_format
+        self.max_files = max_files
+        self.logger = logger
+
+        self._profiles: t.Set[RequestProfile] = set()
+        self._finished: t.Deque[RequestProfile] = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # A forked worker starts its own sampling thread.
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._profiles.clear()
+                self._finished.clear()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name="profiler", daemon=True
+                )
+                self._thread.start()
+
+    def start(self, request_id: str) -> RequestProfile:
+        """
+        Start sampling the stacks of the current thread.
+        """
+        self._ensure_started()
+        profile = RequestProfile(request_id)
+
+        with self._lock:
+            self._profiles.add(profile)
+
+        self._wakeup.set()
+        return profile
+
+    def stop(self, profile: RequestProfile, keep: bool):
+        """
+        Stop sampling a request, its profile is written if `keep`.
+        """
+        profile.duration_ms = (time.perf_counter() - profile.started) * 1000
+
+        with self._lock:
+            self._profiles.discard(profile)
+
+            if keep and profile.samples:
+                self._finished.append(profile)
+
+        if keep:
+            self._wakeup.set()
+
+    def sample(self):
+        """
+        Record the stacks of the threads of every profiled request once.
+        """
+        frames = sys._current_frames()
+
+        with self._lock:
+            profiles = list(self._profiles)
+
+        for profile in profiles:
+            profile.ticks += 1
+
+            for ident in list(profile.threads):
+                frame = frames.get(ident)
+
+                if frame is not None:
+                    profile.samples[get_stack(frame)] += 1
+
+    def _run(self):
+        while True:
+            # Cleared first, a request started meanwhile sets it again.
+            self._wakeup.clear()
+
+            while self._finished:
+                self.write(self._finished.popleft())
+
+            if not self._profiles:
+                self._wakeup.wait()
+                continue
+
+            time.sleep(self.interval)
+            self.sample()
+
+    def get_filename(self, profile: RequestProfile) -> str:
+        endpoint = _UNSAFE_CHARACTERS.sub("_", profile.endpoint or "unknown")
+
+        return "%s-%s-%s-%dms%s" % (
+            profile.created_at.strftime("%Y%m%d-%H%M%S-%f"),
+            endpoint,
+            profile.request_id,
+            profile.duration_ms,
+            PROFILE_FORMATS[self.output_format],
+        )
+
+    def write(self, profile: RequestProfile) -> t.Optional[str]:
+        """
+        Write a profile and remove the oldest ones over `max_files`.
+
+        :return: The path of the profile.
+        """
+        path = os.path.join(self.directory, self.get_filename(profile))
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+
+            if self.output_format == "pstats":
+                # The sleeps of the sampling thread overshoot the interval.
+                interval = profile.duration_ms / 1000 / max(profile.ticks, 1)
+
+                with open(path, "wb") as file:
+                    marshal.dump(build_pstats(profile.samples, interval), file)
+            else:
+                with open(path, "w") as file:
+                    file.write(format_collapsed(profile.samples))
+
+            self.rotate()
+        except OSError:
+            if self.logger:
+                self.logger.exception("Failed to write the profile %s", path)
+
+            return None
+
+        return path
+
+    def files(self) -> t.List[str]:
+        """
+        Returns the profiles of the directory, oldest first.
+        """
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+
+        extensions = tuple(PROFILE_FORMATS.values())
+        return sorted(name for name in names if name.endswith(extensions))
+
+    def rotate(self):
+        names = self.files()
+
+        for name in names[: max(0, len(names) - self.max_files)]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+def get_request_id(environ) -> str:
+    """
+    Returns the `X-Request-ID` of the request if it's safe, or a new id.
+    """
+    request_id = _UNSAFE_CHARACTERS.sub("", environ.get("HTTP_X_REQUEST_ID", ""))
+    return request_id[:64] or uuid.uuid4().hex[:16]
+
+
+class ProfilerMiddleware:
+    """
+    Profiles the requests selected by the runtime settings.
+
+    :param wsgi_app: The wrapped WSGI application.
+    :param app: The application, to name the endpoints of the profiles.
+    :param profiler: The sampling profiler.
+    :param control: The runtime settings.
+    """
+
+    def __init__(
+        self,
+        wsgi_app,
+        app: Flask,
+        profiler: SamplingProfiler,
+        control: ProfilerControl,
+    ):
+        self.wsgi_app = wsgi_app
+        self.app = app
+        self.profiler = profiler
+        self.control = control
+
+    def get_endpoint(self, environ) -> str:
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+            return endpoint
+        except RequestRedirect:
+            return "redirect"
+        except HTTPException as e:
+            return str(e.code)
+
+    def __call__(self, environ, start_response):
+        settings = self.control.get()
+
+        if not settings.enabled or random.random() >= settings.rate:
+            return self.wsgi_app(environ, start_response)
+
+        request_id = get_request_id(environ)
+
+        def start_profiled_response(status, headers, exc_info=None):
+            headers.append(("X-Request-ID", request_id))
+            return start_response(status, headers, exc_info)
+
+        profile = self.profiler.start(request_id)
+        token = _current_profile.set(profile)
+
+        try:
+            return self.wsgi_app(environ, start_profiled_response)
+        finally:
+            _current_profile.reset(token)
+            keep = (time.perf_counter() - profile.started) * 1000 >= (
+                settings.threshold_ms
+            )
+
+            if keep:
+                profile.endpoint = self.get_endpoint(environ)
+
+            self.profiler.stop(profile, keep)
+
+
+def profile_event_loop(func: t.Callable) -> t.Callable:
+    """
+    Decorate an async view so the thread of its event loop is sampled with
+    the thread handling the request.
+    """
+
+    @functools.wraps(func)
+    async def decorator(*args, **kwargs):
+        profile = _current_profile.get()
+
+        if profile is not None:
+            profile.threads.add(threading.get_ident())
+
+        return await func(*args, **kwargs)
+
+    return decorator
+
+
+def init_profiler(app: Flask) -> SamplingProfiler:
+    """
+    Install the sampling profiler of the requests.
+    """
+    directory = app.config["PROFILER_DIR"]
+
+    profiler = SamplingProfiler(
+        directory,
+        interval=app.config["PROFILER_INTERVAL_MS"] / 1000,
+        output_format=app.config["PROFILER_FORMAT"],
+        max_files=app.config["PROFILER_MAX_FILES"],
+        logger=app.logger,
+    )
+    control = ProfilerControl(
+        os.path.join(directory, CONTROL_FILE),
+        ProfilerSettings(
+            enabled=app.config["PROFILER_ENABLED"],
+            sample_rate=get_rate(app.config["PROFILER_SAMPLE_RATE"]),
+            threshold_ms=app.config["PROFILER_THRESHOLD_MS"],
+        ),
+    )
+
+    # The async views run in the thread of an event loop, sampled as well.
+    async_to_sync = app.async_to_sync
+    app.async_to_sync = lambda func: async_to_sync(profile_event_loop(func))
+
+    app.wsgi_app = ProfilerMiddleware(app.wsgi_app, app, profiler, control)
+    app.extensions["profiler"] = profiler
+
+    return profiler
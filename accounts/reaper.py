@@ -0,0 +1,217 @@
+"""
+Batched removal of the accounts never confirmed and of their residue.
+
+Every batch runs in its own short transaction: the candidate users are
+locked (skipping the rows locked by a running request on PostgreSQL),
+deleted with their tokens, profiles and OAuth links, and committed. Their
+avatar files are removed afterwards, in parallel. An interrupted run is
+resumed by running it again, the avatar files it left behind being removed
+by the orphan sweep.
+"""
+
+import os
+import time
+import typing as t
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from accounts.models import (
+    OAuthProvider,
+    Profile,
+    RefreshToken,
+    User,
+    UserSecurityToken,
+)
+from accounts.utils import get_upload_path, remove_existing_file
+
+# Tables holding the rows of a user, deleted before the user itself.
+USER_RELATED_TABLES = (
+    UserSecurityToken.__table__,
+    RefreshToken.__table__,
+    OAuthProvider.__table__,
+    Profile.__table__,
+)
+
+
+def remove_files(paths: t.Iterable[str], workers: int = 8) -> int:
+    """
+    Remove files in parallel, returns the number of files removed.
+    """
+
+    def remove(path: str) -> bool:
+        try:
+            remove_existing_file(path)
+        except OSError:
+            return False
+
+        return not os.path.exists(path)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(remove, paths))
+
+
+class AccountReaper:
+    """
+    Deletes the unconfirmed accounts older than `max_age` in batches.
+
+    :param engine: The engine of the accounts database.
+    :param root_path: The application root path, to locate the avatar files.
+    :param max_age: Age past which an unconfirmed account is deleted.
+    :param batch_size: Accounts deleted per transaction.
+    :param workers: Threads removing the avatar files.
+    :param pause: Seconds to sleep between batches, letting other writers in.
+    :param lock_timeout: Maximum wait for row locks (PostgreSQL only).
+    :param echo: Callable receiving progress messages.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        root_path: str,
+        max_age: timedelta,
+        batch_size: int = 500,
+        workers: int = 8,
+        pause: float = 0,
+        lock_timeout: str = "5s",
+        echo: t.Callable[[str], t.Any] = print,
+    ):
+        self.engine = engine
+        self.root_path = root_path
+        self.cutoff = datetime.now() - max_age
+        self.batch_size = batch_size
+        self.workers = workers
+        self.pause = pause
+        self.lock_timeout = lock_timeout
+        self.echo = echo
+
+        self.user = User.__table__
+        self.profile = Profile.__table__
+
+    @property
+    def criteria(self) -> tuple:
+        return (self.user.c.active.is_(False), self.user.c.created_at < self.cutoff)
+
+    def _set_lock_timeout(self, connection: Connection):
+        if self.engine.dialect.name == "postgresql":
+            connection.execute(
+                text("SET LOCAL lock_timeout = '%s'" % self.lock_timeout)
+            )
+
+    def count(self) -> int:
+        """
+        Returns the number of accounts to delete.
+        """
+        with self.engine.connect() as connection:
+            return connection.execute(
+                select(func.count()).select_from(self.user).where(*self.criteria)
+            ).scalar()
+
+    def reap_batch(self) -> t.Tuple[int, t.List[str]]:
+        """
+        Delete one batch of accounts.
+
+        :return: The number of deleted accounts and their avatar file paths.
+        """
+        statement = (
+            select(self.user.c.id, self.profile.c.avatar)
+            .select_from(
+                self.user.outerjoin(
+                    self.profile, self.profile.c.user_id == self.user.c.id
+                )
+            )
+            .where(*self.criteria)
+            .order_by(self.user.c.created_at)
+            .limit(self.batch_size)
+            .with_for_update(of=self.user, skip_locked=True)
+        )
+
+        with self.engine.begin() as connection:
+            self._set_lock_timeout(connection)
+
+            rows = connection.execute(statement).all()
+            user_ids = list({row.id for row in rows})
+
+            if not user_ids:
+                return 0, []
+
+            for table in USER_RELATED_TABLES:
+                connection.execute(delete(table).where(table.c.user_id.in_(user_ids)))
+
+            connection.execute(delete(self.user).where(self.user.c.id.in_(user_ids)))
+
+        paths = [get_upload_path(row.avatar, self.root_path) for row in rows]
+        return len(user_ids), [path for path in paths if path]
+
+    def run(self) -> t.Dict[str, float]:
+        """
+        Delete the accounts batch by batch until none is left.
+
+        :return: The totals of the run.
+        """
+        started = time.perf_counter()
+        accounts = files = batches = 0
+
+        while True:
+            deleted, paths = self.reap_batch()
+
+            if not deleted:
+                break
+
+            batches += 1
+            accounts += deleted
+            files += remove_files(paths, self.workers)
+            elapsed = time.perf_counter() - started
+
+            self.echo(
+                "Batch %d: %d account(s) deleted, %d total (%.0f accounts/s)."
+                % (batches, deleted, accounts, accounts / elapsed)
+            )
+
+            if self.pause:
+                time.sleep(self.pause)
+
+        return {
+            "accounts": accounts,
+            "files": files,
+            "batches": batches,
+            "elapsed": time.perf_counter() - started,
+        }
+
+    def sweep_orphans(self, upload_folder: str) -> int:
+        """
+        Remove the avatar files of `upload_folder` no profile refers to and
+        older than the cutoff (files of deleted accounts or interrupted runs).
+
+        :return: The number of files removed.
+        """
+        if not os.path.isdir(upload_folder):
+            return 0
+
+        with self.engine.connect() as connection:
+            referenced = {
+                get_upload_path(avatar, self.root_path)
+                for avatar in connection.execute(
+                    select(self.profile.c.avatar).where(self.profile.c.avatar != "")
+                ).scalars()
+            }
+
+        cutoff = self.cutoff.timestamp()
+        orphans = []
+
+        with os.scandir(upload_folder) as entries:
+            for entry in entries:
+                if not entry.is_file() or entry.name.startswith("."):
+                    continue
+
+                path = os.path.normpath(entry.path)
+
+                if path not in referenced and entry.stat().st_mtime < cutoff:
+                    orphans.append(path)
+
+        removed = remove_files(orphans, self.workers)
+        self.echo("Removed %d orphaned avatar file(s)." % removed)
+        return removed
@@ -0,0 +1,164 @@
+"""
+Per-user session epochs for revoking sessions on every device.
+
+The Flask-Login id stored in the session and the remember cookie is
+`<user id>:<epoch>`. Bumping the user's `session_epoch` (password change or
+reset, "log out all devices") makes every id issued before stale.
+
+The current epochs are kept in a short-lived in-process cache, so checking
+a session does not read the database. A bump updates the cache of the worker
+that made it right away, and other workers through Redis pub/sub when
+`SESSION_EPOCH_PUBSUB_URL` is set (otherwise within the cache TTL).
+"""
+
+import json
+import time
+import threading
+import typing as t
+
+from flask import Flask
+
+
+def get_session_token(user_id: str, epoch: int) -> str:
+    """
+    Returns the Flask-Login id embedding the session epoch.
+    """
+    return "%s:%d" % (user_id, epoch or 0)
+
+
+def split_session_token(token: str) -> t.Tuple[str, int]:
+    """
+    Split a Flask-Login id into the user id and session epoch.
+
+    Ids issued before epochs existed have no epoch and count as epoch 0.
+    """
+    user_id, _, epoch = token.rpartition(":")
+
+    if not user_id:
+        return token, 0
+
+    try:
+        return user_id, int(epoch)
+    except ValueError:
+        return token, 0
+
+
+class SessionEpochCache:
+    """
+    Thread-safe TTL cache of the current session epoch per user id.
+    """
+
+    def __init__(self, ttl: float = 30.0, max_size: int = 100_000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._epochs: t.Dict[str, t.Tuple[int, float]] = {}
+
+    def get(self, user_id: str) -> t.Optional[int]:
+        entry = self._epochs.get(user_id)
+
+        if entry is None:
+            return None
+
+        epoch, expires_at = entry
+
+        if expires_at < time.monotonic():
+            with self._lock:
+                self._epochs.pop(user_id, None)
+            return None
+
+        return epoch
+
+    def set(self, user_id: str, epoch: int):
+        with self._lock:
+            if len(self._epochs) >= self.max_size:
+                self._epochs.clear()
+
+            current = self._epochs.get(user_id)
+
+            # Never go back to an older epoch from a late (cached) reader.
+            if current is not None and current[0] > epoch:
+                epoch = current[0]
+
+            self._epochs[user_id] = (epoch, time.monotonic() + self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._epochs.clear()
+
+
+# Epoch cache shared by the requests of this worker.
+session_epochs = SessionEpochCache()
+
+
+class EpochSubscriber:
+    """
+    Background Redis subscriber applying the epoch bumps of other workers.
+    """
+
+    def __init__(self, url: str, channel: str):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def publish(self, user_id: str, epoch: int):
+        self.client.publish(
+            self.channel, json.dumps({"user_id": user_id, "epoch": epoch})
+        )
+
+    def ensure_started(self):
+        """
+        Start the listener thread, once per process (after forking).
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._listen, name="session-epochs", daemon=True
+                )
+                self._thread.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+
+                # Bumps may have been missed while disconnected.
+                session_epochs.clear()
+
+                for message in pubsub.listen():
+                    data = json.loads(message["data"])
+                    session_epochs.set(data["user_id"], int(data["epoch"]))
+            except Exception:
+                time.sleep(1)
+
+
+def init_session_epochs(app: Flask):
+    """
+    Configure the epoch cache and its invalidation for the application.
+    """
+    from .signals import sessions_revoked
+
+    session_epochs.ttl = app.config["SESSION_EPOCH_CACHE_TTL"]
+    url = app.config.get("SESSION_EPOCH_PUBSUB_URL")
+    subscriber = None
+
+    if url:
+        subscriber = EpochSubscriber(url, app.config["SESSION_EPOCH_CHANNEL"])
+
+        @app.before_request
+        def start_epoch_subscriber():
+            subscriber.ensure_started()
+
+    @sessions_revoked.connect_via(app, weak=False)
+    def on_sessions_revoked(sender, user_id, epoch, **extra):
+        session_epochs.set(user_id, epoch)
+
+        if subscriber is not None:
+            subscriber.publish(user_id, epoch)
@@ -0,0 +1,347 @@
+"""
+Server-side sessions for the application.
+
+The session cookie only carries an opaque random id, the session data lives
+in a filesystem or Redis backend. Data is stored as MessagePack and only
+written back when it actually changed, or when half of the session lifetime
+has passed so the backend expiry keeps sliding.
+"""
+
+import os
+import re
+import time
+import hashlib
+import secrets
+import tempfile
+import typing as t
+
+import msgpack
+
+from flask import Flask
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+# `secrets.token_urlsafe(32)` output, also keeps ids safe as file names.
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{43}$")
+
+
+def generate_session_id() -> str:
+    """
+    Returns a new opaque session id.
+    """
+    return secrets.token_urlsafe(32)
+
+
+class MsgpackSerializer:
+    """
+    Compact binary session serializer.
+
+    Values are tagged like Flask's cookie serializer does, so tuples, `Markup`
+    (flash messages), bytes, datetimes and UUIDs round-trip unchanged.
+    """
+
+    def __init__(self):
+        self.tagger = TaggedJSONSerializer()
+
+    def dumps(self, value: dict) -> bytes:
+        return msgpack.packb(self.tagger.tag(value), use_bin_type=True)
+
+    def loads(self, data: bytes) -> dict:
+        return msgpack.unpackb(data, raw=False, object_hook=self.tagger.untag)
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """
+    Session data loaded from a backend, tracking modifications.
+    """
+
+    def __init__(
+        self,
+        initial: t.Optional[dict] = None,
+        sid: t.Optional[str] = None,
+        new: bool = False,
+        digest: t.Optional[bytes] = None,
+        age: float = 0.0,
+    ):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+
+        self.sid = sid or generate_session_id()
+        self.new = new
+        self.digest = digest
+        self.age = age
+        self.modified = False
+        self.accessed = False
+
+        # Used to rotate the session id when the user logs in or out, read
+        # without marking the session accessed (`Vary: Cookie`).
+        self.user_id = dict.get(self, "_user_id")
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+
+class FileSystemSessionBackend:
+    """
+    Stores each session in its own file, named after the session id.
+
+    The file modification time is the last write, expired files are ignored
+    on read and removed in bulk by `purge`.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sid: str) -> str:
+        return os.path.join(self.directory, sid)
+
+    def load(self, sid: str, lifetime: int) -> t.Optional[t.Tuple[bytes, float]]:
+        """
+        Returns the stored data and its age in seconds, `None` if missing or expired.
+        """
+        try:
+            with open(self._path(sid), "rb") as file:
+                age = time.time() - os.fstat(file.fileno()).st_mtime
+
+                if age > lifetime:
+                    return None
+
+                return file.read(), age
+        except FileNotFoundError:
+            return None
+
+    def save(self, sid: str, data: bytes, lifetime: int):
+        # Write to a temporary file first so readers never see partial data.
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+
+            os.replace(temp_path, self._path(sid))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def delete(self, sid: str):
+        try:
+            os.remove(self._path(sid))
+        except FileNotFoundError:
+            pass
+
+    def purge(self, lifetime: int, everything: bool = False) -> int:
+        """
+        Remove expired sessions (or all of them) and return how many were removed.
+        """
+        expired_before = time.time() - lifetime
+        removed = 0
+
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+
+                try:
+                    if everything or entry.stat().st_mtime < expired_before:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+
+        return removed
+
+
+class RedisSessionBackend:
+    """
+    Stores sessions as Redis strings, expired by Redis itself.
+    """
+
+    def __init__(self, url: str, prefix: str = "session:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def load(self, sid: str, lifetime: int) -> t.Optional[t.Tuple[bytes, float]]:
+        """
+        Returns the stored data and its age in seconds, `None` if missing or expired.
+        """
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.get(self.prefix + sid)
+        pipeline.ttl(self.prefix + sid)
+        data, ttl = pipeline.execute()
+
+        if data is None:
+            return None
+
+        return data, max(0, lifetime - ttl)
+
+    def save(self, sid: str, data: bytes, lifetime: int):
+        self.client.set(self.prefix + sid, data, ex=lifetime)
+
+    def delete(self, sid: str):
+        self.client.delete(self.prefix + sid)
+
+    def purge(self, lifetime: int, everything: bool = False) -> int:
+        """
+        Remove all sessions when `everything` is set, Redis drops expired keys
+        on its own. Returns how many sessions were removed.
+        """
+        if not everything:
+            return 0
+
+        removed = 0
+        pipeline = self.client.pipeline(transaction=False)
+
+        for key in self.client.scan_iter(match=self.prefix + "*", count=1000):
+            pipeline.delete(key)
+            removed += 1
+
+            if removed % 1000 == 0:
+                pipeline.execute()
+
+        pipeline.execute()
+        return removed
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Session interface keeping only an opaque session id in the cookie.
+    """
+
+    serializer = MsgpackSerializer()
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get_lifetime(self, app: Flask) -> int:
+        return int(app.permanent_session_lifetime.total_seconds())
+
+    def open_session(self, app: Flask, request) -> ServerSideSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+
+        if sid and _SESSION_ID.match(sid):
+            stored = self.backend.load(sid, self.get_lifetime(app))
+
+            if stored is not None:
+                data, age = stored
+
+                try:
+                    return ServerSideSession(
+                        self.serializer.loads(data),
+                        sid=sid,
+                        digest=hashlib.blake2b(data, digest_size=16).digest(),
+                        age=age,
+                    )
+                except (ValueError, TypeError, msgpack.UnpackException):
+                    # Unreadable data, start over with a new session.
+                    pass
+
+        return ServerSideSession(new=True)
+
+    def save_session(self, app: Flask, session: ServerSideSession, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+        lifetime = self.get_lifetime(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if session.modified and not session.new:
+                self.backend.delete(session.sid)
+                response.delete_cookie(
+                    name,
+                    domain=domain,
+                    path=path,
+                    secure=secure,
+                    samesite=samesite,
+                    httponly=httponly,
+                )
+                response.vary.add("Cookie")
+
+            return
+
+        if session.modified and session.get("_user_id") != session.user_id:
+            # Rotate the id on login and logout against session fixation.
+            if not session.new:
+                self.backend.delete(session.sid)
+
+            session.sid = generate_session_id()
+            session.new = True
+
+        written = False
+
+        if session.modified or session.age > lifetime / 2:
+            data = self.serializer.dumps(dict(session))
+            digest = hashlib.blake2b(data, digest_size=16).digest()
+
+            # Assigning an unchanged value (theme and locale on every request)
+            # marks the session modified, skip those writes.
+            if session.new or digest != session.digest or session.age > lifetime / 2:
+                self.backend.save(session.sid, data, lifetime)
+                written = True
+
+        # The id only changes for new sessions, permanent cookies are
+        # refreshed together with the backend expiry.
+        if session.new or (written and session.permanent):
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=httponly,
+                domain=domain,
+                path=path,
+                secure=secure,
+                samesite=samesite,
+            )
+            response.vary.add("Cookie")
+
+
+def get_session_backend(app: Flask):
+    """
+    Returns the backend configured by `SESSION_BACKEND`, `None` for the
+    default signed-cookie sessions.
+    """
+    backend = app.config.get("SESSION_BACKEND", "cookie")
+
+    if backend == "cookie":
+        return None
+
+    if backend == "filesystem":
+        return FileSystemSessionBackend(app.config["SESSION_FILE_DIR"])
+
+    if backend == "redis":
+        return RedisSessionBackend(
+            app.config["SESSION_REDIS_URL"], prefix=app.config["SESSION_KEY_PREFIX"]
+        )
+
+    raise RuntimeError("Invalid session backend: '%s'" % backend)
+
+
+def init_session_interface(app: Flask):
+    """
+    Replace the signed-cookie session with the configured server-side backend.
+    """
+    backend = get_session_backend(app)
+
+    if backend is not None:
+        app.session_interface = ServerSideSessionInterface(backend)
@@ -0,0 +1,50 @@
+"""
+Application signals for authentication events.
+
+Every signal is sent with the current application as the sender, so
+subscribers (metrics, audit log...) stay decoupled from the views.
+"""
+
+from blinker import Namespace
+
+_signals = Namespace()
+
+# Sent after a login attempt, with `result` ("success", "failure", "inactive", "locked"),
+# the submitted `username` and the `user` when known.
+login_attempted = _signals.signal("login-attempted")
+
+# Sent after a new user account is created, with `user`.
+user_registered = _signals.signal("user-registered")
+
+# Sent after a security token is created, with `salt`.
+token_issued = _signals.signal("token-issued")
+
+# Sent after a security token is used and expired, with `salt`.
+token_redeemed = _signals.signal("token-redeemed")
+
+# Sent after an email is handed to the mail server, with `result` ("sent", "failed").
+email_sent = _signals.signal("email-sent")
+
+# Sent when a request is rejected by the rate limiter, with `endpoint`.
+rate_limit_exceeded = _signals.signal("rate-limit-exceeded")
+
+# Sent after a password hash is computed, with `operation` and `duration`.
+password_hashed = _signals.signal("password-hashed")
+
+# Sent after every session of a user is revoked, with `user_id` and the new `epoch`.
+sessions_revoked = _signals.signal("sessions-revoked")
+
+# Sent after a user's password is changed, with `user` and `reason` ("change", "reset").
+password_changed = _signals.signal("password-changed")
+
+# Sent after a user's new email address is confirmed, with `user` and `previous`.
+email_changed = _signals.signal("email-changed")
+
+# Sent after an OAuth provider is linked to a user, with `user` and `provider`.
+oauth_linked = _signals.signal("oauth-linked")
+
+# Sent after an OAuth provider is unlinked from a user, with `user` and `provider`.
+oauth_unlinked = _signals.signal("oauth-unlinked")
+
+# Sent after a user deletes their account, with `user`.
+account_deleted = _signals.signal("account-deleted")
@@ -0,0 +1,191 @@
+"""
+Log of the slow SQL statements, with their query plan.
+
+Every statement running longer than `SLOW_QUERY_THRESHOLD_MS` is logged
+with its duration, the view that ran it and its parameters, redacted to
+their types. The statements are grouped by fingerprint, a hash of their
+shape (literals and `IN` lists folded), and when `SLOW_QUERY_EXPLAIN` is set
+the plan of a fingerprint (`EXPLAIN`, `EXPLAIN QUERY PLAN` on SQLite) is
+captured and logged the first time it is slow, with the same parameters.
+"""
+
+import json
+import hashlib
+import threading
+import typing as t
+
+from collections import OrderedDict
+
+from sqlalchemy.engine import Engine
+
+from flask import Flask, has_request_context, request
+
+from accounts.instrumentation import get_statement_shape, on_statement_timed
+
+# Statements whose plan is captured, DDL and PRAGMAs are not explained.
+EXPLAINED_STATEMENTS = ("select", "with", "update", "delete", "insert")
+
+
+def get_fingerprint(statement: str) -> str:
+    """
+    Returns the fingerprint of a statement, shared by its executions.
+    """
+    shape = get_statement_shape(statement)
+    return hashlib.blake2b(shape.encode("utf-8"), digest_size=6).hexdigest()
+
+
+def redact_value(value: t.Any) -> t.Any:
+    if value is None:
+        return None
+
+    if isinstance(value, (str, bytes)):
+        return "<%s:%d>" % (type(value).__name__, len(value))
+
+    return "<%s>" % type(value).__name__
+
+
+def redact_parameters(parameters: t.Any) -> t.Any:
+    """
+    Replace the values of the parameters of a statement by their types.
+    """
+    if isinstance(parameters, dict):
+        return {key: redact_value(value) for key, value in parameters.items()}
+
+    if isinstance(parameters, (list, tuple)):
+        return [redact_value(value) for value in parameters]
+
+    return redact_value(parameters)
+
+
+class SlowQueryLog:
+    """
+    Logs the slow statements of the engines and captures their plans.
+
+    :param threshold: Seconds from which a statement is logged.
+    :param explain: Capture the plan of the slow statements.
+    :param plan_cache_size: Fingerprints whose plan was captured, remembered
+        so that a plan is captured once.
+    :param logger: Logger receiving the slow statements.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.1,
+        explain: bool = True,
+        plan_cache_size: int = 500,
+        logger=None,
+    ):
+        self.threshold = threshold
+        self.explain = explain
+        self.plan_cache_size = plan_cache_size
+        self.logger = logger
+
+        self._explained: t.OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def instrument(self, engine: Engine):
+        """
+        Time the statements of an engine with the shared timing hooks.
+        """
+        on_statement_timed(engine, self.on_statement)
+
+    def on_statement(self, conn, statement: str, params, executemany: bool, duration):
+        if duration >= self.threshold:
+            self.record(conn, statement, params, executemany, duration)
+
+    def _should_explain(self, fingerprint: str) -> bool:
+        with self._lock:
+            if fingerprint in self._explained:
+                self._explained.move_to_end(fingerprint)
+                return False
+
+            self._explained[fingerprint] = None
+
+            if len(self._explained) > self.plan_cache_size:
+                self._explained.popitem(last=False)
+
+        return True
+
+    def get_plan(self, conn, statement: str, params) -> t.Optional[t.List[str]]:
+        """
+        Returns the plan of a statement, run on the connection that ran it
+        (with a DBAPI cursor, the engine events don't see it).
+        """
+        dialect = conn.dialect.name
+        prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+        # A failed `EXPLAIN` must not abort the transaction of the request.
+        savepoint = dialect == "postgresql" and conn.in_transaction()
+
+        cursor = conn.connection.cursor()
+
+        try:
+            if savepoint:
+                cursor.execute("SAVEPOINT slow_query_explain")
+
+            try:
+                cursor.execute(prefix + statement, params)
+                rows = cursor.fetchall()
+            except Exception:
+                if savepoint:
+                    cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+
+                raise
+            finally:
+                if savepoint:
+                    cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        finally:
+            cursor.close()
+
+        return [" | ".join(str(column) for column in row) for row in rows]
+
+    def record(self, conn, statement: str, params, executemany: bool, duration: float):
+        """
+        Log a slow statement, with its plan the first time it is slow.
+        """
+        fingerprint = get_fingerprint(statement)
+        item = {
+            "event": "slow_query",
+            "fingerprint": fingerprint,
+            "duration_ms": round(duration * 1000, 3),
+            "endpoint": request.endpoint if has_request_context() else None,
+            "method": request.method if has_request_context() else None,
+            "statement": statement,
+        }
+
+        if executemany:
+            item["parameters"] = redact_parameters(params[0] if params else None)
+            item["rows"] = len(params)
+        else:
+            item["parameters"] = redact_parameters(params)
+
+        explainable = statement.lstrip().lower().startswith(EXPLAINED_STATEMENTS)
+
+        if self.explain and explainable and self._should_explain(fingerprint):
+            try:
+                item["plan"] = self.get_plan(
+                    conn, statement, params[0] if executemany else params
+                )
+            except Exception as e:
+                item["plan_error"] = str(e)
+
+        if self.logger:
+            self.logger.warning(json.dumps(item, default=str))
+
+
+def init_slow_query_log(app: Flask, db) -> SlowQueryLog:
+    """
+    Log the slow statements of the application's engines.
+    """
+    slow_queries = SlowQueryLog(
+        threshold=app.config["SLOW_QUERY_THRESHOLD_MS"] / 1000,
+        explain=app.config["SLOW_QUERY_EXPLAIN"],
+        plan_cache_size=app.config["SLOW_QUERY_PLAN_CACHE"],
+        logger=app.logger,
+    )
+
+    with app.app_context():
+        for engine in db.engines.values():
+            slow_queries.instrument(engine)
+
+    app.extensions["slow_query_log"] = slow_queries
+    return slow_queries
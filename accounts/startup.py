@@ -0,0 +1,158 @@
+"""
+Boot-time profile of a new worker.
+
+The application is created in a new interpreter started with
+`-X importtime`, as a worker would at boot: the import time of every module
+is read from its report, and the wall time and resident memory after each
+`config_*` step of `create_app` are measured by wrapping the steps (the
+steps they call are counted in their own time).
+"""
+
+import os
+import sys
+import json
+import time
+import functools
+import subprocess
+import typing as t
+
+
+def get_rss_mb() -> float:
+    """
+    Returns the resident memory of this process in MiB (its peak resident
+    memory where `/proc` is not available).
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, KiB elsewhere.
+        return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def parse_import_times(report: str) -> t.List[t.Dict[str, t.Any]]:
+    """
+    Parse the `-X importtime` report of an interpreter.
+
+    :return: The imported modules in import order, with their own and
+        cumulative import time in milliseconds and whether they were imported
+        at top level (not by another module being imported).
+    """
+    modules = []
+
+    for line in report.splitlines():
+        if not line.startswith("import time:"):
+            continue
+
+        own, cumulative, name = line[len("import time:") :].split("|", 2)
+
+        if not own.strip().isdigit():
+            # The header of the report.
+            continue
+
+        modules.append(
+            {
+                "module": name.strip(),
+                "self_ms": int(own) / 1000,
+                "cumulative_ms": int(cumulative) / 1000,
+                "top_level": not name[1:].startswith(" "),
+            }
+        )
+
+    return modules
+
+
+def run_factory(config_type: str) -> t.Dict[str, t.Any]:
+    """
+    Create the application with its `config_*` steps timed, in this
+    process, which must not have created an application yet.
+    """
+    import accounts
+
+    steps = []
+    running = []
+
+    def timed(name: str, step: t.Callable) -> t.Callable:
+        @functools.wraps(step)
+        def decorator(*args, **kwargs):
+            if running:
+                return step(*args, **kwargs)
+
+            running.append(name)
+            started = time.perf_counter()
+
+            try:
+                return step(*args, **kwargs)
+            finally:
+                running.pop()
+                steps.append(
+                    {
+                        "step": name,
+                        "ms": (time.perf_counter() - started) * 1000,
+                        "rss_mb": get_rss_mb(),
+                    }
+                )
+
+        return decorator
+
+    for name, step in list(vars(accounts).items()):
+        if name.startswith("config_") and callable(step):
+            setattr(accounts, name, timed(name, step))
+
+    rss_mb = get_rss_mb()
+    started = time.perf_counter()
+    accounts.create_app(config_type, defer_setup=False)
+
+    return {
+        "create_app_ms": (time.perf_counter() - started) * 1000,
+        "rss_before_mb": rss_mb,
+        "rss_mb": get_rss_mb(),
+        "steps": steps,
+    }
+
+
+def profile_startup(
+    config_type: str, cwd: t.Optional[str] = None
+) -> t.Dict[str, t.Any]:
+    """
+    Profile the boot of a new worker: the import time of the modules and
+    the time and resident memory of the `create_app` steps.
+
+    :param config_type: The configuration of the application.
+    :param cwd: The directory of the `accounts` package and `config` module.
+    :raises RuntimeError: If the application can't be created.
+    """
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "accounts.startup", config_type],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    elapsed = (time.perf_counter() - started) * 1000
+
+    if process.returncode:
+        raise RuntimeError(
+            "Failed to create the application: %s" % process.stderr.strip()[-2000:]
+        )
+
+    profile = json.loads(process.stdout.strip().splitlines()[-1])
+    imports = parse_import_times(process.stderr)
+
+    profile["imports"] = imports
+    profile["import_ms"] = sum(
+        module["cumulative_ms"] for module in imports if module["top_level"]
+    )
+    profile["boot_ms"] = elapsed
+
+    return profile
+
+
+if __name__ == "__main__":
+    # The child process of `profile_startup`, the profile is its last line.
+    print(json.dumps(run_factory(sys.argv[1])))
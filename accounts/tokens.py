@@ -0,0 +1,98 @@
+"""
+Access and refresh tokens of the JSON API.
+
+An access token is signed (itsdangerous, with the application's secret key)
+and holds the user id and session epoch of its user: it is verified without
+a database query, against the epoch cache of `accounts.session_epochs`, so a
+session revocation seen by the worker rejects it, and it expires after
+`API_ACCESS_TOKEN_LIFETIME` seconds anyway.
+
+A refresh token is random and only its hash is stored (`RefreshToken`); it
+is exchanged, once, for a new pair of tokens until it expires after
+`API_REFRESH_TOKEN_LIFETIME` days or the sessions of its user are revoked.
+"""
+
+import typing as t
+
+from datetime import timedelta
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from flask import Flask, current_app
+
+from accounts.session_epochs import session_epochs
+
+
+class AccessTokens:
+    """
+    Issues and verifies the signed access tokens.
+
+    :param secret_key: Key of the signatures.
+    :param salt: Salt of the signatures, set apart from the other uses of the key.
+    :param lifetime: Seconds an access token is valid.
+    """
+
+    def __init__(self, secret_key: str, salt: str, lifetime: int = 900):
+        self.serializer = URLSafeTimedSerializer(secret_key, salt=salt)
+        self.lifetime = lifetime
+
+    def issue(self, user) -> str:
+        """
+        Returns a new access token of the user.
+        """
+        return self.serializer.dumps(
+            {"sub": str(user.id), "epoch": user.session_epoch or 0}
+        )
+
+    def verify(self, token: t.Optional[str]) -> t.Optional[t.Dict[str, t.Any]]:
+        """
+        Verifies an access token without reading the database.
+
+        :return: The claims of the token (`sub`, `epoch`), or None if it is
+            invalid, expired or issued before its sessions were revoked.
+        """
+        if not token:
+            return None
+
+        try:
+            claims = self.serializer.loads(token, max_age=self.lifetime)
+        except BadSignature:
+            return None
+
+        current_epoch = session_epochs.get(claims["sub"])
+
+        if current_epoch is not None and current_epoch != claims["epoch"]:
+            return None
+
+        return claims
+
+
+def issue_tokens(user) -> t.Dict[str, t.Any]:
+    """
+    Returns a new access token and refresh token of the user.
+    """
+    from accounts.models import RefreshToken
+
+    access_tokens: AccessTokens = current_app.extensions["api_access_tokens"]
+    lifetime = timedelta(days=current_app.config["API_REFRESH_TOKEN_LIFETIME"])
+
+    return {
+        "access_token": access_tokens.issue(user),
+        "token_type": "Bearer",
+        "expires_in": access_tokens.lifetime,
+        "refresh_token": RefreshToken.issue(user, lifetime),
+    }
+
+
+def init_access_tokens(app: Flask) -> AccessTokens:
+    """
+    Configure the access tokens of the application's API.
+    """
+    access_tokens = AccessTokens(
+        app.config["SECRET_KEY"],
+        salt=app.config["SALT_API_ACCESS_TOKEN"],
+        lifetime=app.config["API_ACCESS_TOKEN_LIFETIME"],
+    )
+
+    app.extensions["api_access_tokens"] = access_tokens
+    return access_tokens
@@ -2,6 +2,7 @@ import os
 import secrets
 import random
 import string
+import time
 import uuid
 import typing as t
 
@@ -20,6 +21,28 @@ def get_unique_id() -> t.AnyStr:
     return str(uuid.uuid4())
 
 
+def get_time_ordered_id() -> t.AnyStr:
+    """
+    Generate a time-ordered unique identifier (`UUIDv7`).
+
+    The first 48 bits hold the Unix timestamp in milliseconds, so new
+    identifiers sort after older ones and are appended to the end of
+    the primary key index instead of being scattered across it.
+
+    Returns:
+        str: A unique identifier string.
+    """
+    timestamp = time.time_ns() // 1_000_000
+
+    value = (timestamp & 0xFFFFFFFFFFFF) << 80
+    value |= 0x7 << 76  # version
+    value |= secrets.randbits(12) << 64
+    value |= 0b10 << 62  # variant
+    value |= secrets.randbits(62)
+
+    return str(uuid.UUID(int=value))
+
+
 def unique_security_token() -> t.AnyStr:
     """
     Generate a unique security token that does not already
@@ -76,6 +99,44 @@ def remove_existing_file(path=None):
         os.remove(path)
 
 
+def get_limiter_storage(app, limiter):
+    """
+    Returns the storage backend of the rate limiter, shared by the workers,
+    for counters kept outside of the limits (login backoff, email cooldowns).
+
+    When the limiter is disabled (e.g. testing), a storage of the same
+    `RATELIMIT_STORAGE_URI` is created instead.
+    """
+    from limits.storage import storage_from_string
+
+    if limiter.enabled and limiter.initialized:
+        return limiter.storage
+
+    return storage_from_string(app.config.get("RATELIMIT_STORAGE_URI", "memory://"))
+
+
+def get_upload_path(url: str, root_path: str = None) -> t.Optional[str]:
+    """
+    Returns the local path of an uploaded file from its URL, or `None` if
+    the URL doesn't point into the upload folder.
+
+    :param url: The stored URL, e.g. `/static/assets/uploads/profile/a.jpg`.
+    :param root_path: The application root path (default: current app).
+    """
+    from config import UPLOAD_FOLDER
+
+    if not url:
+        return None
+
+    path = os.path.normpath((root_path or current_app.root_path) + url)
+    upload_folder = os.path.normpath(UPLOAD_FOLDER)
+
+    if os.path.commonpath([path, upload_folder]) != upload_folder:
+        return None
+
+    return path
+
+
 def get_username_from_email(email: str) -> str:
     """
     Create a username from the email address by taking the part before the '@'.
@@ -111,21 +172,17 @@ def generate_unique_username(email: str = None) -> str:
     return f"{base}_{suffix}"
 
 
-def download_and_save_image_from_url(
-    url: str, save_path: str = None, filename: str = None
-) -> str:
+def save_image(content: bytes, save_path: str = None, filename: str = None) -> str:
     """
-    Downloads image from the url and saves to specific path.
+    Saves image content to specific path.
 
-    :params url: The URL of the image to download.
+    :params content: The image bytes.
     :params save_path: Optional directory where the image will be saved.
     :params filename: Optional custom filename for the saved image.
 
     Returns:
         str: The filename of the saved image.
     """
-    import requests
-
     from config import UPLOAD_FOLDER
 
     if not save_path:
@@ -134,20 +191,9 @@ def download_and_save_image_from_url(
     os.makedirs(save_path, exist_ok=True)
 
     if not filename:
-        filename = get_unique_filename(os.path.basename(url))
-
-    file_path = os.path.join(save_path, filename)
-
-    try:
-        response = requests.get(url, stream=True, timeout=5)
-        response.raise_for_status()
-
-        if response.status_code == 200:
-            with open(file_path, "wb") as file:
-                file.write(response.content)
-            return filename
-        else:
-            return None
-    except requests.RequestException as e:
-        current_app.logger.error(f"Error downloading image: {e}")
-        return None
+        filename = get_unique_id()
+
+    with open(os.path.join(save_path, filename), "wb") as file:
+        file.write(content)
+
+    return filename
@@ -1,4 +1,5 @@
 import re
+import asyncio
 
 from datetime import timedelta
 from http import HTTPStatus
@@ -11,14 +12,32 @@ from flask import Blueprint, Response
 from flask import abort, current_app, render_template, request, redirect, url_for, flash
 from flask_babel import lazy_gettext as _
 from flask_login import current_user, login_required, login_user, logout_user
-
-from accounts.decorators import authentication_redirect, guest_user_exempt
+from flask_login.config import COOKIE_NAME
+
+from accounts.activity import record_login
+from accounts.async_utils import Deadline, background, fetch_content
+from accounts.backoff import authenticate
+from accounts.decorators import (
+    authentication_redirect,
+    guest_user_exempt,
+    test_user_exempt,
+)
 from accounts.email_utils import (
     send_reset_password,
     send_reset_email,
 )
 from accounts.extensions import database as db, limiter, oauth
 from accounts.models import User, OAuthProvider
+from accounts.signals import (
+    account_deleted,
+    email_changed,
+    login_attempted,
+    oauth_linked,
+    oauth_unlinked,
+    password_changed,
+    token_redeemed,
+    user_registered,
+)
 from accounts.forms import (
     RegisterForm,
     LoginForm,
@@ -32,7 +51,7 @@ from accounts.forms import (
 from accounts.utils import (
     get_unique_id,
     get_username_from_email,
-    download_and_save_image_from_url,
+    save_image,
 )
 
 
@@ -43,28 +62,54 @@ within our application.
 accounts = Blueprint("accounts", __name__, template_folder="templates")
 
 
+def relogin_current_device(user: User):
+    """
+    Log the user in again on the current device after their sessions
+    were revoked, keeping the remember-me choice of this device.
+    """
+    cookie_name = current_app.config.get("REMEMBER_COOKIE_NAME", COOKIE_NAME)
+    remember = cookie_name in request.cookies
+
+    login_user(user, remember=remember, duration=timedelta(days=15))
+
+
 @accounts.route("/login_as_guest", methods=["GET", "POST"])
 @authentication_redirect
 @limiter.limit("3/minute", methods=["POST"])
 def login_guest_user() -> Response:
     """
-    Log in as a guest user with limited access.
+    Log in to a guest account of its own, with limited access.
 
     :return: Redirects to the homepage on success or the login page on failure.
     """
 
     if request.method == "POST":
-        # Fetch the predefined guest user instance by username.
-        test_user = User.get_user_by_username(username="testuser")
+        guest_pool = current_app.extensions.get("guest_pool")
 
-        if test_user:
-            # Log in the guest user with a session duration of (1 day) only.
-            login_user(test_user, remember=True, duration=timedelta(days=1))
+        if guest_pool:
+            # Hand out a free guest account from the pool.
+            guest = User.get_user_by_id(guest_pool.claim())
+
+            # Log in the guest user for the lifetime of the guest account only.
+            login_user(
+                guest,
+                remember=True,
+                duration=timedelta(hours=current_app.config["GUEST_LIFETIME_HOURS"]),
+            )
+            record_login(guest)
+
+            login_attempted.send(
+                current_app._get_current_object(),
+                result="success",
+                username=guest.username,
+                user=guest,
+                provider="guest",
+            )
 
             flash(_("You are logged in as a Guest User."), "success")
             return redirect(url_for("accounts.index"))
 
-        flash(_("Test user not found."), "error")
+        flash(_("Guest accounts are not available."), "error")
         return redirect(url_for("accounts.login"))
 
     # Return a 404 error if accessed via GET
@@ -104,6 +149,8 @@ def register() -> Response:
             password=password,
         )
 
+        user_registered.send(current_app._get_current_object(), user=user)
+
         # Sends account confirmation mail to the user.
         user.send_confirmation()
 
@@ -137,13 +184,43 @@ def login() -> Response:
         password = form.data.get("password", None)
         remember = form.data.get("remember", True)
 
-        # Attempt to authenticate the user from the database.
-        user = User.authenticate(username=username, password=password)
+        # Attempt to authenticate the user, unless the account is locked out
+        # after repeated failures (checked before any password hashing).
+        user, retry_after = authenticate(username=username, password=password)
+
+        if retry_after:
+            login_attempted.send(
+                current_app._get_current_object(),
+                result="locked",
+                username=username,
+                user=None,
+            )
+
+            flash(
+                _(
+                    "Too many failed login attempts. Please try again in %(seconds)d seconds.",
+                    seconds=retry_after,
+                ),
+                "error",
+            )
+        elif not user:
+            login_attempted.send(
+                current_app._get_current_object(),
+                result="failure",
+                username=username,
+                user=None,
+            )
 
-        if not user:
             flash(_("Invalid username or password. Please try again."), "error")
         else:
             if not user.is_active:
+                login_attempted.send(
+                    current_app._get_current_object(),
+                    result="inactive",
+                    username=username,
+                    user=user,
+                )
+
                 # User account is not active, send confirmation email.
                 user.send_confirmation()
 
@@ -157,6 +234,14 @@ def login() -> Response:
 
             # Log the user in and set the session to remember the user for (15 days).
             login_user(user, remember=remember, duration=timedelta(days=15))
+            record_login(user)
+
+            login_attempted.send(
+                current_app._get_current_object(),
+                result="success",
+                username=username,
+                user=user,
+            )
 
             flash(_("You are logged in successfully."), "success")
             return redirect(url_for("accounts.index"))
@@ -203,8 +288,11 @@ def confirm_account() -> Response:
                 # Handle database error that occur during the account activation.
                 raise InternalServerError
 
+            token_redeemed.send(current_app._get_current_object(), salt=auth_token.salt)
+
             # Log the user in and set the session to remember the user for (15 days).
             login_user(user, remember=True, duration=timedelta(days=15))
+            record_login(user)
 
             flash(
                 _(f"Welcome {user.username}, You're registered successfully."),
@@ -326,6 +414,19 @@ def reset_password() -> Response:
                         # Commit changes to the database.
                         db.session.commit()
 
+                        token_redeemed.send(
+                            current_app._get_current_object(), salt=salt
+                        )
+                        password_changed.send(
+                            current_app._get_current_object(), user=user, reason="reset"
+                        )
+
+                        # Sign out every device using the previous password.
+                        user.revoke_sessions()
+
+                        if current_user.is_authenticated and current_user.id == user.id:
+                            relogin_current_device(user)
+
                         if current_user.is_authenticated:
                             flash(
                                 _("Your password is changed successfully."),
@@ -403,10 +504,19 @@ def change_password() -> Response:
 
                 # Commit changes to the database.
                 db.session.commit()
+
+                # Sign out the other devices, keeping this one logged in.
+                user.revoke_sessions()
             except Exception as e:
                 # Handle database error by raising an internal server error.
                 raise InternalServerError
 
+            password_changed.send(
+                current_app._get_current_object(), user=user, reason="change"
+            )
+
+            relogin_current_device(user)
+
             flash(_("Your password changed successfully."), "success")
             return redirect(url_for("accounts.index"))
 
@@ -491,6 +601,8 @@ def confirm_email() -> Response:
             # Retrieve the user by the ID from the token and update email details.
             user = User.get_user_by_id(auth_token.user_id, raise_exception=True)
 
+            previous = user.email
+
             try:
                 # Update new email address to user.
                 user.email = user.change_email
@@ -505,6 +617,11 @@ def confirm_email() -> Response:
                 # Handle database error by raising an internal server error.
                 raise InternalServerError
 
+            token_redeemed.send(current_app._get_current_object(), salt=auth_token.salt)
+            email_changed.send(
+                current_app._get_current_object(), user=user, previous=previous
+            )
+
             flash(_("Your email address updated successfully."), "success")
             return redirect(url_for("accounts.index"))
 
@@ -529,7 +646,7 @@ def index() -> Response:
 
 @accounts.route("/profile", methods=["GET", "POST"])
 @login_required
-@guest_user_exempt
+@test_user_exempt
 @limiter.limit("8/minute", methods=["POST"])
 def profile() -> Response:
     """
@@ -546,7 +663,7 @@ def profile() -> Response:
     form = EditUserProfileForm()  # A form class to Edit User's Profile.
 
     # Retrieve the fresh user instance based on their ID.
-    user = User.get_user_by_id(current_user.get_id(), raise_exception=True)
+    user = User.get_user_by_id(current_user.id, raise_exception=True)
 
     if form.validate_on_submit():
         username = form.data.get("username")
@@ -602,6 +719,28 @@ def settings() -> Response:
     return render_template("settings.html", form=form)
 
 
+@accounts.post("/account/logout-all")
+@login_required
+@guest_user_exempt
+@limiter.limit("3/minute", methods=["POST"])
+def logout_all_devices() -> Response:
+    """
+    Log the current user out of every device, including this one.
+
+    Returns:
+        Response: A redirect to the login page.
+    """
+    user = User.get_user_by_id(current_user.id, raise_exception=True)
+
+    # Invalidate the sessions and remember cookies of all devices.
+    user.revoke_sessions()
+
+    logout_user()
+
+    flash(_("You're logged out from all devices successfully."), "success")
+    return redirect(url_for("accounts.login"))
+
+
 @accounts.post("/account/delete")
 @login_required
 @guest_user_exempt
@@ -622,6 +761,8 @@ def delete_user() -> Response:
         # Delete the currently logged-in user's account.
         user.delete()
 
+        account_deleted.send(current_app._get_current_object(), user=user)
+
         # Log the user out and remove their session.
         logout_user()
 
@@ -635,15 +776,21 @@ def delete_user() -> Response:
 @accounts.post("/account/google-login")
 @guest_user_exempt
 @limiter.limit("3/minute", methods=["POST"])
-def google_login() -> Response:
+async def google_login() -> Response:
     """
     Initiates the Google OAuth login process.
     """
     redirect_uri = url_for("accounts.google_login_callback", _external=True)
+    deadline = Deadline(current_app.config["GOOGLE_CALLBACK_TIMEOUT"])
 
     try:
-        return oauth.google.authorize_redirect(redirect_uri)
-    except (ConnectionError, OAuthError) as e:
+        # Authlib's client is synchronous, the discovery document is fetched
+        # in a thread so the deadline can be enforced.
+        return await asyncio.wait_for(
+            asyncio.to_thread(oauth.google.authorize_redirect, redirect_uri),
+            timeout=deadline.remaining(),
+        )
+    except (ConnectionError, OAuthError, asyncio.TimeoutError) as e:
         flash(
             _(
                 "Unable to login with Google. Please check your connection and try again."
@@ -655,16 +802,25 @@ def google_login() -> Response:
 
 @accounts.get("/account/google-login/callback")
 @guest_user_exempt
-def google_login_callback() -> Response:
+async def google_login_callback() -> Response:
     """
     Handles the callback from Google OAuth provider after user authentication.
 
+    The profile picture is downloaded on the shared HTTP client while the
+    user is looked up and created, the whole callback being bounded by
+    `GOOGLE_CALLBACK_TIMEOUT` seconds.
+
     Returns:
         Response: Redirects to the login page with a success or error message.
     """
+    deadline = Deadline(current_app.config["GOOGLE_CALLBACK_TIMEOUT"])
+
     try:
-        token = oauth.google.authorize_access_token()
-    except (OAuthError, TokenExpiredError) as e:
+        token = await asyncio.wait_for(
+            asyncio.to_thread(oauth.google.authorize_access_token),
+            timeout=deadline.remaining(),
+        )
+    except (ConnectionError, OAuthError, TokenExpiredError, asyncio.TimeoutError) as e:
         flash(_("Google login failed. Please try again."), "error")
         return redirect(url_for("accounts.login"))
 
@@ -676,6 +832,14 @@ def google_login_callback() -> Response:
         email_verified = user_info.get("email_verified", False)
 
         if email and email_verified:
+            picture_url = user_info.get("picture")
+
+            # Start downloading the profile picture, it is only needed once
+            # the user is known and is overlapped with the database work.
+            avatar_download = (
+                background.submit(fetch_content(picture_url)) if picture_url else None
+            )
+
             # Check if the oauth user already exists into the database.
             oauth_user = OAuthProvider.query.filter_by(
                 provider="google", provider_id=user_info.get("sub")
@@ -684,6 +848,9 @@ def google_login_callback() -> Response:
             if current_user.is_authenticated:
                 # If the user is authenticated, check if the Google account is already linked.
                 if oauth_user and oauth_user.user_id != current_user.id:
+                    if avatar_download:
+                        avatar_download.cancel()
+
                     flash(
                         _(
                             "This Google account is already linked with another user account."
@@ -693,11 +860,15 @@ def google_login_callback() -> Response:
                     return redirect(url_for("accounts.settings"))
 
                 # If the user already exists, retrieve the user instance.
-                user = User.get_user_by_id(current_user.get_id(), raise_exception=True)
+                user = User.get_user_by_id(current_user.id, raise_exception=True)
 
                 # Create a new OAuth provider for the user.
                 user.create_oauth_provider(provider_id=user_info.get("sub", ""))
 
+                oauth_linked.send(
+                    current_app._get_current_object(), user=user, provider="google"
+                )
+
                 flash(_("Your Google account has been linked successfully."), "success")
 
             else:
@@ -716,6 +887,10 @@ def google_login_callback() -> Response:
 
                     # Create a new OAuth provider for the user.
                     user.create_oauth_provider(provider_id=user_info.get("sub", ""))
+
+                    oauth_linked.send(
+                        current_app._get_current_object(), user=user, provider="google"
+                    )
                 else:
                     # If the user already exists, retrieve the user instance.
                     user = User.get_user_by_id(oauth_user.user_id)
@@ -723,17 +898,24 @@ def google_login_callback() -> Response:
             user_profile = user.profile
 
             # Updating users profile data.
-            if user_profile and not user_profile.avatar:
-                picture_url = user_info.get("picture", "")
+            if avatar_download and user_profile and not user_profile.avatar:
+                try:
+                    # The login goes on without a picture past the deadline.
+                    content = await asyncio.wait_for(
+                        avatar_download, timeout=deadline.remaining()
+                    )
+                except asyncio.TimeoutError:
+                    content = None
 
-                # Download and save the user's profile picture.
-                avatar = download_and_save_image_from_url(
-                    url=picture_url, filename=f"{get_unique_id()}.jpg"
-                )
+                if content:
+                    # Save the user's profile picture.
+                    avatar = save_image(content, filename=f"{get_unique_id()}.jpg")
 
-                user_profile.avatar = url_for(
-                    "static", filename="assets/uploads/profile/%s" % avatar
-                )
+                    user_profile.avatar = url_for(
+                        "static", filename="assets/uploads/profile/%s" % avatar
+                    )
+            elif avatar_download:
+                avatar_download.cancel()
 
             # Commit changes to the database.
             db.session.commit()
@@ -741,6 +923,15 @@ def google_login_callback() -> Response:
             if not current_user.is_authenticated:
                 # Log the user in and set the session to remember the user for (15 days).
                 login_user(user, remember=True, duration=timedelta(days=15))
+                record_login(user)
+
+                login_attempted.send(
+                    current_app._get_current_object(),
+                    result="success",
+                    username=user.username,
+                    user=user,
+                    provider="google",
+                )
 
                 flash(_("You are logged in successfully."), "success")
                 return redirect(url_for("accounts.index"))
@@ -767,12 +958,16 @@ def remove_oauth_provider() -> Response:
         flash(_("Something wrong with your request."), "error")
         return redirect(url_for("accounts.settings"), code=HTTPStatus.BAD_REQUEST)
 
-    user = User.get_user_by_id(current_user.get_id(), raise_exception=True)
+    user = User.get_user_by_id(current_user.id, raise_exception=True)
 
     if user and user.is_social_user():
         # Remove the `provider` account from the user's account.
         user.remove_oauth_provider(provider)
 
+        oauth_unlinked.send(
+            current_app._get_current_object(), user=user, provider=provider
+        )
+
         flash(
             f"Your {provider} login provider has been removed successfully.", "success"
         )
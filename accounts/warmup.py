@@ -0,0 +1,190 @@
+"""
+Application warmup, run by `create_app` before the first request.
+
+Compiles the templates, loads the Babel catalogs of every language and
+opens the database connections up front, so the first requests of a new
+worker don't pay for them. With `TEMPLATE_BYTECODE_CACHE_DIR` the compiled
+templates are also shared on disk between workers and deploys.
+"""
+
+import os
+import time
+import weakref
+import typing as t
+
+from flask import Flask, g, request
+
+# Templates of the third-party blueprints that our pages import.
+WARMUP_TEMPLATE_PREFIXES = ("bootstrap5/",)
+
+# Engines whose connections were opened by the warmup, in this process.
+_warmed_engines: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def _dispose_warmed_engines():
+    # Connections opened before a pre-fork server forks must not be shared
+    # with the workers.
+    for engine in list(_warmed_engines):
+        engine.dispose(close=False)
+
+
+# Registered once, at-fork handlers can't be removed.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_dispose_warmed_engines)
+
+
+def config_bytecode_cache(app: Flask):
+    """
+    Store the compiled Jinja templates in `TEMPLATE_BYTECODE_CACHE_DIR`.
+    """
+    from jinja2 import FileSystemBytecodeCache
+
+    directory = app.config.get("TEMPLATE_BYTECODE_CACHE_DIR")
+
+    if not directory:
+        return
+
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def get_warmup_templates(app: Flask) -> t.List[str]:
+    """
+    Returns the application templates plus the Bootstrap-Flask macros.
+    """
+    templates = set()
+
+    for root, _, files in os.walk(os.path.join(app.root_path, "templates")):
+        for filename in files:
+            path = os.path.join(root, filename)
+            templates.add(
+                os.path.relpath(path, os.path.join(app.root_path, "templates")).replace(
+                    os.sep, "/"
+                )
+            )
+
+    for name in app.jinja_env.list_templates():
+        if name.startswith(WARMUP_TEMPLATE_PREFIXES):
+            templates.add(name)
+
+    return sorted(templates)
+
+
+def warmup_templates(app: Flask) -> int:
+    """
+    Compile the templates into the Jinja environment cache.
+
+    :return: The number of compiled templates.
+    """
+    templates = get_warmup_templates(app)
+
+    # Keep every warmed template in the environment cache.
+    cache = app.jinja_env.cache
+
+    if cache is not None and getattr(cache, "capacity", 0) < len(templates):
+        cache.capacity = len(templates)
+
+    for name in templates:
+        app.jinja_env.get_template(name)
+
+    return len(templates)
+
+
+def warmup_translations(app: Flask) -> int:
+    """
+    Load the Babel catalogs (and locale data) of every configured language.
+
+    :return: The number of loaded languages.
+    """
+    from flask_babel import force_locale, get_translations
+
+    with app.app_context():
+        for lang in app.config["LANGUAGES"]:
+            with force_locale(lang):
+                get_translations()
+
+    return len(app.config["LANGUAGES"])
+
+
+def warmup_database(app: Flask, db) -> int:
+    """
+    Open `WARMUP_DB_CONNECTIONS` connections per engine and return them to the pool.
+
+    :return: The number of opened connections.
+    """
+    from sqlalchemy import text
+
+    opened = 0
+
+    with app.app_context():
+        for engine in db.engines.values():
+            size = min(app.config["WARMUP_DB_CONNECTIONS"], _get_pool_size(engine))
+            connections = []
+
+            try:
+                for _ in range(size):
+                    connection = engine.connect()
+                    connection.execute(text("SELECT 1"))
+                    connections.append(connection)
+            finally:
+                for connection in connections:
+                    connection.close()
+
+            opened += len(connections)
+            _warmed_engines.add(engine)
+
+    return opened
+
+
+def _get_pool_size(engine) -> int:
+    size = getattr(engine.pool, "size", None)
+    return size() if callable(size) else 1
+
+
+def record_first_request(app: Flask):
+    """
+    Log the latency of the first request served by this process.
+    """
+    state = {"served": False}
+
+    @app.before_request
+    def start_first_request_timer():
+        if not state["served"]:
+            g._first_request_started = time.perf_counter()
+
+    @app.after_request
+    def log_first_request(response):
+        started = g.pop("_first_request_started", None)
+
+        if started is not None and not state["served"]:
+            state["served"] = True
+            app.config["FIRST_REQUEST_SECONDS"] = time.perf_counter() - started
+            app.logger.info(
+                "First request %s %s served in %.1f ms (pid %d)",
+                request.method,
+                request.path,
+                app.config["FIRST_REQUEST_SECONDS"] * 1000,
+                os.getpid(),
+            )
+
+        return response
+
+
+def warmup(app: Flask, db) -> t.Dict[str, float]:
+    """
+    Run every warmup step and return the duration of each, in seconds.
+    """
+    timings = {}
+
+    for name, step in (
+        ("templates", lambda: warmup_templates(app)),
+        ("translations", lambda: warmup_translations(app)),
+        ("database", lambda: warmup_database(app, db)),
+    ):
+        started = time.perf_counter()
+        count = step()
+        timings[name] = time.perf_counter() - started
+
+        app.logger.debug("Warmup %s: %d in %.1f ms", name, count, timings[name] * 1000)
+
+    return timings
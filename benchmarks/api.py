@@ -0,0 +1,145 @@
+"""
+Requests per second of the JSON API against the HTML views.
+
+Logs in and reads the profile of one account through the HTML views
+(`POST /login`, `GET /profile`: form validation, template rendering,
+session cookie and redirects) and through the API (`POST /api/auth/login`,
+`GET /api/profile` with a bearer token), sequentially in-process.
+
+Usage:
+    python -m benchmarks.api --requests 500
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+# Password of the benchmarked account.
+PASSWORD = "Bench@1234"
+
+
+def measure(func, requests: int) -> dict:
+    samples = []
+
+    for _ in range(requests):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+
+    return {
+        "requests_per_second": len(samples) / sum(samples),
+        "mean_ms": sum(samples) / len(samples) * 1000,
+    }
+
+
+def main():
+    import config as conf
+
+    from accounts import create_app
+    from accounts.extensions import database as db
+    from accounts.models import User
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument(
+        "--login-requests",
+        type=int,
+        default=None,
+        help="Logins per view (default: a tenth of --requests, they hash a password).",
+    )
+    args = parser.parse_args()
+
+    logins = args.login_requests or max(args.requests // 10, 1)
+    workdir = tempfile.mkdtemp(prefix="flaskauth-bench-")
+
+    conf.testing.SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(
+        workdir, "bench.sqlite3"
+    )
+    conf.testing.AUDIT_BACKEND = ""
+    conf.testing.RATELIMIT_ENABLED = False
+
+    app = create_app("testing", defer_setup=False)
+
+    try:
+        with app.app_context():
+            db.create_all()
+            User.create(
+                username="benchapi",
+                first_name="Bench",
+                last_name="Api",
+                email="benchapi@example.com",
+                password=PASSWORD,
+                active=True,
+            )
+
+        form = {"username": "benchapi", "password": PASSWORD, "remember": "y"}
+        credentials = {"username": "benchapi", "password": PASSWORD}
+
+        def html_login():
+            # A new client per login, the logged in clients are redirected.
+            response = app.test_client().post("/login", data=form)
+            assert response.location.endswith("/home")
+
+        def api_login():
+            response = app.test_client().post("/api/auth/login", json=credentials)
+            assert response.status_code == 200
+
+        html_client = app.test_client()
+        html_client.post("/login", data=form)
+
+        api_client = app.test_client()
+        token = api_client.post("/api/auth/login", json=credentials).json
+        headers = {"Authorization": "Bearer %s" % token["access_token"]}
+
+        def html_profile():
+            assert html_client.get("/profile").status_code == 200
+
+        def api_profile():
+            assert api_client.get("/api/profile", headers=headers).status_code == 200
+
+        # Warm the templates and the code paths up.
+        for func in (html_login, api_login, html_profile, api_profile):
+            func()
+
+        results = {
+            "login": (measure(html_login, logins), measure(api_login, logins)),
+            "profile read": (
+                measure(html_profile, args.requests),
+                measure(api_profile, args.requests),
+            ),
+        }
+
+        print(
+            "{:<14}{:>12}{:>12}{:>12}{:>12}{:>9}".format(
+                "", "HTML req/s", "API req/s", "HTML ms", "API ms", "speedup"
+            )
+        )
+
+        for name, (html, api) in results.items():
+            print(
+                "{:<14}{:>12.1f}{:>12.1f}{:>12.2f}{:>12.2f}{:>8.2f}x".format(
+                    name,
+                    html["requests_per_second"],
+                    api["requests_per_second"],
+                    html["mean_ms"],
+                    api["mean_ms"],
+                    api["requests_per_second"] / html["requests_per_second"],
+                )
+            )
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+
+        for name in ("audit_log", "activity_tracker"):
+            extension = app.extensions.get(name)
+
+            if extension is not None:
+                extension.close()
+
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
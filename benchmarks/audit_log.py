@@ -0,0 +1,134 @@
+"""
+Cost per request of the buffered audit log against a synchronous write.
+
+Compares the time a request spends recording an event when it is queued
+for the background writer, and when it is inserted and committed right
+away, then the throughput of the batched writes.
+
+Usage:
+    python -m benchmarks.audit_log --events 5000
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+
+def measure(record, events: int) -> dict:
+    samples = []
+
+    for index in range(events):
+        started = time.perf_counter()
+        record(index)
+        samples.append(time.perf_counter() - started)
+
+    samples.sort()
+
+    return {
+        "mean_us": statistics.fmean(samples) * 1_000_000,
+        "p99_us": samples[int(len(samples) * 0.99) - 1] * 1_000_000,
+    }
+
+
+def main():
+    import config as conf
+
+    from datetime import datetime
+
+    from accounts import create_app
+    from accounts.audit import AuditLog, DatabaseAuditSink, FileAuditSink
+    from accounts.extensions import database as db
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="flaskauth-bench-")
+
+    conf.testing.SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(
+        workdir, "bench.sqlite3"
+    )
+    conf.testing.AUDIT_BACKEND = ""
+
+    app = create_app("testing")
+
+    fields = {
+        "user_id": "0b5b3c4e-8d8f-4a8e-9f43-3c1d9b8e2f10",
+        "username": "benchuser",
+        "ip_address": "203.0.113.7",
+        "user_agent": "Mozilla/5.0 (X11; Linux x86_64) Firefox/131.0",
+    }
+
+    try:
+        with app.app_context():
+            db.create_all()
+            engine = db.engine
+
+        sinks = {
+            "database": DatabaseAuditSink(engine),
+            "file": FileAuditSink(os.path.join(workdir, "audit.jsonl")),
+        }
+
+        print(
+            "{:<10}{:<12}{:>12}{:>12}{:>16}".format(
+                "Sink", "Mode", "mean us", "p99 us", "Flush events/s"
+            )
+        )
+
+        for name, sink in sinks.items():
+
+            def write_now(index):
+                sink.write(
+                    [
+                        dict(
+                            fields,
+                            created_at=datetime.now(),
+                            event="login",
+                            data={"n": index},
+                        )
+                    ]
+                )
+
+            result = measure(write_now, args.events)
+            print(
+                "{:<10}{:<12}{:>12.1f}{:>12.1f}{:>16}".format(
+                    name, "sync", result["mean_us"], result["p99_us"], "-"
+                )
+            )
+
+            # A flush interval past the run, the batches are timed apart.
+            audit_log = AuditLog(
+                sink,
+                queue_size=args.events,
+                batch_size=args.batch_size,
+                flush_interval=3600,
+            )
+            audit_log.batch_size = args.events + 1
+
+            result = measure(
+                lambda index: audit_log.record("login", n=index, **fields), args.events
+            )
+
+            audit_log.batch_size = args.batch_size
+            started = time.perf_counter()
+            written = audit_log.flush()
+            throughput = written / (time.perf_counter() - started)
+
+            print(
+                "{:<10}{:<12}{:>12.1f}{:>12.1f}{:>16.0f}".format(
+                    name, "buffered", result["mean_us"], result["p99_us"], throughput
+                )
+            )
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
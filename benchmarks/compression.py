@@ -0,0 +1,145 @@
+"""
+CPU cost against bytes saved of the response compression, per level.
+
+Renders the public pages, the pages of a logged-in user and the 404 page,
+then compresses each body with every gzip and brotli level.
+
+Usage:
+    python -m benchmarks.compression --iterations 200
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+# Pages rendered for the benchmark, the last ones need a logged-in user.
+PUBLIC_PAGES = ("/login", "/register", "/page-not-found")
+USER_PAGES = ("/home", "/profile", "/account/settings")
+
+LEVELS = {"gzip": range(1, 10), "br": range(0, 12)}
+
+
+def render_pages(app) -> dict:
+    """
+    Returns the uncompressed body of every benchmarked page.
+    """
+    from accounts.models import User
+
+    with app.app_context():
+        User.create(
+            username="benchuser",
+            first_name="Bench",
+            last_name="User",
+            email="benchuser@example.com",
+            password="Bench@1234",
+            active=True,
+        )
+
+    client = app.test_client()
+    pages = {path: client.get(path).get_data() for path in PUBLIC_PAGES}
+
+    client.post(
+        "/login",
+        data={"username": "benchuser", "password": "Bench@1234", "remember": "y"},
+    )
+
+    for path in USER_PAGES:
+        pages[path] = client.get(path).get_data()
+
+    return pages
+
+
+def run(pages: dict, encoding: str, level: int, iterations: int) -> dict:
+    """
+    Compress every page and return the total sizes and mean time per page.
+    """
+    from accounts.compression import compress
+
+    original = compressed = 0
+    samples = []
+
+    for body in pages.values():
+        for _ in range(iterations):
+            started = time.perf_counter()
+            data = compress(body, encoding, level)
+            samples.append(time.perf_counter() - started)
+
+        original += len(body)
+        compressed += len(data)
+
+    return {
+        "original": original,
+        "compressed": compressed,
+        "saved": 1 - compressed / original,
+        "mean_us": statistics.fmean(samples) * 1_000_000,
+    }
+
+
+def main():
+    import config as conf
+
+    from accounts import create_app
+    from accounts.compression import brotli
+    from accounts.extensions import database as db
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="flaskauth-bench-")
+
+    conf.testing.SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(
+        workdir, "bench.sqlite3"
+    )
+    conf.testing.RATELIMIT_ENABLED = False
+
+    app = create_app("testing")
+
+    try:
+        with app.app_context():
+            db.create_all()
+
+        pages = render_pages(app)
+
+        print(
+            "%d pages, %d bytes uncompressed"
+            % (len(pages), sum(len(body) for body in pages.values()))
+        )
+        print(
+            "{:<6}{:>6}{:>12}{:>9}{:>14}".format(
+                "", "Level", "Bytes", "Saved", "us/page"
+            )
+        )
+
+        for encoding, levels in LEVELS.items():
+            if encoding == "br" and brotli is None:
+                print("br    (brotli not installed)")
+                continue
+
+            for level in levels:
+                result = run(pages, encoding, level, args.iterations)
+                print(
+                    "{:<6}{:>6}{:>12}{:>8.1f}%{:>14.1f}".format(
+                        encoding,
+                        level,
+                        result["compressed"],
+                        result["saved"] * 100,
+                        result["mean_us"],
+                    )
+                )
+    finally:
+        # Write the buffered audit events before the database goes away.
+        if "audit_log" in app.extensions:
+            app.extensions["audit_log"].close()
+
+        with app.app_context():
+            db.engine.dispose()
+
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Latency and emails of repeated logins to an unconfirmed account.
+
+An inactive user submitting `/login` is sent the confirmation email again.
+Submits the login form repeatedly and reports the response time, the
+emails received by a local SMTP stand-in and the tokens created, with the
+emails sent in the background under the resend cooldown, and sent
+synchronously on every attempt.
+
+Usage:
+    python -m benchmarks.confirmation_resend --attempts 20 --connect-delay 200
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from benchmarks.mail_campaign import SMTPStandIn
+
+
+def run(args, workdir: str, stand_in: SMTPStandIn, throttled: bool) -> dict:
+    import config as conf
+
+    from accounts import create_app
+    from accounts.email_utils import mail_dispatcher
+    from accounts.extensions import database as db
+    from accounts.models import User, UserSecurityToken
+
+    conf.testing.SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(
+        workdir, "bench-%d.sqlite3" % throttled
+    )
+    conf.testing.MAIL_SEND_ASYNC = throttled
+    conf.testing.CONFIRMATION_RESEND_COOLDOWN = 60 if throttled else 0
+
+    app = create_app("testing")
+
+    with app.app_context():
+        db.create_all()
+        user_id = User.create(
+            username="benchuser",
+            first_name="Bench",
+            last_name="User",
+            email="benchuser@example.com",
+            password="Bench@1234",
+        ).id
+
+    client = app.test_client()
+    data = {"username": "benchuser", "password": "Bench@1234", "remember": "y"}
+    messages = stand_in.messages
+    samples = []
+
+    # `send_mail` prints every message, keep the report readable.
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(args.attempts):
+            started = time.perf_counter()
+            client.post("/login", data=data)
+            samples.append(time.perf_counter() - started)
+
+        mail_dispatcher.close()
+
+    with app.app_context():
+        tokens = UserSecurityToken.query.filter_by(user_id=user_id).count()
+        db.engine.dispose()
+
+    for name in ("audit_log", "activity_tracker"):
+        extension = app.extensions.get(name)
+
+        if extension is not None:
+            extension.close()
+
+    return {
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "max_ms": max(samples) * 1000,
+        "emails": stand_in.messages - messages,
+        "tokens": tokens,
+    }
+
+
+def main():
+    import config as conf
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--attempts", type=int, default=20)
+    parser.add_argument("--connect-delay", type=float, default=200, help="ms")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="flaskauth-bench-")
+    stand_in = SMTPStandIn(args.connect_delay / 1000, 0.002)
+
+    conf.testing.AUDIT_BACKEND = ""
+    conf.testing.RATELIMIT_ENABLED = False
+    conf.testing.AUTH_BACKOFF_ENABLED = False
+    conf.testing.MAIL_SERVER = "127.0.0.1"
+    conf.testing.MAIL_PORT = stand_in.port
+    conf.testing.MAIL_USE_TLS = False
+    conf.testing.MAIL_SUPPRESS_SEND = False
+    conf.testing.SITE_URL = "https://auth.example.com"
+    # Read from the environment by `send_mail`.
+    os.environ["MAIL_DEFAULT_SENDER"] = "noreply@example.com"
+
+    try:
+        with stand_in:
+            results = {
+                "every attempt": run(args, workdir, stand_in, throttled=False),
+                "throttled": run(args, workdir, stand_in, throttled=True),
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(
+        "{:<16}{:>10}{:>10}{:>10}{:>10}".format(
+            "Mode", "mean ms", "max ms", "Emails", "Tokens"
+        )
+    )
+
+    for name, result in results.items():
+        print(
+            "{:<16}{:>10.1f}{:>10.1f}{:>10}{:>10}".format(
+                name,
+                result["mean_ms"],
+                result["max_ms"],
+                result["emails"],
+                result["tokens"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+import os
+import time
+import shutil
+import tempfile
+import typing as t
+
+import pytest
+
+from benchmarks.data import DEFAULT_PASSWORD, seed_users
+from benchmarks.results import compare, load_results, summarize, write_results
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmarks")
+    group.addoption(
+        "--benchmark",
+        action="store_true",
+        default=False,
+        help="Run the benchmark suite (skipped otherwise).",
+    )
+    group.addoption(
+        "--bench-database-url",
+        default=None,
+        help="Database to benchmark against, recreated on start (default: temporary SQLite).",
+    )
+    group.addoption(
+        "--bench-users", type=int, default=1000, help="Number of users to seed."
+    )
+    group.addoption(
+        "--bench-iterations", type=int, default=30, help="Iterations per benchmark."
+    )
+    group.addoption(
+        "--bench-results", default=None, help="Write the JSON results to this path."
+    )
+    group.addoption(
+        "--bench-baseline",
+        default=None,
+        help="Fail when a metric regresses past the threshold from this results file.",
+    )
+    group.addoption(
+        "--bench-threshold",
+        type=float,
+        default=0.1,
+        help="Allowed relative regression against the baseline (0.1 = 10%%).",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("benchmark", default=False):
+        return
+
+    skip = pytest.mark.skip(reason="pass --benchmark to run the benchmark suite")
+
+    for item in items:
+        if str(item.path).startswith(BENCHMARKS_DIR):
+            item.add_marker(skip)
+
+
+def pytest_configure(config):
+    config._bench_results = {}
+
+
+def pytest_sessionfinish(session, exitstatus):
+    config = session.config
+    results = getattr(config, "_bench_results", None)
+
+    if not results:
+        return
+
+    meta = {
+        "database": getattr(config, "_bench_database", None),
+        "users": config.getoption("bench_users", default=None),
+    }
+    path = config.getoption("bench_results", default=None)
+
+    if path:
+        write_results(path, results, **meta)
+
+    reporter = config.pluginmanager.get_plugin("terminalreporter")
+
+    if reporter:
+        reporter.write_sep("-", "benchmark results")
+
+        for name, result in results.items():
+            reporter.write_line(
+                "{:<24} p50 {:>9.3f} ms  p95 {:>9.3f} ms  {:>9.1f} ops/s".format(
+                    name, result["p50_ms"], result["p95_ms"], result["ops_per_second"]
+                )
+            )
+
+    baseline = config.getoption("bench_baseline", default=None)
+
+    if baseline:
+        regressions = compare(
+            load_results(baseline),
+            {"benchmarks": results},
+            config.getoption("bench_threshold", default=0.1),
+        )
+
+        for name, metric, base, result in regressions:
+            if reporter:
+                reporter.write_line(
+                    "REGRESSION %s.%s: %.3f -> %.3f" % (name, metric, base, result),
+                    red=True,
+                )
+
+        if regressions:
+            session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+
+@pytest.fixture(scope="session")
+def bench_app(pytestconfig):
+    """
+    Application configured for benchmarking, with a seeded database.
+    """
+    import config as conf
+
+    from accounts import create_app
+    from accounts.extensions import database as db
+
+    # `send_mail` reads the sender from the environment.
+    os.environ.setdefault("MAIL_DEFAULT_SENDER", "benchmark@example.com")
+
+    database_url = pytestconfig.getoption("bench_database_url", default=None)
+    workdir = None
+
+    if not database_url:
+        workdir = tempfile.mkdtemp(prefix="flaskauth-bench-")
+        database_url = "sqlite:///" + os.path.join(workdir, "bench.sqlite3")
+
+    conf.testing.SQLALCHEMY_DATABASE_URI = database_url
+    conf.testing.RATELIMIT_ENABLED = False
+    conf.testing.SITE_URL = conf.testing.SITE_URL or "http://localhost:5000"
+
+    app = create_app("testing")
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed_users(pytestconfig.getoption("bench_users", default=1000))
+        pytestconfig._bench_database = db.engine.dialect.name
+
+    yield app
+
+    # Write the buffered audit events and activity before the database goes away.
+    for name in ("audit_log", "activity_tracker"):
+        if name in app.extensions:
+            app.extensions[name].close()
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+    if workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def bench_users(bench_app) -> t.Dict[str, t.Any]:
+    """
+    Known active and inactive accounts to authenticate with.
+    """
+    from accounts.models import User
+
+    with bench_app.app_context():
+        active = User.create(
+            username="benchactive",
+            first_name="Bench",
+            last_name="Active",
+            email="benchactive@example.com",
+            password=DEFAULT_PASSWORD,
+            active=True,
+        )
+        inactive = User.create(
+            username="benchinactive",
+            first_name="Bench",
+            last_name="Inactive",
+            email="benchinactive@example.com",
+            password=DEFAULT_PASSWORD,
+        )
+
+        return {
+            "active": {"id": active.id, "username": active.username},
+            "inactive": {"id": inactive.id, "username": inactive.username},
+            "password": DEFAULT_PASSWORD,
+        }
+
+
+@pytest.fixture
+def bench(request, pytestconfig):
+    """
+    Time a callable over `--bench-iterations` runs and record the results
+    under the test name (without the `test_` prefix).
+
+    `setup` and `teardown` run around every iteration, outside of the timing;
+    the return value of `setup` is passed as arguments to the callable.
+    """
+    iterations = pytestconfig.getoption("bench_iterations", default=30)
+    name = request.node.name[len("test_") :]
+
+    def run(
+        func: t.Callable,
+        setup: t.Optional[t.Callable] = None,
+        teardown: t.Optional[t.Callable] = None,
+    ) -> t.Dict[str, float]:
+        samples = []
+
+        for _ in range(iterations):
+            args = setup() if setup else ()
+
+            started = time.perf_counter()
+            func(*(args or ()))
+            samples.append(time.perf_counter() - started)
+
+            if teardown:
+                teardown()
+
+        result = summarize(samples)
+        pytestconfig._bench_results[name] = result
+        return result
+
+    return run
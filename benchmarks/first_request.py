@@ -0,0 +1,119 @@
+"""
+First-request latency of a fresh worker, without warmup, with the startup
+warmup, and with the warmup reading a populated template bytecode cache.
+
+Each run starts a new Python process, creates the application and times
+`create_app` and the first requests to the public pages.
+
+Usage:
+    python -m benchmarks.first_request --runs 5
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Pages requested in order by every worker.
+PATHS = ("/login", "/register", "/forgot/password", "/login")
+
+
+def run_worker(database_url: str):
+    """
+    Runs inside the child process and prints the timings as JSON.
+    """
+    started = time.perf_counter()
+
+    import config as conf
+
+    from accounts import create_app
+    from accounts.extensions import database as db
+
+    conf.testing.SQLALCHEMY_DATABASE_URI = database_url
+    conf.testing.RATELIMIT_ENABLED = False
+    app = create_app("testing")
+
+    with app.app_context():
+        db.create_all()
+
+    timings = {"create_app_ms": (time.perf_counter() - started) * 1000}
+    client = app.test_client()
+
+    for index, path in enumerate(PATHS):
+        started = time.perf_counter()
+        client.get(path)
+        timings["%d %s" % (index + 1, path)] = (time.perf_counter() - started) * 1000
+
+    print(json.dumps(timings))
+
+
+def spawn(database_url: str, env: dict) -> dict:
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.first_request",
+            "--worker",
+            "--database-url",
+            database_url,
+        ],
+        env=dict(os.environ, **env),
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args.database_url)
+
+    workdir = tempfile.mkdtemp(prefix="flaskauth-bench-")
+    database_url = args.database_url or "sqlite:///" + os.path.join(
+        workdir, "bench.sqlite3"
+    )
+    cache_dir = os.path.join(workdir, "jinja")
+
+    modes = (
+        ("cold", {"APP_WARMUP": "False"}),
+        ("warmup", {"APP_WARMUP": "True"}),
+        (
+            "warmup+bytecode",
+            {"APP_WARMUP": "True", "TEMPLATE_BYTECODE_CACHE_DIR": cache_dir},
+        ),
+    )
+
+    try:
+        # Populate the bytecode cache, like a previous worker would have.
+        spawn(database_url, modes[2][1])
+
+        for name, env in modes:
+            runs = [spawn(database_url, env) for _ in range(args.runs)]
+
+            print("%s (median of %d runs):" % (name, args.runs))
+
+            for key in runs[0]:
+                print(
+                    "  {:<24} {:>8.1f} ms".format(
+                        key, statistics.median(run[key] for run in runs)
+                    )
+                )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
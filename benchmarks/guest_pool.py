@@ -0,0 +1,104 @@
+"""
+Cost of the guest logins with a pre-warmed pool of guest accounts.
+
+Times `/login_as_guest` when the guest is claimed from a warm pool and
+when it has to be created on the spot (empty pool), then the throughput
+of the bulk top-up and of the recycling of the expired guests.
+
+Usage:
+    python -m benchmarks.guest_pool --logins 200
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+
+def measure_logins(app, logins: int) -> dict:
+    samples = []
+
+    for _ in range(logins):
+        client = app.test_client()
+        started = time.perf_counter()
+        client.post("/login_as_guest")
+        samples.append(time.perf_counter() - started)
+
+    samples.sort()
+
+    return {
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p95_ms": samples[int(len(samples) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    import config as conf
+
+    from accounts import create_app
+    from accounts.extensions import database as db
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="flaskauth-bench-")
+
+    conf.testing.SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(
+        workdir, "bench.sqlite3"
+    )
+    conf.testing.AUDIT_BACKEND = ""
+    conf.testing.RATELIMIT_ENABLED = False
+    conf.testing.GUEST_POOL_SIZE = args.logins
+
+    app = create_app("testing")
+    pool = app.extensions["guest_pool"]
+
+    try:
+        with app.app_context():
+            db.create_all()
+
+        # Timed apart, the background maintenance is kept out of the logins.
+        pool.interval = float("inf")
+        pool.schedule_maintenance = lambda force=False: None
+
+        started = time.perf_counter()
+        created = pool.refill()
+        fill = created / (time.perf_counter() - started)
+
+        results = {"warm pool": measure_logins(app, args.logins)}
+        results["empty pool"] = measure_logins(app, args.logins)
+
+        pool.lifetime = timedelta(0)
+        started = time.perf_counter()
+        recycled, _ = pool.maintain()
+        recycle = recycled / (time.perf_counter() - started)
+
+        print("{:<14}{:>10}{:>10}".format("Login", "mean ms", "p95 ms"))
+
+        for name, result in results.items():
+            print(
+                "{:<14}{:>10.2f}{:>10.2f}".format(
+                    name, result["mean_ms"], result["p95_ms"]
+                )
+            )
+
+        print(f"\nTop-up: {fill:.0f} guests/s, recycling: {recycle:.0f} guests/s.")
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+
+        for name in ("audit_log", "activity_tracker"):
+            extension = app.extensions.get(name)
+
+            if extension is not None:
+                extension.close()
+
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
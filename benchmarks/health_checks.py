@@ -0,0 +1,104 @@
+"""
+Latency of the `/healthz` and `/readyz` probes against probing `/login`.
+
+Calls the WSGI application directly (no test client or server overhead)
+and reports the mean and p99 latency of each probe, with the readiness
+checks cached and run on every request.
+
+Usage:
+    python -m benchmarks.health_checks --requests 2000
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+
+def measure(app, path: str, requests: int) -> dict:
+    from werkzeug.test import EnvironBuilder
+
+    environ = EnvironBuilder(path=path, method="GET").get_environ()
+    samples = []
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    for _ in range(requests):
+        started = time.perf_counter()
+        body = app(dict(environ), start_response)
+        b"".join(body)
+
+        if hasattr(body, "close"):
+            body.close()
+
+        samples.append(time.perf_counter() - started)
+
+    samples.sort()
+
+    return {
+        "mean_us": statistics.fmean(samples) * 1_000_000,
+        "p99_us": samples[int(len(samples) * 0.99) - 1] * 1_000_000,
+    }
+
+
+def main():
+    import config as conf
+
+    from accounts import create_app
+    from accounts.extensions import database as db
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="flaskauth-bench-")
+
+    conf.testing.SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(
+        workdir, "bench.sqlite3"
+    )
+    conf.testing.AUDIT_BACKEND = ""
+    # The limit of the probes to `/login` is not benchmarked.
+    conf.testing.RATELIMIT_ENABLED = False
+
+    app = create_app("testing")
+
+    try:
+        with app.app_context():
+            db.create_all()
+
+        probe = app.wsgi_app.probe
+        results = {
+            "/login": measure(app, "/login", args.requests // 10),
+            "/healthz": measure(app, "/healthz", args.requests),
+            "/readyz": measure(app, "/readyz", args.requests),
+        }
+
+        probe.ttl = probe._expires_at = 0
+        results["/readyz uncached"] = measure(app, "/readyz", args.requests)
+
+        print("{:<18}{:>12}{:>12}".format("Probe", "mean us", "p99 us"))
+
+        for name, result in results.items():
+            print(
+                "{:<18}{:>12.1f}{:>12.1f}".format(
+                    name, result["mean_us"], result["p99_us"]
+                )
+            )
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+
+        for name in ("audit_log", "activity_tracker"):
+            extension = app.extensions.get(name)
+
+            if extension is not None:
+                extension.close()
+
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
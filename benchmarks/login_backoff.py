@@ -0,0 +1,129 @@
+"""
+CPU cost of the failed logins against the ones rejected by the backoff.
+
+Measures the CPU time per attempt of a wrong password (a password hash)
+and of an attempt rejected by the per-account lockout (no hash, and no
+database query for the locked identifier), directly and through `/login`.
+
+Usage:
+    python -m benchmarks.login_backoff --attempts 50
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+
+def measure(attempt, attempts: int) -> dict:
+    samples = []
+
+    for _ in range(attempts):
+        started = time.process_time()
+        attempt()
+        samples.append(time.process_time() - started)
+
+    return {
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "total_s": sum(samples),
+    }
+
+
+def main():
+    import config as conf
+
+    from accounts import create_app
+    from accounts.backoff import authenticate, login_backoff
+    from accounts.extensions import database as db
+    from accounts.models import User
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--attempts", type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="flaskauth-bench-")
+
+    conf.testing.SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(
+        workdir, "bench.sqlite3"
+    )
+    conf.testing.AUDIT_BACKEND = ""
+    conf.testing.ACTIVITY_TRACKING = False
+    # Without the route limit, only the backoff rejects the attempts.
+    conf.testing.RATELIMIT_ENABLED = False
+
+    app = create_app("testing")
+    username, password = "benchuser", "Wrong@1234"
+
+    try:
+        with app.app_context():
+            db.create_all()
+            User.create(
+                username=username,
+                first_name="Bench",
+                last_name="User",
+                email="benchuser@example.com",
+                password="Right@1234",
+            )
+
+            def reset():
+                login_backoff.reset(username, "benchuser@example.com")
+
+            def fail():
+                # Stay below the threshold, every attempt hashes the password.
+                reset()
+                authenticate(username=username, password=password)
+
+            def locked():
+                authenticate(username=username, password=password)
+
+            results = {"wrong password": measure(fail, args.attempts)}
+
+            for _ in range(login_backoff.threshold):
+                authenticate(username=username, password=password)
+
+            results["locked out"] = measure(locked, args.attempts)
+            reset()
+
+        client = app.test_client()
+        data = {"username": username, "password": password, "remember": "y"}
+
+        def post():
+            client.post("/login", data=data)
+
+        def post_fail():
+            reset()
+            post()
+
+        results["/login wrong"] = measure(post_fail, args.attempts)
+
+        for _ in range(login_backoff.threshold):
+            post()
+
+        results["/login locked out"] = measure(post, args.attempts)
+        reset()
+
+        print("{:<20}{:>14}{:>14}".format("Attempt", "CPU ms/each", "CPU s total"))
+
+        for name, result in results.items():
+            print(
+                "{:<20}{:>14.2f}{:>14.2f}".format(
+                    name, result["mean_ms"], result["total_s"]
+                )
+            )
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+
+        for name in ("audit_log", "activity_tracker"):
+            extension = app.extensions.get(name)
+
+            if extension is not None:
+                extension.close()
+
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
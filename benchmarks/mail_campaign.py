@@ -0,0 +1,208 @@
+"""
+Throughput of `flask mail-campaign` against the one-user-at-a-time emails.
+
+Sends the account confirmation email to a cohort of unconfirmed accounts
+through a local SMTP stand-in, whose connection setup (TLS handshake and
+login of a real server) and message delivery are delayed. The baseline
+calls `send_confirmation_mail` for every account: a new SMTP connection,
+a token `INSERT` and commit, and a template rendering each.
+
+Usage:
+    python -m benchmarks.mail_campaign --accounts 300 --connect-delay 50
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+
+
+class SMTPStandIn:
+    """
+    A minimal SMTP server accepting every message, served from a thread.
+
+    :param connect_delay: Seconds before the greeting of a new connection.
+    :param message_delay: Seconds before a message is accepted.
+    """
+
+    def __init__(self, connect_delay: float = 0.05, message_delay: float = 0.002):
+        stand_in = self
+        self.connect_delay = connect_delay
+        self.message_delay = message_delay
+        self.connections = 0
+        self.messages = 0
+        self.lock = threading.Lock()
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line: str):
+                self.wfile.write(line.encode("ascii") + b"\r\n")
+
+            def handle(self):
+                with stand_in.lock:
+                    stand_in.connections += 1
+
+                time.sleep(stand_in.connect_delay)
+                self.reply("220 stand-in ESMTP")
+
+                for raw in self.rfile:
+                    command = raw.decode("ascii", "replace").strip().upper()
+
+                    if command.startswith("EHLO"):
+                        self.reply("250-stand-in")
+                        self.reply("250 8BITMIME")
+                    elif command == "DATA":
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+
+                        for line in self.rfile:
+                            if line in (b".\r\n", b".\n"):
+                                break
+
+                        time.sleep(stand_in.message_delay)
+
+                        with stand_in.lock:
+                            stand_in.messages += 1
+
+                        self.reply("250 OK")
+                    elif command == "QUIT":
+                        self.reply("221 Bye")
+                        break
+                    else:
+                        # HELO, MAIL FROM, RCPT TO, RSET, NOOP.
+                        self.reply("250 OK")
+
+        socketserver.ThreadingTCPServer.daemon_threads = True
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    import config as conf
+
+    from sqlalchemy import update
+
+    from accounts import create_app
+    from accounts.campaign import Checkpoint, MailCampaign
+    from accounts.email_utils import send_confirmation_mail
+    from accounts.extensions import database as db
+    from accounts.models import User, UserSecurityToken
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--accounts", type=int, default=300)
+    parser.add_argument("--connect-delay", type=float, default=50, help="ms")
+    parser.add_argument("--message-delay", type=float, default=2, help="ms")
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="flaskauth-bench-")
+    stand_in = SMTPStandIn(args.connect_delay / 1000, args.message_delay / 1000)
+
+    conf.testing.SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(
+        workdir, "bench.sqlite3"
+    )
+    conf.testing.AUDIT_BACKEND = ""
+    conf.testing.SITE_URL = "https://auth.example.com"
+    conf.testing.MAIL_SERVER = "127.0.0.1"
+    conf.testing.MAIL_PORT = stand_in.port
+    conf.testing.MAIL_USE_TLS = False
+    conf.testing.MAIL_SUPPRESS_SEND = False
+    conf.testing.MAIL_DEFAULT_SENDER = "noreply@example.com"
+    # Read from the environment by `send_mail`.
+    os.environ["MAIL_DEFAULT_SENDER"] = conf.testing.MAIL_DEFAULT_SENDER
+
+    app = create_app("testing")
+
+    try:
+        with stand_in, app.app_context():
+            db.create_all()
+            db.session.execute(
+                User.__table__.insert(),
+                [
+                    {
+                        "username": "bench%05d" % index,
+                        "first_name": "Bench",
+                        "last_name": "User",
+                        "email": "bench%05d@example.com" % index,
+                        "password": "-",
+                        "active": False,
+                    }
+                    for index in range(args.accounts)
+                ],
+            )
+            db.session.commit()
+
+            users = User.query.filter_by(active=False).all()
+            results = {}
+
+            # `send_mail` prints every message, keep the report readable.
+            with app.test_request_context(), contextlib.redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+
+                for user in users:
+                    send_confirmation_mail(user)
+
+                results["one at a time"] = (
+                    time.perf_counter() - started,
+                    stand_in.connections,
+                )
+
+            db.session.execute(update(UserSecurityToken.__table__).values(expire=True))
+            db.session.commit()
+            connections = stand_in.connections
+
+            campaign = MailCampaign(
+                app,
+                db.engine,
+                "confirm",
+                Checkpoint(os.path.join(workdir, "campaign.json"), cohort={}),
+                batch_size=args.batch_size,
+                connections=args.connections,
+                echo=lambda message: None,
+            )
+            result = campaign.run()
+            results["campaign"] = (
+                result["elapsed"],
+                stand_in.connections - connections,
+            )
+
+        print(
+            "{:<16}{:>10}{:>12}{:>14}".format(
+                "Mode", "Seconds", "Emails/s", "Connections"
+            )
+        )
+
+        for name, (elapsed, opened) in results.items():
+            print(
+                "{:<16}{:>10.2f}{:>12.1f}{:>14}".format(
+                    name, elapsed, args.accounts / elapsed, opened
+                )
+            )
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+
+        for name in ("audit_log", "activity_tracker"):
+            extension = app.extensions.get(name)
+
+            if extension is not None:
+                extension.close()
+
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
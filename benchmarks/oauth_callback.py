@@ -0,0 +1,266 @@
+"""
+Latency of the Google OAuth callback against a local OIDC stand-in.
+
+The stand-in serves the discovery document, the token endpoint (a signed
+`id_token`), the JWKS and the profile pictures, each with a configurable
+delay. Every iteration signs a new user in, so the callback downloads the
+picture while the user is created. The database latency of a remote server
+is simulated by sleeping before every statement.
+
+The sequential time is what the callback took when the picture was only
+downloaded after the database work: token + database + picture.
+
+Usage:
+    python -m benchmarks.oauth_callback --iterations 20 --db-latency 5
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, urlsplit
+
+CLIENT_ID = "bench-client"
+CLIENT_SECRET = "bench-secret"
+
+# Avatar delays benchmarked, in milliseconds, the last one past the deadline.
+AVATAR_DELAYS = (0, 50, 200, 1500)
+
+
+class OIDCStandIn:
+    """
+    A minimal OpenID Connect provider served from a background thread.
+
+    :param token_delay: Seconds before the token endpoint answers.
+    :param avatar_delay: Seconds before the picture endpoint answers.
+    """
+
+    def __init__(self, token_delay: float = 0.05, avatar_delay: float = 0.0):
+        from authlib.jose import JsonWebKey
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietRequestHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.token_delay = token_delay
+        self.avatar_delay = avatar_delay
+        self.key = JsonWebKey.generate_key("RSA", 2048, is_private=True)
+        self.key_id = "bench"
+        self.codes = {}
+
+        self.server = make_server(
+            "127.0.0.1",
+            0,
+            self.make_app(),
+            threaded=True,
+            request_handler=QuietRequestHandler,
+        )
+        self.url = "http://127.0.0.1:%d" % self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def make_app(self):
+        from authlib.jose import jwt
+        from flask import Flask, jsonify, request
+
+        app = Flask("oidc-stand-in")
+
+        @app.get("/.well-known/openid-configuration")
+        def discovery():
+            return jsonify(
+                issuer=self.url,
+                authorization_endpoint=self.url + "/authorize",
+                token_endpoint=self.url + "/token",
+                jwks_uri=self.url + "/jwks",
+                id_token_signing_alg_values_supported=["RS256"],
+            )
+
+        @app.get("/jwks")
+        def jwks():
+            key = self.key.as_dict(is_private=False)
+            key.update(kid=self.key_id, alg="RS256", use="sig")
+            return jsonify(keys=[key])
+
+        @app.post("/token")
+        def token():
+            time.sleep(self.token_delay)
+
+            claims = self.codes.pop(request.form["code"])
+            now = int(time.time())
+            claims.update(iss=self.url, aud=CLIENT_ID, iat=now, exp=now + 300)
+
+            id_token = jwt.encode(
+                {"alg": "RS256", "kid": self.key_id}, claims, self.key
+            )
+
+            return jsonify(
+                access_token=uuid.uuid4().hex,
+                token_type="Bearer",
+                expires_in=300,
+                id_token=id_token.decode(),
+            )
+
+        @app.get("/avatar/<name>")
+        def avatar(name):
+            time.sleep(self.avatar_delay)
+            return b"\xff\xd8\xff" + os.urandom(16 * 1024), {
+                "Content-Type": "image/jpeg"
+            }
+
+        return app
+
+    def issue_code(self, nonce: str, email: str) -> str:
+        """
+        Register the claims returned for a new authorization code.
+        """
+        code = uuid.uuid4().hex
+        self.codes[code] = {
+            "sub": uuid.uuid4().hex,
+            "nonce": nonce,
+            "email": email,
+            "email_verified": True,
+            "given_name": "Bench",
+            "family_name": "User",
+            "picture": "%s/avatar/%s.jpg" % (self.url, code),
+        }
+        return code
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def sign_in(app, provider: OIDCStandIn, index: int) -> float:
+    """
+    Sign a new user in with the stand-in, returns the callback latency.
+    """
+    client = app.test_client()
+
+    response = client.post("/account/google-login")
+    query = parse_qs(urlsplit(response.headers["Location"]).query)
+
+    code = provider.issue_code(
+        nonce=query["nonce"][0], email="benchuser%d@example.com" % index
+    )
+
+    started = time.perf_counter()
+    response = client.get(
+        "/account/google-login/callback",
+        query_string={"code": code, "state": query["state"][0]},
+    )
+    elapsed = time.perf_counter() - started
+
+    if not response.headers["Location"].endswith("/home"):
+        raise RuntimeError("Sign in failed: %s" % response.headers["Location"])
+
+    return elapsed
+
+
+def simulate_db_latency(engine, seconds: float):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def sleep(*args):
+        time.sleep(seconds)
+
+
+def main():
+    import config as conf
+
+    from accounts import create_app
+    from accounts.extensions import database as db
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--token-delay", type=float, default=50, help="Milliseconds.")
+    parser.add_argument("--db-latency", type=float, default=5, help="Milliseconds.")
+    parser.add_argument("--timeout", type=float, default=1.0, help="Seconds.")
+    args = parser.parse_args()
+
+    provider = OIDCStandIn(token_delay=args.token_delay / 1000)
+    provider.start()
+
+    workdir = tempfile.mkdtemp(prefix="flaskauth-bench-")
+
+    conf.UPLOAD_FOLDER = os.path.join(workdir, "uploads")
+    conf.testing.SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(
+        workdir, "bench.sqlite3"
+    )
+    conf.testing.RATELIMIT_ENABLED = False
+    conf.testing.GOOGLE_CLIENT_ID = CLIENT_ID
+    conf.testing.GOOGLE_CLIENT_SECRET = CLIENT_SECRET
+    conf.testing.GOOGLE_DISCOVERY_URL = (
+        provider.url + "/.well-known/openid-configuration"
+    )
+    conf.testing.GOOGLE_SCOPE = "openid email profile"
+    conf.testing.GOOGLE_CALLBACK_TIMEOUT = args.timeout
+
+    app = create_app("testing")
+
+    try:
+        with app.app_context():
+            db.create_all()
+            simulate_db_latency(db.engine, args.db_latency / 1000)
+
+        index = 0
+
+        # Warm up, the client caches the discovery document and the JWKS.
+        provider.avatar_delay = 0
+        sign_in(app, provider, index)
+
+        print(
+            "token %.0f ms, database %.0f ms/statement, deadline %.1f s"
+            % (args.token_delay, args.db_latency, args.timeout)
+        )
+        print(
+            "{:>10}{:>10}{:>10}{:>14}{:>9}".format(
+                "Avatar ms", "p50 ms", "p95 ms", "Sequential ms", "Saved"
+            )
+        )
+
+        baseline = None
+
+        for delay in AVATAR_DELAYS:
+            provider.avatar_delay = delay / 1000
+            samples = []
+
+            for _ in range(args.iterations):
+                index += 1
+                samples.append(sign_in(app, provider, index) * 1000)
+
+            samples.sort()
+            p50 = statistics.median(samples)
+            p95 = samples[int(len(samples) * 0.95) - 1]
+
+            # With an instant picture the callback is token + database work.
+            if baseline is None:
+                baseline = p50
+
+            sequential = baseline + delay
+
+            print(
+                "{:>10}{:>10.1f}{:>10.1f}{:>14.1f}{:>8.0f}%".format(
+                    delay, p50, p95, sequential, (1 - p50 / sequential) * 100
+                )
+            )
+    finally:
+        provider.stop()
+
+        # Write the buffered audit events before the database goes away.
+        if "audit_log" in app.extensions:
+            app.extensions["audit_log"].close()
+
+        with app.app_context():
+            db.engine.dispose()
+
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
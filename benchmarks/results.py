@@ -0,0 +1,124 @@
+"""
+JSON results format and baseline comparison for the benchmark suite.
+
+A results file looks like:
+
+    {
+        "meta": {"database": "sqlite", "users": 1000, "created_at": "..."},
+        "benchmarks": {
+            "login_valid": {"iterations": 50, "mean_ms": 61.2, "p50_ms": 60.8, ...},
+            ...
+        }
+    }
+
+Usage:
+    python -m benchmarks.results compare baseline.json results.json --threshold 0.1
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import typing as t
+
+from datetime import datetime
+
+# Metrics where a higher value is a regression.
+COMPARED_METRICS = ("p50_ms", "p95_ms", "mean_ms")
+
+
+def summarize(samples: t.List[float]) -> t.Dict[str, float]:
+    """
+    Summarize a list of durations (in seconds) into the stored metrics.
+    """
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        index = min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))
+        return ordered[index] * 1000
+
+    return {
+        "iterations": len(ordered),
+        "min_ms": ordered[0] * 1000,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "max_ms": ordered[-1] * 1000,
+        "ops_per_second": len(ordered) / sum(ordered) if sum(ordered) else 0.0,
+    }
+
+
+def write_results(path: str, benchmarks: t.Dict[str, dict], **meta):
+    """
+    Write the benchmark results to a JSON file.
+    """
+    meta.setdefault("created_at", datetime.now().isoformat(timespec="seconds"))
+    meta.setdefault("python", platform.python_version())
+
+    with open(path, "w") as file:
+        json.dump({"meta": meta, "benchmarks": benchmarks}, file, indent=2)
+
+
+def load_results(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare(
+    baseline: dict, current: dict, threshold: float = 0.1
+) -> t.List[t.Tuple[str, str, float, float]]:
+    """
+    Compare two results documents.
+
+    :param threshold: Allowed relative increase (0.1 = 10%) before a metric
+    counts as a regression.
+
+    :return: A list of `(benchmark, metric, baseline, current)` regressions.
+    """
+    regressions = []
+
+    for name, base in baseline["benchmarks"].items():
+        result = current["benchmarks"].get(name)
+
+        if not result:
+            continue
+
+        for metric in COMPARED_METRICS:
+            if metric not in base or metric not in result:
+                continue
+
+            if result[metric] > base[metric] * (1 + threshold):
+                regressions.append((name, metric, base[metric], result[metric]))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare with a baseline.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    regressions = compare(
+        load_results(args.baseline), load_results(args.current), args.threshold
+    )
+
+    for name, metric, base, result in regressions:
+        print(
+            "REGRESSION %s.%s: %.3f -> %.3f (+%.1f%%)"
+            % (name, metric, base, result, (result / base - 1) * 100)
+        )
+
+    if regressions:
+        sys.exit(1)
+
+    print("No regressions above %.0f%%." % (args.threshold * 100))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Session bytes per request and serialization time, signed-cookie sessions
+against the server-side filesystem and Redis stores.
+
+The serialization part encodes a representative session (theme and locale
+preferences, Flask-Login keys, an authlib OAuth state and a flash message).
+The request part logs in and browses `/home`, counting the session bytes
+the browser sends (`Cookie`) and receives (`Set-Cookie`) on every request.
+
+Usage:
+    python -m benchmarks.session_store --requests 200 --redis-url redis://localhost:6379/15
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from datetime import datetime, timedelta
+
+
+def get_sample_session() -> dict:
+    """
+    Returns session data as stored after a Google login attempt.
+    """
+    from markupsafe import Markup
+
+    from accounts.utils import get_unique_id
+
+    return {
+        "_theme_preference": "pulse",
+        "_lang_preference": "en",
+        "_user_id": get_unique_id(),
+        "_fresh": True,
+        "_id": hashlib.sha512(b"127.0.0.1|Mozilla/5.0").hexdigest(),
+        "_state_google_%s"
+        % get_unique_id().replace("-", ""): {
+            "data": {
+                "redirect_uri": "http://localhost:5000/account/google-login/callback",
+                "nonce": get_unique_id(),
+                "url": "https://accounts.google.com/o/oauth2/v2/auth?response_type=code",
+            },
+            "exp": (datetime.now() + timedelta(hours=1)).timestamp(),
+        },
+        "_flashes": [("success", Markup("You are logged in successfully."))],
+    }
+
+
+def time_call(func, iterations: int) -> float:
+    """
+    Returns the mean duration of `func` in microseconds.
+    """
+    samples = []
+
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+
+    return statistics.fmean(samples) * 1_000_000
+
+
+def run_serialization(app, iterations: int) -> dict:
+    """
+    Encode and decode the sample session with both serializers.
+    """
+    from flask.sessions import SecureCookieSessionInterface
+
+    from accounts.sessions import MsgpackSerializer
+
+    payload = get_sample_session()
+    results = {}
+
+    with app.test_request_context():
+        cookie = SecureCookieSessionInterface().get_signing_serializer(app)
+        msgpack = MsgpackSerializer()
+
+        for name, serializer in (("signed-cookie", cookie), ("msgpack", msgpack)):
+            encoded = serializer.dumps(payload)
+            assert serializer.loads(encoded) == payload
+
+            results[name] = {
+                "bytes": len(encoded),
+                "dumps_us": time_call(lambda: serializer.dumps(payload), iterations),
+                "loads_us": time_call(lambda: serializer.loads(encoded), iterations),
+            }
+
+    return results
+
+
+def run_requests(app, backend, requests: int, credentials: dict) -> dict:
+    """
+    Log in and browse with the given session backend (`None` for cookies).
+    """
+    from flask.sessions import SecureCookieSessionInterface
+
+    from accounts.sessions import ServerSideSessionInterface
+
+    if backend is None:
+        app.session_interface = SecureCookieSessionInterface()
+    else:
+        app.session_interface = ServerSideSessionInterface(backend)
+
+    cookie_name = app.config["SESSION_COOKIE_NAME"]
+    client = app.test_client()
+    sent, received, durations = [], [], []
+
+    def request(method, path, **kwargs):
+        cookie = client.get_cookie(cookie_name)
+        sent.append(len(cookie_name) + 1 + len(cookie.value) if cookie else 0)
+
+        started = time.perf_counter()
+        response = client.open(path, method=method, **kwargs)
+        durations.append(time.perf_counter() - started)
+
+        received.append(
+            sum(
+                len(value)
+                for value in response.headers.getlist("Set-Cookie")
+                if value.startswith(cookie_name + "=")
+            )
+        )
+        return response
+
+    request("POST", "/login", data=credentials)
+
+    for _ in range(requests):
+        request("GET", "/home")
+
+    request("GET", "/logout")
+
+    return {
+        "cookie_bytes_per_request": statistics.fmean(sent),
+        "set_cookie_bytes_per_request": statistics.fmean(received),
+        "set_cookie_responses": sum(1 for size in received if size),
+        "mean_ms": statistics.fmean(durations) * 1000,
+    }
+
+
+def main():
+    import config as conf
+
+    from accounts import create_app
+    from accounts.extensions import database as db
+    from accounts.models import User
+    from accounts.sessions import FileSystemSessionBackend, RedisSessionBackend
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=10_000)
+    parser.add_argument("--redis-url", default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="flaskauth-bench-")
+
+    conf.testing.SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(
+        workdir, "bench.sqlite3"
+    )
+    conf.testing.RATELIMIT_ENABLED = False
+
+    app = create_app("testing")
+    credentials = {"username": "benchuser", "password": "Bench@1234", "remember": "y"}
+
+    with app.app_context():
+        db.create_all()
+        User.create(
+            username=credentials["username"],
+            first_name="Bench",
+            last_name="User",
+            email="benchuser@example.com",
+            password=credentials["password"],
+            active=True,
+        )
+
+    try:
+        print("Serialization of a representative session:")
+
+        for name, result in run_serialization(app, args.iterations).items():
+            print(
+                "  {:<14} {:>5} bytes  dumps {:>7.2f} us  loads {:>7.2f} us".format(
+                    name, result["bytes"], result["dumps_us"], result["loads_us"]
+                )
+            )
+
+        backends = [
+            ("signed-cookie", None),
+            ("filesystem", FileSystemSessionBackend(os.path.join(workdir, "sessions"))),
+        ]
+
+        if args.redis_url:
+            backends.append(("redis", RedisSessionBackend(args.redis_url)))
+
+        print("\nLogin and %d requests to /home:" % args.requests)
+
+        for name, backend in backends:
+            result = run_requests(app, backend, args.requests, credentials)
+            print(
+                "  {:<14} Cookie {:>6.1f} B/req  Set-Cookie {:>6.1f} B/req "
+                "({:>4} responses)  {:>6.2f} ms/req".format(
+                    name,
+                    result["cookie_bytes_per_request"],
+                    result["set_cookie_bytes_per_request"],
+                    result["set_cookie_responses"],
+                    result["mean_ms"],
+                )
+            )
+    finally:
+        # Write the buffered audit events before the database goes away.
+        if "audit_log" in app.extensions:
+            app.extensions["audit_log"].close()
+
+        with app.app_context():
+            db.engine.dispose()
+
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
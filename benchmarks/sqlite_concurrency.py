@@ -0,0 +1,143 @@
+"""
+Concurrent `/login` throughput against a file-based SQLite database,
+with the default pragmas and with the high-concurrency engine profile.
+
+Login threads post valid credentials to `/login` and log out again, while
+writer threads keep updating user rows to reproduce the lock contention
+seen during local load tests.
+
+Usage:
+    python -m benchmarks.sqlite_concurrency --threads 8 --writers 2 --duration 10
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from datetime import datetime
+
+
+def run(enabled: bool, threads: int, writers: int, duration: float) -> dict:
+    """
+    Run the workload once and return the collected counters.
+    """
+    import config as conf
+
+    from sqlalchemy import update
+
+    from accounts import create_app
+    from accounts.extensions import database as db
+    from accounts.models import User
+
+    workdir = tempfile.mkdtemp(prefix="flaskauth-bench-")
+
+    conf.testing.SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(
+        workdir, "bench.sqlite3"
+    )
+    conf.testing.SQLITE_HIGH_CONCURRENCY = enabled
+    conf.testing.RATELIMIT_ENABLED = False
+
+    app = create_app("testing")
+    app.config["PROPAGATE_EXCEPTIONS"] = False
+
+    with app.app_context():
+        db.create_all()
+        User.create(
+            username="benchuser",
+            first_name="Bench",
+            last_name="User",
+            email="benchuser@example.com",
+            password="Bench@1234",
+            active=True,
+        )
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    counters = {"logins": 0, "login_errors": 0, "writes": 0, "write_errors": 0}
+
+    def count(key: str):
+        with lock:
+            counters[key] += 1
+
+    def login_worker():
+        client = app.test_client()
+        credentials = {
+            "username": "benchuser",
+            "password": "Bench@1234",
+            "remember": "y",
+        }
+
+        while not stop.is_set():
+            response = client.post("/login", data=credentials)
+
+            if response.status_code == 302 and "/login" not in response.location:
+                count("logins")
+            else:
+                count("login_errors")
+
+            client.get("/logout")
+
+    def write_worker():
+        with app.app_context():
+            while not stop.is_set():
+                try:
+                    db.session.execute(
+                        update(User)
+                        .where(User.username == "benchuser")
+                        .values(updated_at=datetime.now())
+                    )
+                    db.session.commit()
+                    count("writes")
+                except Exception:
+                    db.session.rollback()
+                    count("write_errors")
+
+    workers = [threading.Thread(target=login_worker) for _ in range(threads)]
+    workers += [threading.Thread(target=write_worker) for _ in range(writers)]
+
+    started = time.perf_counter()
+
+    for worker in workers:
+        worker.start()
+
+    time.sleep(duration)
+    stop.set()
+
+    for worker in workers:
+        worker.join()
+
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        db.engine.dispose()
+
+    counters["elapsed"] = elapsed
+    counters["logins_per_second"] = counters["logins"] / elapsed
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    for label, enabled in (("default", False), ("high-concurrency", True)):
+        result = run(enabled, args.threads, args.writers, args.duration)
+        print(
+            "{:<17} logins/s: {:>8.1f}  login errors: {:>5}  "
+            "writes: {:>6}  write errors: {:>5}".format(
+                label,
+                result["logins_per_second"],
+                result["login_errors"],
+                result["writes"],
+                result["write_errors"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
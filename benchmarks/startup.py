@@ -0,0 +1,135 @@
+"""
+Startup cost of a `flask` command with the web setup deferred or not.
+
+Each run starts a new Python process, runs `flask createtestuser` through
+the Flask CLI group and times the import of `config`, the application
+factory and the whole command, with the web setup (OAuth, mail, rate
+limiter, views...) run by the factory and deferred by the core commands.
+
+Usage:
+    python -m benchmarks.startup --runs 5
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Modules only needed by the web setup.
+WEB_MODULES = ("authlib", "httpx", "requests", "accounts.views")
+
+
+def run_worker(database_url: str, defer_setup: bool):
+    """
+    Runs inside the child process and prints the timings as JSON.
+    """
+    started = time.perf_counter()
+
+    import config as conf
+
+    timings = {"import config": (time.perf_counter() - started) * 1000}
+
+    from flask.cli import FlaskGroup
+
+    from accounts import create_app
+
+    conf.testing.SQLALCHEMY_DATABASE_URI = database_url
+    conf.testing.AUDIT_BACKEND = ""
+    conf.testing.ACTIVITY_TRACKING = False
+
+    def factory():
+        factory_started = time.perf_counter()
+        app = create_app("testing", defer_setup=defer_setup)
+        timings["create_app"] = (time.perf_counter() - factory_started) * 1000
+        return app
+
+    cli = FlaskGroup(create_app=factory, load_dotenv=False)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        cli.main(["createtestuser"], standalone_mode=False)
+
+    timings["flask createtestuser"] = (time.perf_counter() - started) * 1000
+    timings["web modules loaded"] = sum(name in sys.modules for name in WEB_MODULES)
+
+    print(json.dumps(timings))
+
+
+def spawn(database_url: str, defer_setup: bool) -> dict:
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.startup",
+        "--worker",
+        "--database-url",
+        database_url,
+    ]
+
+    if defer_setup:
+        command.append("--defer-setup")
+
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--defer-setup", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args.database_url, args.defer_setup)
+
+    workdir = tempfile.mkdtemp(prefix="flaskauth-bench-")
+    database_url = args.database_url or "sqlite:///" + os.path.join(
+        workdir, "bench.sqlite3"
+    )
+
+    try:
+        import config as conf
+
+        from accounts import create_app
+        from accounts.extensions import database as db
+
+        conf.testing.SQLALCHEMY_DATABASE_URI = database_url
+        conf.testing.AUDIT_BACKEND = ""
+        conf.testing.ACTIVITY_TRACKING = False
+        app = create_app("testing")
+
+        with app.app_context():
+            db.create_all()
+            db.engine.dispose()
+
+        results = {
+            "web setup": [spawn(database_url, False) for _ in range(args.runs)],
+            "deferred": [spawn(database_url, True) for _ in range(args.runs)],
+        }
+
+        print("{:<24}{:>14}{:>14}".format("(median ms)", *results))
+
+        for key in results["web setup"][0]:
+            print(
+                "{:<24}{:>14.1f}{:>14.1f}".format(
+                    key,
+                    *(
+                        statistics.median(run[key] for run in runs)
+                        for runs in results.values()
+                    ),
+                )
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import io
+import os
+import itertools
+
+from flask import Flask
+
+
+def login(client, username: str, password: str):
+    return client.post(
+        "/login", data={"username": username, "password": password, "remember": "y"}
+    )
+
+
+def test_login_valid(bench, bench_app: Flask, bench_users):
+    client = bench_app.test_client()
+    username = bench_users["active"]["username"]
+
+    def run():
+        response = login(client, username, bench_users["password"])
+        assert response.location.endswith("/home")
+
+    bench(run, teardown=lambda: client.get("/logout"))
+
+
+def test_login_invalid(bench, bench_app: Flask, bench_users):
+    client = bench_app.test_client()
+    username = bench_users["active"]["username"]
+
+    def run():
+        response = login(client, username, "Wrong@1234")
+        assert response.location.endswith("/login")
+
+    bench(run)
+
+
+def test_login_inactive(bench, bench_app: Flask, bench_users):
+    client = bench_app.test_client()
+    username = bench_users["inactive"]["username"]
+
+    def run():
+        response = login(client, username, bench_users["password"])
+        assert response.location.endswith("/login")
+
+    bench(run)
+
+
+def test_register(bench, bench_app: Flask):
+    client = bench_app.test_client()
+    counter = itertools.count()
+
+    def setup():
+        n = next(counter)
+        return (
+            {
+                "username": "benchregister%d" % n,
+                "first_name": "Bench",
+                "last_name": "Register",
+                "email": "benchregister%d@example.com" % n,
+                "password": "Bench@1234",
+                "remember": "y",
+            },
+        )
+
+    def run(data):
+        response = client.post("/register", data=data)
+        assert response.location.endswith("/login")
+
+    bench(run, setup=setup)
+
+
+def _create_token(bench_app: Flask, salt_key: str, active: bool, counter):
+    from accounts.models import User
+
+    username = "bench%s%d" % (salt_key.split("_")[1].lower(), next(counter))
+
+    with bench_app.app_context():
+        user = User.create(
+            username=username,
+            first_name="Bench",
+            last_name="Token",
+            email="%s@example.com" % username,
+            password="Bench@1234",
+            active=active,
+        )
+        return (user.generate_token(salt=bench_app.config[salt_key]),)
+
+
+def test_confirm_account(bench, bench_app: Flask):
+    client = bench_app.test_client()
+    counter = itertools.count()
+
+    def run(token):
+        response = client.post("/account/confirm", query_string={"token": token})
+        assert response.location.endswith("/home")
+
+    bench(
+        run,
+        setup=lambda: _create_token(bench_app, "SALT_ACCOUNT_CONFIRM", False, counter),
+        teardown=lambda: client.get("/logout"),
+    )
+
+
+def test_reset_password(bench, bench_app: Flask):
+    client = bench_app.test_client()
+    counter = itertools.count()
+    data = {
+        "password": "Reset@1234",
+        "confirm_password": "Reset@1234",
+        "remember": "y",
+    }
+
+    def run(token):
+        response = client.post(
+            "/password/reset", query_string={"token": token}, data=data
+        )
+        assert response.location.endswith("/login")
+
+    bench(
+        run,
+        setup=lambda: _create_token(bench_app, "SALT_RESET_PASSWORD", True, counter),
+    )
+
+
+def test_profile_avatar_upload(bench, bench_app: Flask, bench_users):
+    from accounts.models import User
+
+    client = bench_app.test_client()
+    login(client, bench_users["active"]["username"], bench_users["password"])
+
+    avatar_path = os.path.join(
+        bench_app.static_folder, "assets", "images", "default_avatar.png"
+    )
+
+    with open(avatar_path, "rb") as file:
+        avatar = file.read()
+
+    def setup():
+        return (
+            {
+                "username": bench_users["active"]["username"],
+                "first_name": "Bench",
+                "last_name": "Active",
+                "about": "Benchmark profile.",
+                "profile_image": (io.BytesIO(avatar), "avatar.png"),
+            },
+        )
+
+    def run(data):
+        response = client.post(
+            "/profile", data=data, content_type="multipart/form-data"
+        )
+        assert response.location.endswith("/home")
+
+    bench(run, setup=setup)
+
+    # Remove the last uploaded avatar from the static folder.
+    with bench_app.app_context():
+        profile = User.get_user_by_id(bench_users["active"]["id"]).profile
+
+        if profile.avatar:
+            os.remove(bench_app.root_path + profile.avatar)
+
+
+def test_user_loader(bench, bench_app: Flask, bench_users):
+    from accounts.extensions import database as db, login_manager
+
+    user_id = bench_users["active"]["id"]
+
+    with bench_app.app_context():
+        # A fresh session per iteration, like a new request.
+        bench(
+            lambda: login_manager._user_callback(user_id),
+            setup=db.session.remove,
+        )
+
+
+def test_profile_read(bench, bench_app: Flask, bench_users):
+    client = bench_app.test_client()
+    login(client, bench_users["active"]["username"], bench_users["password"])
+
+    def run():
+        assert client.get("/profile").status_code == 200
+
+    bench(run)
+
+
+def api_login(client, username: str, password: str):
+    return client.post(
+        "/api/auth/login", json={"username": username, "password": password}
+    )
+
+
+def test_api_login(bench, bench_app: Flask, bench_users):
+    client = bench_app.test_client()
+    username = bench_users["active"]["username"]
+
+    def run():
+        response = api_login(client, username, bench_users["password"])
+        assert response.status_code == 200
+
+    bench(run)
+
+
+def test_api_profile_read(bench, bench_app: Flask, bench_users):
+    client = bench_app.test_client()
+    response = api_login(
+        client, bench_users["active"]["username"], bench_users["password"]
+    )
+    headers = {"Authorization": "Bearer %s" % response.json["access_token"]}
+
+    def run():
+        assert client.get("/api/profile", headers=headers).status_code == 200
+
+    bench(run)
@@ -0,0 +1,14 @@
+import os
+
+from accounts.startup import profile_startup
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_startup(bench):
+    # A new worker: interpreter, imports and `create_app` of every step.
+    profiles = []
+
+    bench(lambda: profiles.append(profile_startup("testing", cwd=PROJECT_DIR)))
+
+    assert profiles[-1]["steps"]
@@ -12,6 +12,9 @@ UPLOAD_FOLDER = os.path.join(MEDIA_ROOT, "uploads")
 # Load environment variables from .env file
 load_dotenv(os.path.join(BASE_DIR, ".env"), override=True)
 
+# Primary key type for the models: `string` (uuid4 text) or `uuid7` (time-ordered).
+PRIMARY_KEY_TYPE = os.getenv("PRIMARY_KEY_TYPE", "string").lower()
+
 
 class BaseConfig:
     # Application configuration.
@@ -56,35 +59,226 @@ class BaseConfig:
     GOOGLE_DISCOVERY_URL = os.getenv("GOOGLE_DISCOVERY_URL", None)
     GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI", None)
     GOOGLE_SCOPE = os.getenv("GOOGLE_SCOPE", "email profile")
+    GOOGLE_CALLBACK_TIMEOUT = float(
+        os.getenv("GOOGLE_CALLBACK_TIMEOUT", "10")
+    )  # seconds
+
+    # Shared async HTTP client used by the async views for outbound calls.
+    ASYNC_HTTP_TIMEOUT = float(os.getenv("ASYNC_HTTP_TIMEOUT", "5"))  # seconds
+    ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", "20"))
+
+    # Audit log of the authentication events: `database` (the `audit_event`
+    # table), `file` (rotating JSONL) or empty to disable it.
+    AUDIT_BACKEND = os.getenv("AUDIT_BACKEND", "database")
+    AUDIT_FILE_PATH = os.getenv(
+        "AUDIT_FILE_PATH", os.path.join(BASE_DIR, "instance", "audit", "audit.jsonl")
+    )
+    AUDIT_FILE_MAX_BYTES = int(os.getenv("AUDIT_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+    AUDIT_FILE_BACKUPS = int(os.getenv("AUDIT_FILE_BACKUPS", "5"))
+
+    # Events are buffered in memory and written in batches, by size or time.
+    AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+    AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "100"))
+    AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1"))  # seconds
+    AUDIT_OVERFLOW = os.getenv("AUDIT_OVERFLOW", "drop-oldest")
+    AUDIT_BLOCK_TIMEOUT = float(os.getenv("AUDIT_BLOCK_TIMEOUT", "0.1"))  # seconds
+
+    # Last login/activity tracking: the activity of a user is written at most
+    # once per write interval per worker, by a flush every flush interval.
+    ACTIVITY_TRACKING = os.getenv("ACTIVITY_TRACKING", "True").lower() in ("true", "1")
+    ACTIVITY_WRITE_INTERVAL = float(os.getenv("ACTIVITY_WRITE_INTERVAL", "300"))
+    ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "10"))
+
+    # `/readyz` probe: comma separated checks (database, migrations, smtp,
+    # redis), seconds their result is cached and timeout of the network checks.
+    READYZ_CHECKS = os.getenv("READYZ_CHECKS", "database,migrations")
+    READYZ_CACHE_TTL = float(os.getenv("READYZ_CACHE_TTL", "5"))  # seconds
+    READYZ_TIMEOUT = float(os.getenv("READYZ_TIMEOUT", "2"))  # seconds
+
+    # Opt-in sampling profiler of the requests, installed when `PROFILER_DIR`
+    # is set: a fraction of the requests is sampled every interval and the
+    # profiles over the threshold are kept (`flask profiler` at runtime). The
+    # rate defaults to every request when a threshold is set, 1% otherwise.
+    PROFILER_DIR = os.getenv("PROFILER_DIR", None)
+    PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "False").lower() in ("true", "1")
+    PROFILER_SAMPLE_RATE = os.getenv("PROFILER_SAMPLE_RATE", None)
+    PROFILER_THRESHOLD_MS = float(os.getenv("PROFILER_THRESHOLD_MS", "0"))
+    PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+    PROFILER_FORMAT = os.getenv("PROFILER_FORMAT", "collapsed")
+    PROFILER_MAX_FILES = int(os.getenv("PROFILER_MAX_FILES", "200"))
+
+    # `flask reap-accounts`: age of the unconfirmed accounts deleted, batch size.
+    REAP_UNCONFIRMED_DAYS = int(os.getenv("REAP_UNCONFIRMED_DAYS", "7"))
+    REAP_BATCH_SIZE = int(os.getenv("REAP_BATCH_SIZE", "500"))
+
+    # Fingerprinted static assets written by `flask build-assets`, used when built.
+    ASSETS_FINGERPRINT = os.getenv("ASSETS_FINGERPRINT", "True").lower() in (
+        "true",
+        "1",
+    )
+    ASSETS_BUILD_DIR = os.getenv(
+        "ASSETS_BUILD_DIR", os.path.join(BASE_DIR, "instance", "assets")
+    )
+
+    # Startup warmup (templates, translations, database pool) and the on-disk
+    # cache of compiled templates shared by the workers.
+    APP_WARMUP = os.getenv("APP_WARMUP", "False").lower() in ("true", "1")
+    WARMUP_DB_CONNECTIONS = int(os.getenv("WARMUP_DB_CONNECTIONS", "1"))
+    TEMPLATE_BYTECODE_CACHE_DIR = os.getenv("TEMPLATE_BYTECODE_CACHE_DIR", None)
+
+    # Response compression (gzip, and brotli when installed) of rendered pages.
+    COMPRESS_ENABLED = os.getenv("COMPRESS_ENABLED", "True").lower() in ("true", "1")
+    COMPRESS_ALGORITHMS = os.getenv("COMPRESS_ALGORITHMS", "br,gzip").split(",")
+    COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+    COMPRESS_BR_LEVEL = int(os.getenv("COMPRESS_BR_LEVEL", "4"))
+    COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "500"))  # bytes
+    # Also compress the responses with a CSRF token or cookies (BREACH).
+    COMPRESS_SECRET_RESPONSES = os.getenv(
+        "COMPRESS_SECRET_RESPONSES", "False"
+    ).lower() in ("true", "1")
+    COMPRESS_MIMETYPES = [
+        "text/html",
+        "text/css",
+        "text/plain",
+        "text/javascript",
+        "application/javascript",
+        "application/json",
+        "image/svg+xml",
+    ]
 
     # `SQLAlchemy (ORM)` configuration.
     SQLALCHEMY_ECHO = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Per-request SQL instrumentation (`Server-Timing` header and N+1 warnings).
+    SQL_INSTRUMENTATION = os.getenv("SQL_INSTRUMENTATION", "False").lower() in (
+        "true",
+        "1",
+    )
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+
+    # Slow-query log: statements over the threshold are logged (parameters
+    # redacted) and their plan is captured once per statement fingerprint.
+    SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "False").lower() in ("true", "1")
+    SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+    SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "True").lower() in (
+        "true",
+        "1",
+    )
+    SLOW_QUERY_PLAN_CACHE = int(os.getenv("SLOW_QUERY_PLAN_CACHE", "500"))
+
+    # `Prometheus` metrics endpoint, readable with the token, or from the
+    # allowed IPs by the requests not coming through a reverse proxy.
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "False").lower() in ("true", "1")
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", None)
+    METRICS_ALLOWED_IPS = [
+        address.strip()
+        for address in os.getenv("METRICS_ALLOWED_IPS", "").split(",")
+        if address.strip()
+    ]
+
+    # Primary/foreign key storage, see `PRIMARY_KEY_TYPE` above.
+    PRIMARY_KEY_TYPE = PRIMARY_KEY_TYPE
+
+    # `SQLite` engine profile, only applied when the database URI is SQLite.
+    SQLITE_HIGH_CONCURRENCY = os.getenv("SQLITE_HIGH_CONCURRENCY", "True").lower() in (
+        "true",
+        "1",
+    )
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # milliseconds
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-64000"))  # 64MB in KiB
+    SQLITE_TRANSACTION_MODE = os.getenv("SQLITE_TRANSACTION_MODE", "IMMEDIATE")
+
     # `Redis` configuration.
     REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
     REDIS_POST = os.getenv("REDIST_PORT", "6379")
 
+    # Server-side sessions: `cookie` (signed cookie), `filesystem` or `redis`.
+    SESSION_BACKEND = os.getenv("SESSION_BACKEND", "cookie").lower()
+    SESSION_FILE_DIR = os.getenv(
+        "SESSION_FILE_DIR", os.path.join(BASE_DIR, "instance", "sessions")
+    )
+    SESSION_REDIS_URL = os.getenv(
+        "SESSION_REDIS_URL", f"redis://{REDIS_HOST}:{REDIS_POST}/1"
+    )
+    SESSION_KEY_PREFIX = os.getenv("SESSION_KEY_PREFIX", "session:")
+
+    # Session revocation: seconds a worker trusts its cached session epochs,
+    # and the Redis used to push revocations to the other workers.
+    SESSION_EPOCH_CACHE_TTL = float(os.getenv("SESSION_EPOCH_CACHE_TTL", "30"))
+    SESSION_EPOCH_PUBSUB_URL = os.getenv("SESSION_EPOCH_PUBSUB_URL", None)
+    SESSION_EPOCH_CHANNEL = os.getenv("SESSION_EPOCH_CHANNEL", "session-epochs")
+
     # `Flask-Mail` configuration.
     MAIL_SERVER = os.getenv("MAIL_SERVER", None)
     MAIL_USERNAME = os.getenv("MAIL_USERNAME", None)
     MAIL_PASSWORD = os.getenv("MAIL_PASSWORD", None)
-    MAIL_PORT = int(os.getenv("MAIL_PORT"))
+    MAIL_PORT = int(os.getenv("MAIL_PORT", "587"))
     MAIL_USE_TLS = True
     MAIL_USE_SSL = False
     MAIL_DEFAULT_SENDER = os.getenv("MAIL_DEFAULT_SENDER")
 
+    # Confirmation emails are sent by background threads, at most once per
+    # cooldown per user (the outstanding token is reused while valid).
+    MAIL_SEND_ASYNC = os.getenv("MAIL_SEND_ASYNC", "True").lower() in ("true", "1")
+    MAIL_SEND_WORKERS = int(os.getenv("MAIL_SEND_WORKERS", "2"))
+    CONFIRMATION_RESEND_COOLDOWN = float(
+        os.getenv("CONFIRMATION_RESEND_COOLDOWN", "60")
+    )  # seconds
+
+    # `flask mail-campaign`: accounts per batch, SMTP connections and the
+    # maximum emails per second of all the connections (0 for no limit).
+    MAIL_CAMPAIGN_BATCH_SIZE = int(os.getenv("MAIL_CAMPAIGN_BATCH_SIZE", "200"))
+    MAIL_CAMPAIGN_CONNECTIONS = int(os.getenv("MAIL_CAMPAIGN_CONNECTIONS", "4"))
+    MAIL_CAMPAIGN_RATE = float(os.getenv("MAIL_CAMPAIGN_RATE", "10"))
+
+    # Per-account backoff of failed logins, kept in the rate limiter storage:
+    # from the threshold, each failure locks the account for base * 2^n
+    # seconds (up to the maximum); counters reset after `AUTH_BACKOFF_RESET`.
+    AUTH_BACKOFF_ENABLED = os.getenv("AUTH_BACKOFF_ENABLED", "True").lower() in (
+        "true",
+        "1",
+    )
+    AUTH_BACKOFF_THRESHOLD = int(os.getenv("AUTH_BACKOFF_THRESHOLD", "5"))
+    AUTH_BACKOFF_BASE = float(os.getenv("AUTH_BACKOFF_BASE", "1"))  # seconds
+    AUTH_BACKOFF_MAX = float(os.getenv("AUTH_BACKOFF_MAX", "900"))  # seconds
+    AUTH_BACKOFF_RESET = float(os.getenv("AUTH_BACKOFF_RESET", "3600"))  # seconds
+
     # `Flask-Limiter` configuration.
     RATELIMIT_ENABLED = os.getenv("RATELIMIT_ENABLED", "True").lower() in ("true", "1")
     # RATELIMIT_STORAGE_URI = os.getenv("RATELIMIT_STORAGE_URI", "memory://")
     RATELIMIT_STORAGE_URI = "memory://"
 
+    # JSON API (`/api`): lifetime of the signed access tokens, verified
+    # without a database query, and of the refresh tokens, stored hashed.
+    API_ACCESS_TOKEN_LIFETIME = int(
+        os.getenv("API_ACCESS_TOKEN_LIFETIME", "900")
+    )  # seconds
+    API_REFRESH_TOKEN_LIFETIME = float(
+        os.getenv("API_REFRESH_TOKEN_LIFETIME", "30")
+    )  # days
+
+    # Rate limits of the API, per access token subject or client address
+    # (replacing the default limits), and of its credential endpoints.
+    API_RATELIMIT_DEFAULT = os.getenv("API_RATELIMIT_DEFAULT", "60 per minute")
+    API_RATELIMIT_AUTH = os.getenv("API_RATELIMIT_AUTH", "10 per minute")
+
     # Default `Salt` string for url security tokens.
     SALT_ACCOUNT_CONFIRM = os.getenv("ACCOUNT_CONFIRM_SALT", "account_confirm_salt")
     SALT_RESET_PASSWORD = os.getenv("RESET_PASSWORD_SALT", "reset_password_salt")
     SALT_CHANGE_EMAIL = os.getenv("CHANGE_EMAIL_SALT", "change_email_salt")
+    SALT_API_ACCESS_TOKEN = os.getenv("API_ACCESS_TOKEN_SALT", "api_access_token_salt")
 
-    # Default Guest User information.
+    # Guest accounts: free guests kept in the pool, the pool is topped up in
+    # the background under the minimum; a guest is recycled after its lifetime.
+    GUEST_POOL_SIZE = int(os.getenv("GUEST_POOL_SIZE", "50"))
+    GUEST_POOL_MIN = int(os.getenv("GUEST_POOL_MIN", "10"))
+    GUEST_LIFETIME_HOURS = float(os.getenv("GUEST_LIFETIME_HOURS", "24"))
+
+    # Default Test User information.
     TEST_USER_USERNAME = "testuser"
     TEST_USER_EMAIL = "testuser@example.com"
     TEST_USER_PASSWORD = "Test@1234"
@@ -106,25 +300,28 @@ class Development(BaseConfig):
 
 
 class Production(BaseConfig):
-    from sqlalchemy.engine.url import URL
-    from sqlalchemy.exc import ArgumentError, OperationalError
-
     DATABASE_URI = os.getenv("DATABASE_URI", None)
 
-    try:
-        if DATABASE_URI:
-            SQLALCHEMY_DATABASE_URI = DATABASE_URI
-        else:
-            SQLALCHEMY_DATABASE_URI = URL.create(
+    def __init__(self):
+        # Built when the production configuration is selected, not on import.
+        from sqlalchemy.engine.url import URL
+        from sqlalchemy.exc import ArgumentError
+
+        if self.DATABASE_URI:
+            self.SQLALCHEMY_DATABASE_URI = self.DATABASE_URI
+            return
+
+        try:
+            self.SQLALCHEMY_DATABASE_URI = URL.create(
                 drivername="postgresql",
                 username=os.getenv("POSTGRES_USER"),
                 password=os.getenv("POSTGRES_PASSWORD"),
                 host=os.getenv("POSTGRES_HOST"),
-                port=int(os.getenv("POSTGRES_PORT")),
+                port=int(os.getenv("POSTGRES_PORT", "5432")),
                 database=os.getenv("POSTGRES_DB"),
             )
-    except (ArgumentError, OperationalError) as e:
-        raise Exception(f"Database connection failed: {e}")
+        except (ArgumentError, ValueError) as e:
+            raise Exception(f"Database connection failed: {e}")
 
 
 class Testing(BaseConfig):
@@ -137,8 +334,32 @@ class Testing(BaseConfig):
     WTF_CSRF_ENABLED = False
 
 
-development = Development()
+# Configuration classes by type, instantiated on first use (see `__getattr__`).
+CONFIG_TYPES = {
+    "development": Development,
+    "production": Production,
+    "testing": Testing,
+}
+
+
+def get_config(config_type: str) -> BaseConfig:
+    """
+    Returns the configuration object of `config_type`, only this one is
+    evaluated.
+
+    :raises ValueError: If the configuration type is not supported.
+    """
+    if config_type not in CONFIG_TYPES:
+        raise ValueError("Invalid configuration type: '%s'" % config_type)
+
+    return globals().get(config_type) or __getattr__(config_type)
+
 
-production = Production()
+def __getattr__(name: str):
+    # `config.development`, `config.production` and `config.testing` are
+    # created on first access and then kept, so changes to them persist.
+    if name not in CONFIG_TYPES:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
-testing = Testing()
+    config = globals()[name] = CONFIG_TYPES[name]()
+    return config
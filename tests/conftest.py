@@ -0,0 +1,77 @@
+import os
+import typing as t
+
+import pytest
+
+# Password of the accounts created by the tests.
+PASSWORD = "Test@1234"
+
+
+@pytest.fixture
+def app(tmp_path):
+    """
+    Application of the `testing` config on a new SQLite database.
+    """
+    import config as conf
+
+    from accounts import create_app
+    from accounts.extensions import database as db
+    from accounts.session_epochs import session_epochs
+
+    # `send_mail` reads the sender from the environment.
+    os.environ.setdefault("MAIL_DEFAULT_SENDER", "tests@example.com")
+
+    # The rendered pages generate CSRF tokens, without `CSRF_SECRET_KEY` too.
+    conf.testing.WTF_CSRF_SECRET_KEY = conf.testing.WTF_CSRF_SECRET_KEY or "tests"
+
+    conf.testing.SQLALCHEMY_DATABASE_URI = "sqlite:///" + str(
+        tmp_path / "tests.sqlite3"
+    )
+    conf.testing.RATELIMIT_ENABLED = False
+    conf.testing.AUDIT_BACKEND = ""
+    conf.testing.SITE_URL = conf.testing.SITE_URL or "http://localhost:5000"
+
+    app = create_app("testing", defer_setup=False)
+
+    with app.app_context():
+        db.create_all()
+
+    # The epoch cache is shared by the applications of the process.
+    session_epochs.clear()
+
+    yield app
+
+    for name in ("audit_log", "activity_tracker"):
+        if name in app.extensions:
+            app.extensions[name].close()
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+    session_epochs.clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user(app) -> t.Dict[str, t.Any]:
+    """
+    An active account to log in with.
+    """
+    from accounts.models import User
+
+    with app.app_context():
+        user = User.create(
+            username="testaccount",
+            first_name="Test",
+            last_name="Account",
+            email="testaccount@example.com",
+            password=PASSWORD,
+            active=True,
+        )
+
+        return {"id": user.id, "username": user.username, "password": PASSWORD}
@@ -0,0 +1,173 @@
+import time
+
+import pytest
+
+from accounts.session_epochs import session_epochs
+from accounts.tokens import AccessTokens
+
+
+class TokenUser:
+    def __init__(self, id: str, session_epoch: int = 0):
+        self.id = id
+        self.session_epoch = session_epoch
+
+
+@pytest.fixture
+def access_tokens():
+    session_epochs.clear()
+    yield AccessTokens("secret", salt="tests", lifetime=900)
+    session_epochs.clear()
+
+
+def api_login(client, user) -> dict:
+    response = client.post(
+        "/api/auth/login",
+        json={"username": user["username"], "password": user["password"]},
+    )
+    assert response.status_code == 200
+    return response.json
+
+
+def bearer(tokens: dict) -> dict:
+    return {"Authorization": "Bearer %s" % tokens["access_token"]}
+
+
+def refresh(client, tokens: dict):
+    return client.post(
+        "/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]}
+    )
+
+
+def revoke_sessions(app, user):
+    from accounts.models import User
+
+    with app.app_context():
+        User.get_user_by_id(user["id"]).revoke_sessions()
+
+
+def test_access_token_round_trip(access_tokens):
+    token = access_tokens.issue(TokenUser("abc", 2))
+
+    assert access_tokens.verify(token) == {"sub": "abc", "epoch": 2}
+
+
+def test_access_token_with_another_key(access_tokens):
+    token = AccessTokens("other", salt="tests").issue(TokenUser("abc"))
+
+    assert access_tokens.verify(token) is None
+    assert access_tokens.verify("") is None
+
+
+def test_access_token_expires(access_tokens, monkeypatch):
+    token = access_tokens.issue(TokenUser("abc"))
+    now = time.time()
+
+    monkeypatch.setattr(time, "time", lambda: now + 901)
+
+    assert access_tokens.verify(token) is None
+
+
+def test_access_token_rejected_after_an_epoch_bump(access_tokens):
+    token = access_tokens.issue(TokenUser("abc", 0))
+
+    session_epochs.set("abc", 1)
+
+    assert access_tokens.verify(token) is None
+    assert access_tokens.verify(access_tokens.issue(TokenUser("abc", 1)))
+
+
+def test_access_token_reads_the_profile(client, user):
+    tokens = api_login(client, user)
+
+    response = client.get("/api/profile", headers=bearer(tokens))
+
+    assert response.status_code == 200
+    assert response.json["user"]["username"] == user["username"]
+
+
+def test_access_token_rejected_after_revoke_sessions(app, client, user):
+    tokens = api_login(client, user)
+    revoke_sessions(app, user)
+
+    response = client.get("/api/profile", headers=bearer(tokens))
+
+    assert response.status_code == 401
+    assert response.json["error"] == "invalid_token"
+
+
+def test_access_token_rejected_without_cache(app, client, user):
+    tokens = api_login(client, user)
+    revoke_sessions(app, user)
+
+    # Another worker, whose cache has not seen the bump, reads the database.
+    session_epochs.clear()
+
+    assert client.get("/api/profile", headers=bearer(tokens)).status_code == 401
+
+
+def test_refresh_token_is_single_use(client, user):
+    tokens = api_login(client, user)
+
+    response = refresh(client, tokens)
+    assert response.status_code == 200
+    assert response.json["refresh_token"] != tokens["refresh_token"]
+
+    response = refresh(client, tokens)
+    assert response.status_code == 401
+    assert response.json["error"] == "invalid_grant"
+
+
+def test_refresh_token_reuse_revokes_every_token(client, user):
+    tokens = api_login(client, user)
+    other_device = api_login(client, user)
+    refreshed = refresh(client, tokens).json
+
+    # The first token is presented again.
+    assert refresh(client, tokens).status_code == 401
+
+    assert refresh(client, refreshed).status_code == 401
+    assert refresh(client, other_device).status_code == 401
+
+
+def test_refresh_token_rejected_after_revoke_sessions(app, client, user):
+    tokens = api_login(client, user)
+    revoke_sessions(app, user)
+
+    assert refresh(client, tokens).status_code == 401
+
+
+def test_logout_revokes_the_refresh_token(client, user):
+    tokens = api_login(client, user)
+
+    response = client.post(
+        "/api/auth/logout", json={"refresh_token": tokens["refresh_token"]}
+    )
+
+    assert response.status_code == 204
+    assert refresh(client, tokens).status_code == 401
+
+
+def test_test_user_profile_is_read_only(app, client):
+    from accounts.models import User
+
+    credentials = {
+        "username": app.config["TEST_USER_USERNAME"],
+        "password": app.config["TEST_USER_PASSWORD"],
+    }
+
+    with app.app_context():
+        User.create(
+            first_name="Test",
+            last_name="User",
+            email=app.config["TEST_USER_EMAIL"],
+            active=True,
+            **credentials,
+        )
+
+    tokens = api_login(client, credentials)
+    response = client.patch(
+        "/api/profile", json={"username": "renamed"}, headers=bearer(tokens)
+    )
+
+    assert response.status_code == 403
+    assert response.json["error"] == "read_only"
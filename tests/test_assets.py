@@ -0,0 +1,48 @@
+import pytest
+
+from accounts.assets import AssetBuilder
+
+
+@pytest.fixture
+def assets_app(app, tmp_path, monkeypatch):
+    """
+    Application serving the static files built in a temporary directory.
+    """
+    import config as conf
+
+    from accounts import create_app
+
+    builder = AssetBuilder(app, str(tmp_path))
+    builder.collect_static()
+    builder.build()
+
+    monkeypatch.setattr(conf.testing, "ASSETS_BUILD_DIR", str(tmp_path))
+    monkeypatch.setattr(conf.testing, "ASSETS_FINGERPRINT", True)
+
+    assets_app = create_app("testing", defer_setup=False)
+    yield assets_app
+
+    for name in ("audit_log", "activity_tracker"):
+        if name in assets_app.extensions:
+            assets_app.extensions[name].close()
+
+
+def test_fingerprinted_asset_is_cacheable(assets_app):
+    client = assets_app.test_client()
+
+    # A visitor with a session cookie.
+    client.get("/login")
+
+    with assets_app.test_request_context():
+        from flask import url_for
+
+        url = url_for("static", filename="css/style.css")
+
+    assert url != "/static/css/style.css"
+
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert "immutable" in response.headers["Cache-Control"]
+    assert "Set-Cookie" not in response.headers
+    assert "Cookie" not in response.vary
@@ -0,0 +1,129 @@
+import typing as t
+
+import pytest
+
+from accounts.audit import AuditLog
+
+
+class MemorySink:
+    """
+    Keeps the written events, or fails while `failing` is set.
+    """
+
+    def __init__(self):
+        self.events: t.List[dict] = []
+        self.failing = False
+
+    def write(self, events: t.List[dict]):
+        if self.failing:
+            raise OSError("sink unavailable")
+
+        self.events.extend(events)
+
+
+@pytest.fixture
+def sink():
+    return MemorySink()
+
+
+def make_audit_log(sink, **options) -> AuditLog:
+    # Nothing is written in the background before `flush` or `close`.
+    options.setdefault("batch_size", 100)
+    options.setdefault("flush_interval", 60)
+    return AuditLog(sink, **options)
+
+
+def written(sink) -> t.List[int]:
+    return [event["data"]["n"] for event in sink.events]
+
+
+def test_invalid_overflow_policy(sink):
+    with pytest.raises(ValueError):
+        AuditLog(sink, overflow="drop-all")
+
+
+def test_drop_oldest_keeps_the_newest_events(sink):
+    audit_log = make_audit_log(sink, queue_size=3, overflow="drop-oldest")
+
+    assert all(audit_log.record("login", n=n) for n in range(5))
+    assert audit_log.pending == 3
+    assert audit_log.dropped == 2
+
+    audit_log.close()
+    assert written(sink) == [2, 3, 4]
+
+
+def test_drop_new_keeps_the_oldest_events(sink):
+    audit_log = make_audit_log(sink, queue_size=3, overflow="drop-new")
+
+    results = [audit_log.record("login", n=n) for n in range(5)]
+
+    assert results == [True, True, True, False, False]
+    assert audit_log.dropped == 2
+
+    audit_log.close()
+    assert written(sink) == [0, 1, 2]
+
+
+def test_block_drops_the_event_after_the_timeout(sink):
+    # The queue never drains: the batch size is never reached.
+    audit_log = make_audit_log(sink, queue_size=2, overflow="block", block_timeout=0.01)
+
+    assert audit_log.record("login", n=0)
+    assert audit_log.record("login", n=1)
+    assert not audit_log.record("login", n=2)
+    assert audit_log.dropped == 1
+
+    audit_log.close()
+    assert written(sink) == [0, 1]
+
+
+def test_block_waits_for_the_writer(sink):
+    # A full queue reaches the batch size and wakes the writer up.
+    audit_log = make_audit_log(
+        sink, queue_size=2, batch_size=2, overflow="block", block_timeout=5
+    )
+
+    assert all(audit_log.record("login", n=n) for n in range(5))
+    assert audit_log.dropped == 0
+
+    audit_log.close()
+    assert written(sink) == [0, 1, 2, 3, 4]
+
+
+def test_failed_write_keeps_the_events(sink):
+    audit_log = make_audit_log(sink, queue_size=10)
+
+    for n in range(3):
+        audit_log.record("login", n=n)
+
+    sink.failing = True
+    assert audit_log.flush() == 0
+    assert audit_log.pending == 3
+
+    sink.failing = False
+    assert audit_log.flush() == 3
+    assert written(sink) == [0, 1, 2]
+
+    audit_log.close()
+
+
+def test_failed_write_drops_past_the_queue_size(sink):
+    audit_log = make_audit_log(sink, queue_size=3)
+
+    for n in range(3):
+        audit_log.record("login", n=n)
+
+    def write(events):
+        # A new event takes some of the room of the batch being written.
+        audit_log.record("login", n=3)
+        raise OSError("sink unavailable")
+
+    sink.write = write
+    assert audit_log.flush() == 0
+    assert audit_log.pending == 3
+    assert audit_log.dropped == 1
+
+    del sink.write
+    audit_log.close()
+    assert written(sink) == [0, 1, 3]
@@ -0,0 +1,153 @@
+import time
+
+import pytest
+
+from limits.storage import MemoryStorage
+
+from accounts.backoff import LoginBackoff, authenticate, login_backoff
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Drives the lockouts and the expiry of the storage keys.
+    clock = Clock()
+    monkeypatch.setattr(time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def backoff(clock):
+    backoff = LoginBackoff(threshold=3, base=2, maximum=30, reset=600)
+    backoff.storage = MemoryStorage()
+    return backoff
+
+
+def test_disabled_without_storage():
+    backoff = LoginBackoff(threshold=1)
+
+    assert backoff.record_failure("alice") == 0
+    assert backoff.get_retry_after("alice") == 0
+
+
+def test_delay_doubles_from_the_threshold(backoff):
+    delays = [backoff.get_delay(failures) for failures in range(8)]
+
+    assert delays == [0, 0, 0, 2, 4, 8, 16, 30]
+    assert backoff.get_delay(1000) == 30
+
+
+def test_lockout_from_the_threshold(backoff):
+    assert [backoff.record_failure("alice") for _ in range(3)] == [0, 0, 2]
+    assert backoff.get_retry_after("alice") == 2
+
+
+def test_lockout_ends_after_its_delay(backoff, clock):
+    for _ in range(3):
+        backoff.record_failure("alice")
+
+    clock.advance(2)
+    assert backoff.get_retry_after("alice") == 0
+
+    # The next failure locks twice as long.
+    assert backoff.record_failure("alice") == 4
+    assert backoff.get_retry_after("alice") == 4
+
+    clock.advance(3)
+    assert backoff.get_retry_after("alice") == 1
+
+    clock.advance(1)
+    assert backoff.get_retry_after("alice") == 0
+
+
+def test_identifiers_are_normalized(backoff):
+    for _ in range(3):
+        backoff.record_failure(" Alice ")
+
+    assert backoff.get_retry_after("alice") == 2
+    assert backoff.get_retry_after("bob") == 0
+
+
+def test_failures_forgotten_after_the_reset_window(backoff, clock):
+    backoff.record_failure("alice")
+    backoff.record_failure("alice")
+
+    clock.advance(601)
+
+    assert backoff.record_failure("alice") == 0
+    assert backoff.get_retry_after("alice") == 0
+
+
+def test_failures_extend_the_reset_window(backoff, clock):
+    backoff.record_failure("alice")
+    clock.advance(400)
+    backoff.record_failure("alice")
+    clock.advance(400)
+
+    assert backoff.record_failure("alice") == 2
+
+
+def test_reset_clears_failures_and_lockout(backoff):
+    for _ in range(3):
+        backoff.record_failure("alice")
+
+    backoff.reset("alice")
+
+    assert backoff.get_retry_after("alice") == 0
+    assert backoff.record_failure("alice") == 0
+
+
+def test_authenticate_locks_every_identifier(app, user, clock, monkeypatch):
+    monkeypatch.setattr(login_backoff, "threshold", 2)
+
+    with app.app_context():
+        for _ in range(2):
+            assert authenticate(user["username"], "Wrong@1234") == (None, 0)
+
+        # The lockout also applies through the email, even with the password.
+        user_found, retry_after = authenticate(
+            "testaccount@example.com", user["password"]
+        )
+
+        assert user_found is None
+        assert retry_after == 1
+
+        clock.advance(1)
+        user_found, retry_after = authenticate(user["username"], user["password"])
+
+        assert user_found is not None and retry_after == 0
+
+
+def test_authenticate_resets_after_a_success(app, user, monkeypatch):
+    monkeypatch.setattr(login_backoff, "threshold", 2)
+
+    with app.app_context():
+        authenticate(user["username"], "Wrong@1234")
+        authenticate(user["username"], user["password"])
+
+        assert authenticate(user["username"], "Wrong@1234") == (None, 0)
+        assert login_backoff.get_retry_after(user["username"]) == 0
+
+
+def test_login_view_reports_the_lockout(app, client, user, monkeypatch):
+    monkeypatch.setattr(login_backoff, "threshold", 1)
+    monkeypatch.setattr(login_backoff, "base", 60)
+
+    form = {"username": user["username"], "password": "Wrong@1234", "remember": "y"}
+    client.post("/login", data=form)
+
+    form["password"] = user["password"]
+    response = client.post("/login", data=form, follow_redirects=True)
+
+    assert b"Too many failed login attempts" in response.data
+    assert b"60 seconds" in response.data
@@ -0,0 +1,32 @@
+from sqlalchemy import select
+
+from accounts.campaign import Checkpoint, MailCampaign
+from accounts.guests import GuestPool
+
+
+def test_campaign_skips_the_guests(app, user, tmp_path):
+    from accounts.extensions import database as db
+    from accounts.models import UserSecurityToken
+
+    with app.app_context():
+        engine = db.engine
+
+    GuestPool(app, engine).create(3)
+    app.config["MAIL_DEFAULT_SENDER"] = "tests@example.com"
+
+    checkpoint = Checkpoint(str(tmp_path / "campaign.json"), {"kind": "reset"})
+    campaign = MailCampaign(
+        app, engine, "reset-password", checkpoint, echo=lambda message: None
+    )
+
+    assert campaign.count() == 1
+
+    with app.app_context():
+        campaign.run()
+
+    with engine.connect() as connection:
+        user_ids = connection.execute(
+            select(UserSecurityToken.__table__.c.user_id)
+        ).scalars()
+
+        assert set(user_ids) == {user["id"]}
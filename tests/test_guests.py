@@ -0,0 +1,219 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from accounts.guests import GuestPool
+from accounts.session_epochs import session_epochs
+
+
+@pytest.fixture
+def pool(app, monkeypatch):
+    from accounts.extensions import database as db
+
+    with app.app_context():
+        pool = GuestPool(app, db.engine, size=5, minimum=2, batch_size=2)
+
+    # The maintenance runs in the tests themselves, not in the background.
+    monkeypatch.setattr(pool, "schedule_maintenance", lambda force=False: None)
+    return pool
+
+
+def get_user(app, user_id):
+    from accounts.models import User
+
+    with app.app_context():
+        return User.get_user_by_id(user_id)
+
+
+def expire(app, guest_id, hours: float = 25):
+    from accounts.extensions import database as db
+    from accounts.models import User
+
+    with app.app_context():
+        guest = User.get_user_by_id(guest_id)
+        guest.guest_claimed_at = datetime.now() - timedelta(hours=hours)
+        db.session.commit()
+
+
+def test_refill_tops_the_pool_up(pool):
+    assert pool.refill() == 5
+    assert pool.count() == 5
+
+    # Not under the minimum anymore.
+    assert pool.refill() == 0
+
+
+def test_refill_under_the_minimum(pool):
+    pool.create(1)
+
+    assert pool.refill() == 4
+    assert pool.count() == 5
+
+
+def test_claim_hands_out_distinct_guests(app, pool):
+    pool.refill()
+
+    guest_ids = {pool.claim() for _ in range(3)}
+
+    assert len(guest_ids) == 3
+    assert pool.count() == 2
+
+    for guest_id in guest_ids:
+        guest = get_user(app, guest_id)
+        assert guest.is_guest and guest.guest_claimed_at is not None
+
+
+def test_claim_creates_a_guest_when_the_pool_is_empty(app, pool):
+    guest_id = pool.claim()
+
+    assert get_user(app, guest_id).guest_claimed_at is not None
+    assert pool.count() == 0
+
+
+def test_claim_schedules_the_maintenance_from_the_cached_count(app, monkeypatch):
+    import threading
+
+    from accounts.extensions import database as db
+
+    with app.app_context():
+        pool = GuestPool(app, db.engine, size=3, minimum=2)
+
+    pool.maintain()
+    maintained = threading.Event()
+
+    def count(limit=None):
+        raise AssertionError("Counted the free guests on a claim")
+
+    monkeypatch.setattr(pool, "count", count)
+    monkeypatch.setattr(pool, "maintain", maintained.set)
+
+    # 2 free guests left, not under the minimum.
+    pool.claim()
+    assert not maintained.is_set()
+
+    pool.claim()
+    assert maintained.wait(5)
+
+
+def test_recycle_wipes_the_expired_guests(app, pool):
+    from accounts.extensions import database as db
+
+    guest_id = pool.claim()
+
+    with app.app_context():
+        guest = get_user(app, guest_id)
+        username = guest.username
+        guest.profile.bio = "Visited"
+        db.session.commit()
+
+    expire(app, guest_id)
+
+    assert pool.recycle() == 1
+
+    guest = get_user(app, guest_id)
+
+    assert guest.username != username
+    assert guest.guest_claimed_at is None
+    assert guest.session_epoch == 1
+    assert session_epochs.get(guest_id) == 1
+
+    with app.app_context():
+        assert get_user(app, guest_id).profile.bio == ""
+
+    # Back in the pool.
+    assert pool.count() == 1
+
+
+def test_recycle_keeps_the_recent_guests(app, pool):
+    guest_id = pool.claim()
+    expire(app, guest_id, hours=1)
+
+    assert pool.recycle() == 0
+    assert get_user(app, guest_id).guest_claimed_at is not None
+
+
+def test_maintain_recycles_every_batch(app, pool):
+    guest_ids = [pool.claim() for _ in range(3)]
+
+    for guest_id in guest_ids:
+        expire(app, guest_id)
+
+    # Recycled in batches of two; the 3 recycled guests need no top-up.
+    assert pool.maintain() == (3, 0)
+    assert pool.count() == 3
+
+
+def test_recycled_guest_is_logged_out(app, client):
+    client.post("/login_as_guest")
+    assert client.get("/home").status_code == 200
+
+    with client.session_transaction() as session:
+        guest_id = session["_user_id"].split(":")[0]
+
+    expire(app, guest_id)
+    app.extensions["guest_pool"].recycle()
+
+    assert client.get("/home").status_code == 302
+
+
+def test_guest_can_edit_its_profile(app, client):
+    client.post("/login_as_guest")
+
+    response = client.post(
+        "/profile",
+        data={
+            "username": "guestvisitor",
+            "first_name": "Guest",
+            "last_name": "Visitor",
+        },
+    )
+
+    assert response.location.endswith("/home")
+
+    with client.session_transaction() as session:
+        guest_id = session["_user_id"].split(":")[0]
+
+    assert get_user(app, guest_id).username == "guestvisitor"
+
+
+def test_guest_is_read_only_elsewhere(client):
+    client.post("/login_as_guest")
+
+    response = client.post("/change/password", follow_redirects=True)
+
+    assert b"Guest user limited to read-only access." in response.data
+
+
+def test_test_user_is_read_only(app, client):
+    from accounts.models import User
+
+    with app.app_context():
+        User.create(
+            username=app.config["TEST_USER_USERNAME"],
+            first_name="Test",
+            last_name="User",
+            email=app.config["TEST_USER_EMAIL"],
+            password=app.config["TEST_USER_PASSWORD"],
+            active=True,
+        )
+
+    client.post(
+        "/login",
+        data={
+            "username": app.config["TEST_USER_USERNAME"],
+            "password": app.config["TEST_USER_PASSWORD"],
+            "remember": "y",
+        },
+    )
+
+    for path in ("/profile", "/change/password"):
+        response = client.post(
+            path,
+            data={"username": "renamed", "first_name": "Test", "last_name": "User"},
+            follow_redirects=True,
+        )
+
+        assert b"Guest user limited to read-only access." in response.data
+
+    with app.app_context():
+        assert User.get_user_by_username(app.config["TEST_USER_USERNAME"])
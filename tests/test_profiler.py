@@ -0,0 +1,42 @@
+import time
+
+from accounts.profiler import (
+    ProfilerControl,
+    ProfilerMiddleware,
+    ProfilerSettings,
+    SamplingProfiler,
+)
+
+
+def test_rate_defaults_to_every_request_with_a_threshold():
+    assert ProfilerSettings().rate == 0.01
+    assert ProfilerSettings(threshold_ms=500).rate == 1.0
+    assert ProfilerSettings(sample_rate=0.1, threshold_ms=500).rate == 0.1
+
+
+def test_slow_request_is_profiled_with_a_threshold(app, tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), interval=0.001)
+    control = ProfilerControl(
+        str(tmp_path / "control.json"),
+        ProfilerSettings(enabled=True, threshold_ms=30),
+    )
+
+    def wsgi_app(environ, start_response):
+        time.sleep(float(environ["QUERY_STRING"]))
+        start_response("200 OK", [])
+        return [b""]
+
+    middleware = ProfilerMiddleware(wsgi_app, app, profiler, control)
+
+    for duration in ("0", "0.1"):
+        environ = {"QUERY_STRING": duration, "PATH_INFO": "/", "SERVER_NAME": "x"}
+        environ.update({"REQUEST_METHOD": "GET", "wsgi.url_scheme": "http"})
+        middleware(environ, lambda status, headers, exc_info=None: None)
+
+    deadline = time.monotonic() + 5
+
+    while not profiler.files() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # Only the slow request is kept.
+    assert len(profiler.files()) == 1
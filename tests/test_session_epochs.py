@@ -0,0 +1,100 @@
+from accounts.session_epochs import (
+    SessionEpochCache,
+    get_session_token,
+    session_epochs,
+    split_session_token,
+)
+
+
+def login(client, user):
+    response = client.post(
+        "/login",
+        data={
+            "username": user["username"],
+            "password": user["password"],
+            "remember": "y",
+        },
+    )
+    assert response.location.endswith("/home")
+
+
+def revoke_sessions(app, user):
+    from accounts.models import User
+
+    with app.app_context():
+        User.get_user_by_id(user["id"]).revoke_sessions()
+
+
+def test_session_token_round_trip():
+    assert split_session_token(get_session_token("abc", 3)) == ("abc", 3)
+
+
+def test_session_token_without_epoch():
+    # Ids issued before the epochs existed count as epoch 0.
+    assert split_session_token("abc") == ("abc", 0)
+
+
+def test_cache_keeps_the_newest_epoch():
+    cache = SessionEpochCache(ttl=30)
+    cache.set("abc", 2)
+    cache.set("abc", 1)
+
+    assert cache.get("abc") == 2
+
+
+def test_cache_entries_expire():
+    cache = SessionEpochCache(ttl=-1)
+    cache.set("abc", 1)
+
+    assert cache.get("abc") is None
+
+
+def test_revoke_sessions_logs_out_every_device(app, user):
+    first, second = app.test_client(), app.test_client()
+    login(first, user)
+    login(second, user)
+
+    revoke_sessions(app, user)
+
+    for client in (first, second):
+        response = client.get("/home")
+        assert response.status_code == 302
+        assert "/login" in response.location
+
+
+def test_revoke_sessions_rejects_the_remember_cookie(app, client, user):
+    login(client, user)
+    revoke_sessions(app, user)
+
+    # Without the session, the remember cookie alone is stale too.
+    with client.session_transaction() as session:
+        session.clear()
+
+    response = client.get("/home")
+    assert response.status_code == 302
+    assert "/login" in response.location
+
+
+def test_revoke_sessions_updates_the_cache(app, user):
+    revoke_sessions(app, user)
+
+    assert session_epochs.get(user["id"]) == 1
+
+
+def test_login_after_revoke_sessions(app, client, user):
+    login(client, user)
+    revoke_sessions(app, user)
+    login(client, user)
+
+    assert client.get("/home").status_code == 200
+
+
+def test_stale_session_rejected_without_cache(app, client, user):
+    login(client, user)
+    revoke_sessions(app, user)
+
+    # Another worker, whose cache has not seen the bump, reads the database.
+    session_epochs.clear()
+
+    response = client.get("/home")
+    assert response.status_code == 302
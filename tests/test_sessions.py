@@ -0,0 +1,17 @@
+from accounts.sessions import ServerSideSession
+
+
+def test_loading_a_session_does_not_access_it():
+    session = ServerSideSession({"_user_id": "abc:0"}, sid="sid")
+
+    assert session.user_id == "abc:0"
+    assert not session.accessed
+    assert not session.modified
+
+
+def test_reading_a_session_accesses_it():
+    session = ServerSideSession({"_user_id": "abc:0"}, sid="sid")
+    session.get("_user_id")
+
+    assert session.accessed
+    assert not session.modified